@@ -1,3 +1,3 @@
-from app.api.deps import get_db
+from app.api.deps import get_async_db, get_async_read_db, get_db, get_read_db
 
-__all__ = ["get_db"]
+__all__ = ["get_db", "get_async_db", "get_read_db", "get_async_read_db"]
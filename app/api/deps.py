@@ -1,11 +1,36 @@
-from typing import Generator
-from fastapi import Depends
+from typing import AsyncGenerator, Generator
+from fastapi import Depends, Request
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db.routing import db_router, parse_end_time
+from app.db.session import AsyncSessionLocal, SessionLocal
 
 def get_db() -> Generator:
     try:
         db = SessionLocal()
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close() 
+
+async def get_async_db() -> AsyncGenerator:
+    if AsyncSessionLocal is None:
+        raise RuntimeError("asyncpg 未安装，无法创建异步数据库会话")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _routing_params(request: Request):
+    """从请求中取出品种和结束时间，用于选择只读副本"""
+    symbol = request.path_params.get("symbol") or request.query_params.get("symbol")
+    return symbol, parse_end_time(request.query_params.get("end_time"))
+
+def get_read_db(request: Request) -> Generator:
+    """只读会话：按数据水位线路由到副本，副本落后时使用主库"""
+    db = db_router.read_session(*_routing_params(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request) -> AsyncGenerator:
+    """只读异步会话：按数据水位线路由到副本，副本落后时使用主库"""
+    async with db_router.async_read_session(*_routing_params(request)) as db:
+        yield db
@@ -1,8 +1,10 @@
+import numpy as np
 from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
-from app.api.deps import get_db
+from app.api.deps import get_async_read_db
 from app.services.kline_aggregator import kline_aggregator
 from app.services.chan_adapter import chan_adapter
 from app.core.exceptions import create_success_response
@@ -42,10 +44,10 @@ def get_chan_module_info():
 
 
 @router.get("/analyze")
-def analyze_chan_theory(
+async def analyze_chan_theory(
         timeframe: str = Query("1h", description="时间周期"),
         limit: int = Query(200, ge=50, le=500, description="分析的K线数量"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     缠论技术分析 - 使用集成的Chan模块
@@ -69,17 +71,18 @@ def analyze_chan_theory(
             app_logger.warning("⚠️ Chan模块不可用，使用简化分析")
 
         # 获取K线数据
-        klines = kline_aggregator.aggregate_klines(
+        klines = await kline_aggregator.aggregate_klines_async(
             db=db,
             timeframe=timeframe,
-            limit=limit
+            limit=limit,
+            as_string=False  # 分析只需要浮点数，跳过字符串格式化
         )
 
         if not klines:
             raise HTTPException(status_code=404, detail="没有找到K线数据，请先调用 /api/v1/simple/fetch-data 获取数据")
 
-        # 使用Chan模块进行分析
-        analysis_result = chan_adapter.analyze_klines(klines)
+        # 使用Chan模块进行分析（CPU密集，放到线程池执行，不阻塞事件循环）
+        analysis_result = await run_in_threadpool(chan_adapter.analyze_klines, klines, timeframe=timeframe)
 
         # 统计分析结果
         fenxings_count = len(analysis_result.get('fenxings', []))
@@ -125,11 +128,12 @@ def analyze_chan_theory(
 
 
 @router.get("/chart-data")
-def get_chart_data(
+async def get_chart_data(
         timeframe: str = Query("1h", description="时间周期"),
         limit: int = Query(100, ge=20, le=300, description="图表数据量"),
         include_analysis: bool = Query(True, description="是否包含分析结果"),
-        db: Session = Depends(get_db)
+        format: str = Query("rows", description="K线格式: rows([timestamp, o, h, l, c] 数组) / columnar(每个字段一个数组)"),
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     获取图表数据 - 包含K线和缠论分析，适合前端图表显示
@@ -139,65 +143,60 @@ def get_chart_data(
     - 缠论分型标记点
     - 笔的连线数据
     - 买卖点标记
+
+    format=columnar 时 chart_data 为列式数据（共享时间戳数组，数值为浮点/整数）
     """
     try:
+        if format not in ("rows", "columnar"):
+            raise HTTPException(status_code=400, detail=f"不支持的返回格式: {format}，支持: rows, columnar")
+
         # 获取K线数据
-        klines = kline_aggregator.aggregate_klines(
+        columns = await kline_aggregator.aggregate_kline_columns_async(
             db=db,
             timeframe=timeframe,
             limit=limit
         )
 
-        if not klines:
+        if len(columns) == 0:
             raise HTTPException(status_code=404, detail="没有找到K线数据")
 
-        # 准备图表数据格式 - 适配前端图表库
-        chart_data = {
-            "klines": [],  # [timestamp, open, high, low, close]
-            "volume": [],  # [timestamp, volume]
-            "timestamps": []  # 时间标签数组
-        }
-
-        for kline in klines:
-            # K线数据 - 标准OHLC格式
-            chart_data["klines"].append([
-                kline["timestamp"],
-                float(kline["open_price"]),
-                float(kline["high_price"]),
-                float(kline["low_price"]),
-                float(kline["close_price"])
-            ])
-
-            # 成交量数据
-            chart_data["volume"].append([
-                kline["timestamp"],
-                float(kline["volume"])
-            ])
-
-            # 时间标签
-            chart_data["timestamps"].append(kline["timestamp"])
+        if format == "columnar":
+            chart_data = columns.to_columnar_dict()
+        else:
+            # 准备图表数据格式 - 适配前端图表库，直接由浮点数组构建
+            timestamps = columns.timestamp.tolist()
+            ohlc = [np.round(getattr(columns, name), 8).tolist() for name in ('open', 'high', 'low', 'close')]
+            chart_data = {
+                "klines": list(map(list, zip(timestamps, *ohlc))),  # [timestamp, open, high, low, close]
+                "volume": list(map(list, zip(timestamps, np.round(columns.volume, 8).tolist()))),  # [timestamp, volume]
+                "timestamps": timestamps  # 时间标签数组
+            }
 
+        first_kline, last_kline = columns.take([0, -1]).to_dict_list()
         result = {
             "chart_data": chart_data,
             "metadata": {
                 "timeframe": timeframe,
-                "data_count": len(klines),
+                "format": format,
+                "data_count": len(columns),
                 "price_range": {
-                    "high": max(float(k["high_price"]) for k in klines),
-                    "low": min(float(k["low_price"]) for k in klines)
+                    "high": float(columns.high.max()),
+                    "low": float(columns.low.min())
                 },
                 "time_range": {
-                    "start": klines[0]["open_time"],
-                    "end": klines[-1]["close_time"]
+                    "start": first_kline["open_time"],
+                    "end": last_kline["close_time"]
                 }
             }
         }
 
         # 如果需要包含分析结果
-        if include_analysis and len(klines) >= 20:
+        if include_analysis and len(columns) >= 20:
             app_logger.info("📊 执行缠论分析并添加图表标记")
 
-            analysis = chan_adapter.analyze_klines(klines)
+            klines = columns.to_dict_list(as_string=False)
+
+            analysis = await run_in_threadpool(chan_adapter.analyze_klines, klines, timeframe=timeframe)
             if "error" not in analysis:
                 result["analysis"] = analysis
 
@@ -262,17 +261,18 @@ def get_chart_data(
 
 
 @router.get("/summary")
-def get_analysis_summary(
+async def get_analysis_summary(
         timeframe: str = Query("1h", description="时间周期"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取简化的分析摘要 - 适合快速查看市场状态"""
     try:
         # 获取最近100根K线进行快速分析
-        klines = kline_aggregator.aggregate_klines(
+        klines = await kline_aggregator.aggregate_klines_async(
             db=db,
             timeframe=timeframe,
-            limit=100
+            limit=100,
+            as_string=False  # 分析只需要浮点数，跳过字符串格式化
         )
 
         if not klines:
@@ -282,7 +282,7 @@ def get_analysis_summary(
                 "recommendation": "请先调用 /api/v1/simple/fetch-data 获取数据"
             })
 
-        analysis = chan_adapter.analyze_klines(klines)
+        analysis = await run_in_threadpool(chan_adapter.analyze_klines, klines, timeframe=timeframe)
 
         if "error" in analysis:
             return create_success_response(data={
@@ -343,19 +343,19 @@ def get_analysis_summary(
 
 
 @router.get("/fenxings")
-def get_fenxings_only(
+async def get_fenxings_only(
         timeframe: str = Query("1h", description="时间周期"),
         limit: int = Query(200, ge=50, le=500, description="分析的K线数量"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     """仅获取分型识别结果 - 轻量级分析接口"""
     try:
-        klines = kline_aggregator.aggregate_klines(db=db, timeframe=timeframe, limit=limit)
+        klines = await kline_aggregator.aggregate_klines_async(db=db, timeframe=timeframe, limit=limit, as_string=False)
 
         if not klines:
             raise HTTPException(status_code=404, detail="没有找到K线数据")
 
-        analysis = chan_adapter.analyze_klines(klines)
+        analysis = await run_in_threadpool(chan_adapter.analyze_klines, klines, timeframe=timeframe)
         fenxings = analysis.get("fenxings", [])
 
         # 分类分型
@@ -5,12 +5,17 @@
 """
 
 from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, Any
 
-from app.api.deps import get_db
+from app.api.deps import get_async_read_db, get_read_db
 from app.services.kline_aggregator import kline_aggregator
 from app.services.chan_strategy import analyze_with_chan_strategy
+from app.services.chan_incremental import chan_incremental
+from app.services.chan_multi_level import chan_multi_level
+from app.services.kline_stream import kline_stream
 from app.core.exceptions import create_success_response
 from app.core.logger import app_logger
 
@@ -18,11 +23,11 @@ router = APIRouter()
 
 
 @router.get("/analyze")
-def chan_strategy_analysis(
+async def chan_strategy_analysis(
     timeframe: str = Query("1h", description="时间周期 (1m,5m,15m,30m,1h,4h,1d)"),
     limit: int = Query(200, ge=50, le=500, description="分析的K线数量"),
     symbol: str = Query("btc_usdt", description="交易品种"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     缠论策略分析 - 多级别联立分析生成交易信号
@@ -51,10 +56,11 @@ def chan_strategy_analysis(
         app_logger.info(f"🎯 缠论策略分析 - {symbol} {timeframe} 数据量: {limit}")
         
         # 获取K线数据
-        klines = kline_aggregator.aggregate_klines(
+        klines = await kline_aggregator.aggregate_klines_async(
             db=db,
             timeframe=timeframe,
-            limit=limit
+            limit=limit,
+            as_string=False  # 分析只需要浮点数，跳过字符串格式化
         )
         
         if not klines:
@@ -63,8 +69,9 @@ def chan_strategy_analysis(
                 detail="没有找到K线数据，请先调用 /api/v1/simple/fetch-data 获取数据"
             )
         
-        # 执行缠论策略分析
-        strategy_result = analyze_with_chan_strategy(
+        # 执行缠论策略分析（CPU密集，放到线程池执行，不阻塞事件循环）
+        strategy_result = await run_in_threadpool(
+            analyze_with_chan_strategy,
             klines=klines,
             timeframe=timeframe,
             symbol=symbol.upper().replace("_", "/")  # 转换为标准格式
@@ -142,12 +149,104 @@ def chan_strategy_analysis(
         raise HTTPException(status_code=500, detail="策略分析服务暂时不可用")
 
 
+@router.get("/live")
+async def chan_strategy_live(
+    timeframe: str = Query("1h", description="时间周期 (1m,5m,15m,30m,1h,4h,1d)"),
+    limit: int = Query(200, ge=50, le=500, description="首次创建分析器时预热的K线数量"),
+    symbol: str = Query("btc_usdt", description="交易品种"),
+    include_history: bool = Query(False, description="是否返回保留的分型、笔和交易信号"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    缠论增量分析 - 返回（品种, 周期）增量分析器的当前状态
+
+    首次请求时用最近 limit 根K线预热分析器；之后由K线实时流逐根更新，
+    实时流未在本进程运行时，从数据库读取最新K线补齐分析器之后的部分。
+    """
+    try:
+        analyzer = chan_incremental.get(symbol, timeframe)
+        if analyzer is None or not kline_stream.connected:
+            klines = await kline_aggregator.aggregate_klines_async(
+                db=db,
+                timeframe=timeframe,
+                symbol=symbol,
+                limit=limit,
+                as_string=False
+            )
+            if analyzer is None:
+                if not klines:
+                    raise HTTPException(
+                        status_code=404,
+                        detail="没有找到K线数据，请先调用 /api/v1/simple/fetch-data 获取数据"
+                    )
+                analyzer = chan_incremental.get_or_create(symbol, timeframe, warmup_klines=klines)
+            else:
+                last_timestamp = analyzer.last_timestamp or 0
+                for kline in klines:
+                    if kline['timestamp'] >= last_timestamp:
+                        analyzer.on_bar(kline)
+
+        if include_history:
+            data = analyzer.get_analysis()
+        else:
+            data = {'state': analyzer.get_state()}
+        data['stream_connected'] = kline_stream.connected
+        return create_success_response(data=data)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        app_logger.error(f"❌ 缠论增量分析失败: {str(e)}")
+        raise HTTPException(status_code=500, detail="策略分析服务暂时不可用")
+
+
+@router.get("/multi-level")
+async def chan_strategy_multi_level(
+    timeframes: str = Query("30m,1h,4h", description="参与联立的时间周期，逗号分隔（最粗为大级别，最细为小级别）"),
+    limit: int = Query(200, ge=50, le=1000, description="每个周期的K线数量"),
+    symbol: str = Query("btc_usdt", description="交易品种"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    缠论多级别联立分析
+
+    一次聚合得到全部周期的K线；已缓存的周期直接复用结果，其余周期在常驻 worker 进程中并行分析
+    （K线经共享内存传给 worker，worker 保留预热的 chan.py 实例），
+    再按 大级别定方向 -> 中级别找机会 -> 小级别定入场 组合为联立信号。
+    """
+    try:
+        levels = [tf.strip() for tf in timeframes.split(",") if tf.strip()]
+        if not levels:
+            raise HTTPException(status_code=400, detail="至少需要一个时间周期")
+
+        app_logger.info(f"🎯 缠论多级别联立分析 - {symbol} {levels} 数据量: {limit}")
+        result = await chan_multi_level.analyze_multi_level_async(
+            db, symbol=symbol, timeframes=levels, limit=limit
+        )
+        if not result['metadata']['timeframes']:
+            raise HTTPException(
+                status_code=404,
+                detail="没有找到K线数据，请先调用 /api/v1/simple/fetch-data 获取数据"
+            )
+        return create_success_response(data=result)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        app_logger.error(f"❌ 缠论多级别联立分析失败: {str(e)}")
+        raise HTTPException(status_code=500, detail="策略分析服务暂时不可用")
+
+
 @router.get("/signals/history")
 def get_strategy_signals_history(
     timeframe: str = Query("1h", description="时间周期"),
     days: int = Query(7, ge=1, le=30, description="历史天数"),
     signal_type: Optional[str] = Query(None, description="信号类型过滤"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取缠论策略历史信号
@@ -171,7 +270,8 @@ def get_strategy_signals_history(
         klines = kline_aggregator.aggregate_klines(
             db=db,
             timeframe=timeframe,
-            limit=limit
+            limit=limit,
+            as_string=False  # 分析只需要浮点数，跳过字符串格式化
         )
         
         if not klines:
@@ -194,7 +294,7 @@ def get_strategy_signals_history(
             batch_klines = klines[max(0, i-analysis_window):i+1]
             
             if len(batch_klines) >= analysis_window:
-                result = analyze_with_chan_strategy(batch_klines, timeframe)
+                result = analyze_with_chan_strategy(batch_klines, timeframe, use_cache=False)
                 batch_signals = result.get('signals', [])
                 
                 # 只保留最新的信号（避免重复）
@@ -242,7 +342,7 @@ def chan_strategy_backtest(
     timeframe: str = Query("1h", description="时间周期"),
     days: int = Query(30, ge=7, le=90, description="回测天数"),
     initial_capital: float = Query(10000, ge=1000, description="初始资金"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     缠论策略回测分析
@@ -266,7 +366,8 @@ def chan_strategy_backtest(
         klines = kline_aggregator.aggregate_klines(
             db=db,
             timeframe=timeframe,
-            limit=limit
+            limit=limit,
+            as_string=False  # 分析只需要浮点数，跳过字符串格式化
         )
         
         if len(klines) < 100:
@@ -346,7 +447,7 @@ def _run_strategy_backtest(klines: list, timeframe: str, initial_capital: float)
             window_klines = klines[i-analysis_window:i]
             
             if len(window_klines) >= analysis_window:
-                result = analyze_with_chan_strategy(window_klines, timeframe)
+                result = analyze_with_chan_strategy(window_klines, timeframe, use_cache=False)
                 signals = result.get('signals', [])
                 
                 if signals:
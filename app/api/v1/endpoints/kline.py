@@ -1,6 +1,6 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from app import crud
 from app.api import deps
@@ -13,33 +13,54 @@ from app.core.exceptions import (
     create_success_response,
     AppException
 )
-from app.db.session import get_db
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# 键集分页的续页令牌响应头
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 @router.get("/{symbol}/")
-def read_kline(
+async def read_kline(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_read_db),
     symbol: str,
-    skip: int = Query(0, ge=0, description="跳过的记录数"),
+    skip: int = Query(0, ge=0, description="跳过的记录数（深分页请使用 cursor）"),
     limit: int = Query(100, ge=1, le=1000, description="返回的记录数限制"),
+    cursor: Optional[str] = Query(None, description="续页令牌，取自上一页响应头 X-Next-Cursor"),
 ):
-    """获取K线数据列表"""
-    app_logger.debug(f"Fetching kline data for symbol: {symbol}, skip: {skip}, limit: {limit}")
+    """
+    获取K线数据列表
+
+    按 (open_time, id) 键集分页：下一页的令牌通过响应头 X-Next-Cursor 返回，
+    没有更多数据时不返回该响应头。skip 仅为兼容保留，会按偏移量扫描。
+    """
+    app_logger.debug(f"Fetching kline data for symbol: {symbol}, skip: {skip}, limit: {limit}, cursor: {cursor}")
     if symbol not in SYMBOL_TO_MODEL:
         app_logger.error(f"Unsupported symbol: {symbol}")
         raise InvalidParameterException(f"不支持的交易品种: {symbol}")
-    kline = crud.kline.get_multi(db=db, symbol=symbol, skip=skip, limit=limit)
+    if skip:
+        if cursor:
+            raise InvalidParameterException("skip 与 cursor 不能同时使用")
+        kline = await crud.kline.get_multi_async(db=db, symbol=symbol, skip=skip, limit=limit)
+        app_logger.debug(f"Successfully fetched {len(kline)} kline records")
+        return create_success_response(data=kline)
+
+    try:
+        kline, next_cursor = await crud.kline.get_page_async(db=db, symbol=symbol, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise InvalidParameterException(str(e))
     app_logger.debug(f"Successfully fetched {len(kline)} kline records")
-    return create_success_response(data=kline)
+    response = create_success_response(data=kline)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
 
 @router.get("/{symbol}/{kline_id}")
-def read_kline_by_id(
+async def read_kline_by_id(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_read_db),
     symbol: str,
     kline_id: int,
 ):
@@ -48,7 +69,7 @@ def read_kline_by_id(
     if symbol not in SYMBOL_TO_MODEL:
         app_logger.error(f"Unsupported symbol: {symbol}")
         raise InvalidParameterException(f"不支持的交易品种: {symbol}")
-    kline = crud.kline.get(db=db, symbol=symbol, id=kline_id)
+    kline = await crud.kline.get_async(db=db, symbol=symbol, id=kline_id)
     if not kline:
         app_logger.warning(f"Kline data not found for symbol: {symbol}, kline_id: {kline_id}")
         raise ResourceNotFoundException("K线数据不存在")
@@ -56,9 +77,9 @@ def read_kline_by_id(
     return create_success_response(data=kline)
 
 @router.get("/{symbol}/timestamp/{timestamp}")
-def read_kline_by_timestamp(
+async def read_kline_by_timestamp(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_read_db),
     symbol: str,
     timestamp: int,
 ):
@@ -67,7 +88,7 @@ def read_kline_by_timestamp(
     if symbol not in SYMBOL_TO_MODEL:
         app_logger.error(f"Unsupported symbol: {symbol}")
         raise InvalidParameterException(f"不支持的交易品种: {symbol}")
-    kline = crud.kline.get_by_timestamp(db=db, symbol=symbol, timestamp=timestamp)
+    kline = await crud.kline.get_by_timestamp_async(db=db, symbol=symbol, timestamp=timestamp)
     if not kline:
         app_logger.warning(f"Kline data not found for symbol: {symbol}, timestamp: {timestamp}")
         raise ResourceNotFoundException("K线数据不存在")
@@ -75,9 +96,9 @@ def read_kline_by_timestamp(
     return create_success_response(data=kline)
 
 @router.get("/{symbol}/time-range/")
-def read_kline_by_time_range(
+async def read_kline_by_time_range(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_read_db),
     symbol: str,
     start_time: datetime,
     end_time: datetime,
@@ -87,34 +108,44 @@ def read_kline_by_time_range(
     if symbol not in SYMBOL_TO_MODEL:
         app_logger.error(f"Unsupported symbol: {symbol}")
         raise InvalidParameterException(f"不支持的交易品种: {symbol}")
-    kline = crud.kline.get_by_time_range(
+    kline = await crud.kline.get_by_time_range_async(
         db=db, symbol=symbol, start_time=start_time, end_time=end_time
     )
     app_logger.debug(f"Successfully fetched {len(kline)} kline records in time range")
     return create_success_response(data=kline)
 
 @router.get("/btc_usdt/", response_model=List[BtcUsdtKline])
-def get_btc_usdt_klines(
-    db: Session = Depends(deps.get_db),
-    skip: int = Query(0, ge=0, description="跳过的记录数"),
-    limit: int = Query(100, ge=1, le=1000, description="返回的记录数限制")
+async def get_btc_usdt_klines(
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    skip: int = Query(0, ge=0, description="跳过的记录数（深分页请使用 cursor）"),
+    limit: int = Query(100, ge=1, le=1000, description="返回的记录数限制"),
+    cursor: Optional[str] = Query(None, description="续页令牌，取自上一页响应头 X-Next-Cursor")
 ):
-    """获取BTC/USDT K线数据列表"""
+    """获取BTC/USDT K线数据列表（键集分页，下一页令牌见响应头 X-Next-Cursor）"""
+    if skip and cursor:
+        raise HTTPException(status_code=400, detail="skip 与 cursor 不能同时使用")
     try:
-        klines = crud.kline.get_multi(db, symbol="btc_usdt", skip=skip, limit=limit)
+        if skip:
+            return await crud.kline.get_multi_async(db, symbol="btc_usdt", skip=skip, limit=limit)
+        klines, next_cursor = await crud.kline.get_page_async(db, symbol="btc_usdt", limit=limit, cursor=cursor)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         return klines
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         app_logger.error(f"Error getting BTC/USDT klines: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/btc_usdt/{kline_id}", response_model=BtcUsdtKline)
-def get_btc_usdt_kline(
+async def get_btc_usdt_kline(
     kline_id: int,
-    db: Session = Depends(deps.get_db)
+    db: AsyncSession = Depends(deps.get_async_read_db)
 ):
     """根据ID获取BTC/USDT K线数据"""
     try:
-        kline = crud.kline.get(db, symbol="btc_usdt", id=kline_id)
+        kline = await crud.kline.get_async(db, symbol="btc_usdt", id=kline_id)
         if not kline:
             raise HTTPException(status_code=404, detail="K线数据不存在")
         return kline
@@ -123,13 +154,13 @@ def get_btc_usdt_kline(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/btc_usdt/timestamp/{timestamp}", response_model=BtcUsdtKline)
-def get_btc_usdt_kline_by_timestamp(
+async def get_btc_usdt_kline_by_timestamp(
     timestamp: int,
-    db: Session = Depends(deps.get_db)
+    db: AsyncSession = Depends(deps.get_async_read_db)
 ):
     """根据时间戳获取BTC/USDT K线数据"""
     try:
-        kline = crud.kline.get_by_timestamp(db, symbol="btc_usdt", timestamp=timestamp)
+        kline = await crud.kline.get_by_timestamp_async(db, symbol="btc_usdt", timestamp=timestamp)
         if not kline:
             raise HTTPException(status_code=404, detail="K线数据不存在")
         return kline
@@ -138,14 +169,14 @@ def get_btc_usdt_kline_by_timestamp(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/btc_usdt/range/", response_model=List[BtcUsdtKline])
-def get_btc_usdt_klines_by_range(
+async def get_btc_usdt_klines_by_range(
     start_time: datetime = Query(..., description="开始时间"),
     end_time: datetime = Query(..., description="结束时间"),
-    db: Session = Depends(deps.get_db)
+    db: AsyncSession = Depends(deps.get_async_read_db)
 ):
     """获取指定时间范围内的BTC/USDT K线数据"""
     try:
-        klines = crud.kline.get_by_time_range(
+        klines = await crud.kline.get_by_time_range_async(
             db, 
             symbol="btc_usdt",
             start_time=start_time,
@@ -157,11 +188,11 @@ def get_btc_usdt_klines_by_range(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/btc_usdt/aggregate/")
-def read_aggregated_kline(
+async def read_aggregated_kline(
     interval_minutes: int = Query(1, ge=1, le=1440),
     start_time: Optional[int] = None,
     end_time: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(deps.get_async_read_db)
 ):
     """
     获取聚合后的BTC/USDT K线数据
@@ -177,7 +208,7 @@ def read_aggregated_kline(
         start_dt = datetime.fromtimestamp(start_time / 1000)
         end_dt = datetime.fromtimestamp(end_time / 1000)
 
-        klines = crud.kline.get_kline_data(
+        klines = await crud.kline.get_kline_data_async(
             db,
             interval_minutes=interval_minutes,
             start_time=start_dt,
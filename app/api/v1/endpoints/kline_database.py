@@ -1,24 +1,31 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
-from app.api.deps import get_db
+from app.api.deps import get_async_read_db
 from app.crud.kline_dao import kline
-from app.core.exceptions import create_success_response, create_error_response
+from app.db.routing import db_router
+from app.services.kline_statistics import kline_statistics
+from app.core.exceptions import create_success_response, create_error_response, create_streaming_success_response
 from app.core.logger import app_logger
+from app.utils.kline_export import EXPORT_MEDIA_TYPES, available_export_formats
 
 router = APIRouter()
 
 
 @router.get("/klines")
-def get_database_klines(
+async def get_database_klines(
     timeframe: str = Query("1m", description="时间周期 (1m, 5m, 15m, 1h, 4h, 1d)"),
     limit: int = Query(1000, ge=1, le=5000, description="返回的K线数量"),
     symbol: str = Query("btc_usd", description="交易品种"),
     start_time: Optional[str] = Query(None, description="开始时间 (ISO格式)"),
     end_time: Optional[str] = Query(None, description="结束时间 (ISO格式)"),
-    db: Session = Depends(get_db)
+    format: str = Query("rows", description="返回格式: rows(逐条K线对象, 时间倒序) / columnar(每个字段一个数组, 时间正序)"),
+    exact: bool = Query(False, description="是否返回数据库精度的精确值（十进制字符串，仅 rows 格式）"),
+    stream: bool = Query(False, description="流式输出时间范围内的全部K线（忽略 limit，时间正序，仅 rows 格式）"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     从PostgreSQL数据库获取BTC/USDT K线数据
@@ -28,8 +35,16 @@ def get_database_klines(
     - 支持时间范围查询
     - 支持不同时间间隔聚合
     - 返回标准化的K线数据格式
+    - stream=true 时通过服务端游标分批读取并增量输出，内存占用与时间范围无关
     """
     try:
+        if format not in ("rows", "columnar"):
+            raise HTTPException(status_code=400, detail=f"不支持的返回格式: {format}，支持: rows, columnar")
+        if exact and format == "columnar":
+            raise HTTPException(status_code=400, detail="columnar 格式只支持浮点数值，精确值请使用 rows 格式")
+        if stream and (format != "rows" or exact):
+            raise HTTPException(status_code=400, detail="流式输出只支持 rows 格式的浮点数值")
+
         app_logger.info(f"📊 获取数据库K线数据 - 周期: {timeframe}, 数量: {limit}")
         
         # 转换时间周期为分钟数
@@ -63,29 +78,52 @@ def get_database_klines(
         if start_dt and end_dt and start_dt >= end_dt:
             raise HTTPException(status_code=400, detail="开始时间必须早于结束时间")
         
+        if stream:
+            return _stream_database_klines(symbol, interval, start_dt, end_dt)
+
         # 从数据库获取K线数据
-        klines_data = kline.get_kline_data(
-            db=db,
-            symbol=symbol,
-            interval_minutes=interval,
-            start_time=start_dt,
-            end_time=end_dt,
-            limit=limit
-        )
+        if exact:
+            klines_data, plan = await kline.get_exact_kline_data_with_plan_async(
+                db=db,
+                symbol=symbol,
+                interval_minutes=interval,
+                start_time=start_dt,
+                end_time=end_dt,
+                limit=limit
+            )
+            count = len(klines_data)
+        else:
+            columns, plan = await kline.get_kline_columns_with_plan_async(
+                db=db,
+                symbol=symbol,
+                interval_minutes=interval,
+                start_time=start_dt,
+                end_time=end_dt,
+                limit=limit
+            )
+            count = len(columns)
+            if format == "columnar":
+                klines_data = columns.to_columnar_dict()
+            else:
+                klines_data = columns.to_dict_list(as_string=False)
+                klines_data.reverse()  # 按时间倒序
         
-        app_logger.info(f"✅ 成功获取 {len(klines_data)} 条K线数据")
+        app_logger.info(f"✅ 成功获取 {count} 条K线数据")
         
         return create_success_response(data={
             "klines": klines_data,
             "metadata": {
                 "symbol": "BTC/USDT",
                 "interval_minutes": interval,
-                "count": len(klines_data),
+                "count": count,
+                "format": format,
+                "exact": exact,
                 "time_range": {
                     "start": start_dt.isoformat() if start_dt else None,
                     "end": end_dt.isoformat() if end_dt else None
                 },
-                "data_source": "PostgreSQL数据库"
+                "data_source": "PostgreSQL数据库",
+                "query_plan": plan.to_dict()
             }
         })
         
@@ -96,12 +134,63 @@ def get_database_klines(
         raise HTTPException(status_code=500, detail=f"获取K线数据失败: {str(e)}")
 
 
+def _stream_database_klines(
+    symbol: str,
+    interval: int,
+    start_dt: Optional[datetime],
+    end_dt: Optional[datetime]
+) -> StreamingResponse:
+    """流式输出时间范围内的全部K线，信封与 create_success_response 一致"""
+    kline.get_model(symbol)  # 提前校验品种，错误在开始输出前返回
+    count = 0
+
+    def batches():
+        nonlocal count
+        # 流式响应在请求依赖释放之后才开始发送，使用独立的只读会话
+        db = db_router.read_session(symbol, end_dt)
+        try:
+            for batch in kline.iter_kline_data(
+                db,
+                symbol=symbol,
+                interval_minutes=interval,
+                start_time=start_dt,
+                end_time=end_dt
+            ):
+                count += len(batch)
+                yield batch
+            app_logger.info(f"✅ 流式输出 {count} 条K线数据")
+        except Exception as e:
+            app_logger.error(f"❌ 流式输出K线数据失败: {str(e)}", exc_info=True)
+            raise
+        finally:
+            db.close()
+
+    return create_streaming_success_response(
+        batches(),
+        items_key="klines",
+        data={
+            "metadata": {
+                "symbol": "BTC/USDT",
+                "interval_minutes": interval,
+                "format": "rows",
+                "stream": True,
+                "time_range": {
+                    "start": start_dt.isoformat() if start_dt else None,
+                    "end": end_dt.isoformat() if end_dt else None
+                },
+                "data_source": "PostgreSQL数据库"
+            }
+        },
+        trailer=lambda: {"count": count}
+    )
+
+
 @router.get("/latest")
-def get_latest_database_klines(
+async def get_latest_database_klines(
     timeframe: str = Query("1m", description="时间周期 (1m, 5m, 15m, 1h, 4h, 1d)"),
     count: int = Query(100, ge=1, le=500, description="最新数据条数"),
     symbol: str = Query("btc_usd", description="交易品种"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     获取最新的数据库K线数据
@@ -118,7 +207,7 @@ def get_latest_database_klines(
         }.get(timeframe, 1)
         
         # 获取最新数据
-        klines_data = kline.get_kline_data(
+        klines_data = await kline.get_kline_data_async(
             db=db,
             symbol=symbol,
             interval_minutes=timeframe_minutes,
@@ -145,13 +234,13 @@ def get_latest_database_klines(
 
 
 @router.get("/chart-data")
-def get_database_chart_data(
+async def get_database_chart_data(
     timeframe: str = Query("1m", description="时间周期 (1m, 5m, 15m, 1h, 4h, 1d)"),
     limit: int = Query(500, ge=20, le=1000, description="图表数据量"),
     symbol: str = Query("btc_usd", description="交易品种"),
     start_time: Optional[str] = Query(None, description="开始时间 (ISO格式)"),
     end_time: Optional[str] = Query(None, description="结束时间 (ISO格式)"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     获取优化的图表数据格式
@@ -184,7 +273,7 @@ def get_database_chart_data(
                 raise HTTPException(status_code=400, detail="结束时间格式错误")
         
         # 获取K线数据
-        klines_data = kline.get_kline_data(
+        klines_data = await kline.get_kline_data_async(
             db=db,
             symbol=symbol,
             interval_minutes=timeframe_minutes,
@@ -214,9 +303,9 @@ def get_database_chart_data(
 
 
 @router.get("/statistics")
-def get_database_statistics(
+async def get_database_statistics(
     symbol: str = Query("btc_usd", description="交易品种"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     获取数据库K线数据统计信息
@@ -230,9 +319,10 @@ def get_database_statistics(
     try:
         app_logger.info("📊 获取数据库统计信息")
         
-        # 获取基本统计信息
-        total_count = kline.get_count(db, symbol="btc_usdt")
-        
+        # 读取内存中的统计快照，不再对整表执行 COUNT(*) 和 OFFSET 扫描
+        stats = await db.run_sync(kline_statistics.get_statistics, symbol=symbol)
+        total_count = stats.total_klines
+
         if total_count == 0:
             return create_success_response(
                 data={
@@ -241,33 +331,10 @@ def get_database_statistics(
                 },
                 message="数据库为空"
             )
-        
-        # 获取最新数据
-        latest_klines = kline.get_multi(
-            db=db,
-            symbol=symbol,
-            skip=0,
-            limit=1
-        )
-        
-        # 获取最旧数据
-        total_count = kline.get_count(db, symbol=symbol)
-        oldest_klines = kline.get_multi(
-            db=db,
-            symbol=symbol,
-            skip=max(0, total_count - 1),
-            limit=1
-        )
-        
-        latest_time = None
-        oldest_time = None
-        
-        if latest_klines:
-            latest_time = latest_klines[0].get("timestamp")
-        
-        if oldest_klines:
-            oldest_time = oldest_klines[0].get("timestamp")
-        
+
+        latest_time = stats.latest_timestamp
+        oldest_time = stats.earliest_timestamp
+
         return create_success_response(
             data={
                 "total_count": total_count,
@@ -279,7 +346,9 @@ def get_database_statistics(
                 },
                 "symbol": "BTC/USDT",
                 "data_source": "PostgreSQL Database",
-                "base_interval": "1分钟"
+                "base_interval": "1分钟",
+                "approximate_count": stats.approximate,
+                "updated_at": stats.updated_at.isoformat()
             },
             message=f"数据库包含 {total_count} 条K线数据"
         )
@@ -290,4 +359,69 @@ def get_database_statistics(
             code=1000,
             message=f"获取统计信息失败: {str(e)}",
             status_code=500
-        )
\ No newline at end of file
+        )
+
+@router.get("/export")
+def export_database_klines(
+    symbol: str = Query("btc_usdt", description="交易品种"),
+    start_time: Optional[str] = Query(None, description="开始时间 (ISO格式)，默认30天前"),
+    end_time: Optional[str] = Query(None, description="结束时间 (ISO格式)，默认当前时间"),
+    format: Optional[str] = Query(None, description="导出格式: arrow / msgpack，默认优先 arrow"),
+    batch_size: int = Query(100_000, ge=1_000, le=1_000_000, description="每批行数")
+):
+    """
+    批量导出1分钟K线（二进制流）
+
+    - arrow: Apache Arrow IPC 流，可直接用 pyarrow.ipc.open_stream 读入 pandas / Polars
+    - msgpack: 连续的 MessagePack 对象，每个对象包含一批数据的各列原始字节
+
+    数据通过服务端游标分批读取并编码，内存占用与导出范围无关。
+    """
+    formats = available_export_formats()
+    if not formats:
+        raise HTTPException(status_code=501, detail="导出需要安装 pyarrow 或 msgpack (pip install turtle-front[export])")
+
+    export_format = format or formats[0]
+    if export_format not in formats:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {export_format}，可用格式: {formats}")
+
+    try:
+        kline.get_model(symbol)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00')) if end_time else datetime.now()
+        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00')) if start_time else end_dt - timedelta(days=30)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="时间格式错误，请使用ISO格式")
+
+    if start_dt >= end_dt:
+        raise HTTPException(status_code=400, detail="开始时间必须早于结束时间")
+
+    app_logger.info(f"📦 导出K线数据 - 品种: {symbol}, 格式: {export_format}, 范围: {start_dt} 到 {end_dt}")
+
+    def stream():
+        # 流式响应在请求依赖释放之后才开始发送，使用独立的只读会话
+        db = db_router.read_session(symbol, end_dt)
+        try:
+            yield from kline.iter_export(
+                db,
+                symbol=symbol,
+                start_time=start_dt,
+                end_time=end_dt,
+                export_format=export_format,
+                batch_size=batch_size
+            )
+        except Exception as e:
+            app_logger.error(f"❌ 导出K线数据失败: {str(e)}", exc_info=True)
+            raise
+        finally:
+            db.close()
+
+    filename = f"{symbol}_{start_dt:%Y%m%d%H%M}_{end_dt:%Y%m%d%H%M}.{export_format}"
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
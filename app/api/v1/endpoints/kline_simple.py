@@ -1,10 +1,16 @@
-from typing import Optional
+import asyncio
+from typing import Dict, Optional
 from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from app.api.deps import get_db
+from app.api.deps import get_async_db, get_async_read_db
+from app.db.routing import db_router
 from app.services.kline_aggregator import kline_aggregator
+from app.services.kline_coverage import kline_coverage
+from app.services.kline_statistics import kline_statistics
+from app.services.kline_stream import kline_stream
+from app.core.config import settings
 from app.core.exceptions import create_success_response, create_error_response
 from app.core.logger import app_logger
 
@@ -35,13 +41,15 @@ def get_supported_timeframes():
 
 
 @router.get("/klines")
-def get_klines(
+async def get_klines(
         timeframe: str = Query("1h", description="时间周期"),
         limit: int = Query(200, ge=1, le=1000, description="数据条数"),
         symbol: str = Query("btc_usd", description="交易品种"),
         start_time: Optional[str] = Query(None, description="开始时间 (ISO格式)"),
         end_time: Optional[str] = Query(None, description="结束时间 (ISO格式)"),
-        db: Session = Depends(get_db)
+        format: str = Query("rows", description="返回格式: rows(逐条K线对象) / columnar(每个字段一个数组)"),
+        exact: bool = Query(False, description="是否返回数据库精度的精确值（十进制字符串，仅 rows 格式）"),
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     获取K线数据 - 支持多时间周期聚合
@@ -52,8 +60,14 @@ def get_klines(
     - 返回标准化的K线数据格式
 
     支持的时间周期: 1m, 5m, 15m, 30m, 1h, 4h, 1d
+    format=columnar 时返回列式数据，数值为浮点/整数，适合大批量K线的传输和解析
     """
     try:
+        if format not in ("rows", "columnar"):
+            raise HTTPException(status_code=400, detail=f"不支持的返回格式: {format}，支持: rows, columnar")
+        if exact and format == "columnar":
+            raise HTTPException(status_code=400, detail="columnar 格式只支持浮点数值，精确值请使用 rows 格式")
+
         # 验证时间周期
         if timeframe not in kline_aggregator.get_available_timeframes():
             raise HTTPException(
@@ -84,33 +98,52 @@ def get_klines(
         app_logger.info(f"📊 获取K线数据 - 周期: {timeframe}, 数量: {limit}")
 
         # 获取聚合K线数据
-        klines = kline_aggregator.aggregate_klines(
-            db=db,
-            timeframe=timeframe,
-            symbol=symbol,
-            start_time=start_dt,
-            end_time=end_dt,
-            limit=limit
-        )
+        if format == "columnar":
+            columns = await kline_aggregator.aggregate_kline_columns_async(
+                db=db,
+                timeframe=timeframe,
+                symbol=symbol,
+                start_time=start_dt,
+                end_time=end_dt,
+                limit=limit
+            )
+            klines = columns.to_columnar_dict()
+            count = len(columns)
+            # 只为首尾两根K线生成时间字符串
+            data_range = columns.take([0, -1]).to_dict_list() if count else []
+        else:
+            klines = await kline_aggregator.aggregate_klines_async(
+                db=db,
+                timeframe=timeframe,
+                symbol=symbol,
+                start_time=start_dt,
+                end_time=end_dt,
+                limit=limit,
+                exact=exact
+            )
+            count = len(klines)
+            data_range = klines
 
         # 获取数据统计
-        stats = kline_aggregator.get_data_statistics(db, symbol=symbol)
+        stats = await kline_aggregator.get_data_statistics_async(db, symbol=symbol)
 
-        app_logger.info(f"✅ 成功返回 {len(klines)} 条 {timeframe} K线数据")
+        app_logger.info(f"✅ 成功返回 {count} 条 {timeframe} K线数据")
 
         return create_success_response(data={
             "klines": klines,
             "metadata": {
-                "count": len(klines),
+                "count": count,
                 "timeframe": timeframe,
+                "format": format,
+                "exact": exact,
                 "request_params": {
                     "limit": limit,
                     "start_time": start_time,
                     "end_time": end_time
                 },
                 "data_range": {
-                    "start": klines[0]["open_time"] if klines else None,
-                    "end": klines[-1]["close_time"] if klines else None
+                    "start": data_range[0]["open_time"] if data_range else None,
+                    "end": data_range[-1]["close_time"] if data_range else None
                 }
             },
             "database_stats": stats
@@ -123,25 +156,77 @@ def get_klines(
         raise HTTPException(status_code=500, detail="服务器内部错误")
 
 
+@router.get("/multi-klines")
+async def get_multi_timeframe_klines(
+        timeframes: str = Query("5m,1h,1d", description="时间周期，逗号分隔"),
+        limit: int = Query(200, ge=1, le=1000, description="每个周期的数据条数"),
+        symbol: str = Query("btc_usd", description="交易品种"),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    一次请求获取多个时间周期的K线数据
+
+    只扫描一次1分钟原始数据，按 1m→5m→15m→30m→1h→4h→1d 逐级汇总生成各周期
+    """
+    try:
+        timeframe_list = [tf.strip() for tf in timeframes.split(',') if tf.strip()]
+        if not timeframe_list:
+            raise HTTPException(status_code=400, detail="至少需要指定一个时间周期")
+
+        supported = kline_aggregator.get_available_timeframes()
+        unsupported = [tf for tf in timeframe_list if tf not in supported]
+        if unsupported:
+            raise HTTPException(
+                status_code=400,
+                detail=f"不支持的时间周期: {unsupported}，支持的周期: {supported}"
+            )
+
+        app_logger.info(f"📊 获取多周期K线数据 - 周期: {timeframe_list}, 数量: {limit}")
+
+        results = await kline_aggregator.aggregate_many_async(
+            db=db,
+            timeframes=timeframe_list,
+            symbol=symbol,
+            limit=limit
+        )
+        klines = {timeframe: columns.to_dict_list() for timeframe, columns in results.items()}
+
+        return create_success_response(data={
+            "klines": klines,
+            "metadata": {
+                "timeframes": list(klines),
+                "counts": {timeframe: len(items) for timeframe, items in klines.items()},
+                "symbol": symbol,
+                "limit": limit
+            }
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(f"❌ 获取多周期K线数据失败: {str(e)}")
+        raise HTTPException(status_code=500, detail="服务器内部错误")
+
+
 @router.get("/latest")
-def get_latest_klines(
+async def get_latest_klines(
         timeframe: str = Query("1h", description="时间周期"),
         count: int = Query(100, ge=1, le=500, description="最新数据条数"),
         symbol: str = Query("btc_usd", description="交易品种"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取最新的K线数据"""
     try:
         app_logger.info(f"📈 获取最新K线数据 - 周期: {timeframe}, 数量: {count}")
 
-        klines = kline_aggregator.aggregate_klines(
+        klines = await kline_aggregator.aggregate_klines_async(
             db=db,
             timeframe=timeframe,
             symbol=symbol,
             limit=count
         )
 
-        latest_timestamp = kline_aggregator.get_latest_timestamp(db, symbol=symbol)
+        latest_timestamp = await kline_aggregator.get_latest_timestamp_async(db, symbol=symbol)
 
         return create_success_response(data={
             "klines": klines,
@@ -159,12 +244,44 @@ def get_latest_klines(
         raise HTTPException(status_code=500, detail="获取最新数据失败")
 
 
+@router.get("/live")
+def get_live_kline(symbol: str = Query("btc_usdt", description="交易品种（表名，如 btc_usdt）")):
+    """
+    获取实时流推送的最新1分钟K线（可能尚未收盘）
+
+    需要 KLINE_STREAM_ENABLED=true，首次访问时在当前进程内启动实时写入
+    """
+    if not settings.KLINE_STREAM_ENABLED:
+        raise HTTPException(status_code=503, detail="K线实时流未启用（KLINE_STREAM_ENABLED=false）")
+    try:
+        kline_stream.start()
+        bar = kline_stream.get_live_bar(symbol)
+        return create_success_response(data={
+            "kline": bar.to_dict() if bar else None,
+            "stream": {
+                key: value for key, value in kline_stream.get_status().items() if key != "live_bars"
+            }
+        })
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 @router.post("/fetch-data")
 def fetch_new_data():
     """手动触发数据获取 - 从币安API获取最新数据"""
     try:
         app_logger.info("🔄 手动触发数据获取...")
 
+        # 实时流运行中时只触发一次后台缺口补齐，不阻塞请求
+        if settings.KLINE_STREAM_ENABLED and kline_stream.request_gap_fill():
+            return create_success_response(
+                message="已触发后台缺口补齐",
+                data={
+                    "status": "scheduled",
+                    "note": "K线实时流运行中，已收盘K线会自动写入；缺口补齐在后台执行"
+                }
+            )
+
         from app.scripts.simple_fetch_data import SimpleBinanceDataFetcher
 
         fetcher = SimpleBinanceDataFetcher()
@@ -172,6 +289,7 @@ def fetch_new_data():
 
         if success:
             app_logger.info("✅ 数据获取成功")
+            kline_statistics.invalidate()
             return create_success_response(
                 message="数据获取成功",
                 data={
@@ -199,22 +317,26 @@ def fetch_new_data():
 
 
 @router.get("/stats")
-def get_data_statistics(
+async def get_data_statistics(
         symbol: str = Query("btc_usd", description="交易品种"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
-    """获取数据库统计信息"""
+    """获取数据库统计信息（含1分钟K线缺口统计）"""
     try:
-        stats = kline_aggregator.get_data_statistics(db, symbol=symbol)
+        stats = await kline_aggregator.get_data_statistics_async(db, symbol=symbol)
+        # 覆盖位图的加载和缺口扫描是CPU密集的NumPy运算，并且要等待覆盖索引的线程锁，放到线程池执行
+        gaps = await asyncio.to_thread(_get_gap_summary, symbol)
 
         return create_success_response(data={
             "statistics": stats,
+            "gaps": gaps,
             "supported_timeframes": kline_aggregator.get_available_timeframes(),
             "aggregation_info": {
                 "source": "1分钟K线数据",
-                "method": "pandas.resample聚合",
+                "method": "持续聚合视图 + NumPy向量化聚合",
                 "supported_operations": ["开盘价(first)", "最高价(max)", "最低价(min)", "收盘价(last)", "成交量(sum)"]
-            }
+            },
+            "cache": kline_aggregator.get_cache_statistics()
         })
 
     except Exception as e:
@@ -222,16 +344,22 @@ def get_data_statistics(
         raise HTTPException(status_code=500, detail="获取统计信息失败")
 
 
+def _get_gap_summary(symbol: str) -> Dict:
+    """在线程池中以同步只读会话计算缺口统计"""
+    with db_router.read_session(symbol) as db:
+        return kline_coverage.get_gap_summary(db, symbol=symbol)
+
+
 @router.get("/health")
-def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """健康检查 - 检查K线API和数据库状态"""
     try:
         # 检查数据库连接
-        stats = kline_aggregator.get_data_statistics(db)
+        stats = await kline_aggregator.get_data_statistics_async(db)
         data_available = stats.get("total_klines", 0) > 0
 
         # 检查最新数据时间
-        latest_timestamp = kline_aggregator.get_latest_timestamp(db)
+        latest_timestamp = await kline_aggregator.get_latest_timestamp_async(db)
         data_freshness = "unknown"
 
         if latest_timestamp:
@@ -254,6 +382,7 @@ def health_check(db: Session = Depends(get_db)):
                 "data_freshness": data_freshness
             },
             "statistics": stats,
+            "database_routing": db_router.get_status(),
             "recommendations": {
                 "fresh": "数据是最新的，可以进行分析",
                 "recent": "数据较新，建议获取最新数据",
@@ -1,8 +1,10 @@
 from fastapi import HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.exc import SQLAlchemyError
 from pydantic import ValidationError
 from app.core.logger import app_logger
+import json
+from typing import Callable, Iterable, List, Optional
 
 class AppException(HTTPException):
     """基础应用异常类"""
@@ -90,6 +92,37 @@ def create_success_response(data: any = None, message: str = "success") -> JSONR
         }
     )
 
+def create_streaming_success_response(
+    items: Iterable[List],
+    items_key: str,
+    data: Optional[dict] = None,
+    trailer: Optional[Callable[[], dict]] = None,
+    message: str = "success"
+) -> StreamingResponse:
+    """
+    流式输出统一格式的成功响应
+
+    data 中的字段先输出，items 按批次增量写入 data[items_key] 数组，
+    trailer 在全部批次输出后调用，其返回的字段追加到 data 末尾（如总条数）。
+    """
+    def generate():
+        envelope = json.dumps({"success": True, "code": 0, "message": message}, ensure_ascii=False)
+        head = json.dumps(data or {}, ensure_ascii=False, default=str)
+        yield f'{envelope[:-1]}, "data": {head[:-1]}{", " if data else ""}"{items_key}": ['
+
+        first = True
+        for batch in items:
+            if not batch:
+                continue
+            chunk = json.dumps(batch, ensure_ascii=False, default=str)[1:-1]
+            yield chunk if first else "," + chunk
+            first = False
+
+        tail = json.dumps(trailer(), ensure_ascii=False, default=str)[1:-1] if trailer else ""
+        yield "]" + (", " + tail if tail else "") + "}}"
+
+    return StreamingResponse(generate(), media_type="application/json")
+
 async def app_exception_handler(request: Request, exc: AppException) -> JSONResponse:
     """处理应用异常"""
     app_logger.error(f"Application error: {exc.message}", exc_info=True)
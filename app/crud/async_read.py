@@ -0,0 +1,50 @@
+"""
+由同步读取方法生成异步版本
+
+AsyncSession.run_sync 中的代码运行在事件循环线程上（数据库IO经 asyncpg 在事件循环上等待），
+因此只把查询和取数放在 run_sync 里；取回数据后的CPU处理（NumPy聚合、转换为字典列表等）
+交给线程池执行，不阻塞事件循环。
+"""
+import asyncio
+import functools
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def run_read(db: "AsyncSession", fetch: Callable, *args, finish: Optional[Callable] = None, **kwargs) -> Any:
+    """
+    在 AsyncSession 上执行同步读取 fetch(session, *args, **kwargs)，再在线程池中执行 finish(结果)
+
+    Args:
+        db: 异步数据库会话
+        fetch: 只做查询和取数的同步函数，第一个参数为同步 Session
+        finish: 对取回数据的CPU处理，为空时直接返回 fetch 的结果
+    """
+    result = await db.run_sync(fetch, *args, **kwargs)
+    if finish is None:
+        return result
+    return await asyncio.to_thread(finish, result)
+
+
+def async_read(fetch: Callable, finish: Optional[Callable] = None) -> Callable:
+    """
+    为类中的同步读取方法生成异步方法，调用参数与同步方法相同（db 换成 AsyncSession）
+
+    用法（类定义中）::
+
+        get_kline_data_async = async_read(get_kline_columns_with_plan, _columns_to_klines)
+
+    Args:
+        fetch: 同步方法 fetch(self, db, ...)，在 run_sync 中执行
+        finish: 方法 finish(self, 结果)，在线程池中执行
+    """
+    async def method(self, db: "AsyncSession", *args, **kwargs):
+        return await run_read(
+            db, functools.partial(fetch, self), *args,
+            finish=functools.partial(finish, self) if finish is not None else None, **kwargs
+        )
+
+    method.__doc__ = fetch.__doc__
+    return method
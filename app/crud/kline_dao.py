@@ -1,13 +1,68 @@
-from typing import List, Optional, Type
+import base64
+import json
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple, Type
 
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from app.core.logger import app_logger
-from sqlalchemy import text
+from sqlalchemy import func, text, tuple_
 
+from app.crud.async_read import async_read
+from app.crud.kline_columns_dao import kline_columns_dao
+from app.db.routing import _to_naive_utc
+from app.utils.kline_columnar import KlineColumns
+from app.utils.kline_export import iter_export
+from app.models.kline import BtcUsdtKline, SYMBOL_TO_MODEL
+from app.schemas.kline import BtcUsdtKlineCreate
 from common.model import SymbolEnum, TimeframeEnum
 
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(open_time: datetime, kline_id: int) -> str:
+    """将分页键 (open_time, id) 编码为不透明的续页令牌"""
+    payload = json.dumps({"t": open_time.isoformat(), "id": kline_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析续页令牌，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+@dataclass
+class KlineQueryPlan:
+    """
+    get_kline_data 的查询计划：原始1分钟数据的范围 [start_time, end_time) 与实际扫描行数
+
+    rows_scanned 只统计读取的1分钟原始行；走持续聚合视图时，读取的视图桶数记在 view_rows，
+    rows_scanned 为水位线之后未物化尾部的原始行数。
+    """
+    interval_minutes: int
+    limit: int
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    source: str = 'raw'
+    rows_scanned: int = 0
+    view_rows: int = 0
+    empty: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "rows_scanned": self.rows_scanned,
+            "view_rows": self.view_rows
+        }
+
 
 class KlineDao:
     def get_model(self, symbol: str) -> Type[BtcUsdtKline]:
@@ -94,40 +149,91 @@ class KlineDao:
         self, db: Session, *, symbol: str, skip: int = 0, limit: int = 100
     ) -> List[dict]:
         """获取多条K线数据"""
+        return self._klines_to_dicts(self._query_multi(db, symbol=symbol, skip=skip, limit=limit))
+
+    def _query_multi(
+        self, db: Session, *, symbol: str, skip: int = 0, limit: int = 100
+    ) -> List[BtcUsdtKline]:
         try:
             app_logger.debug(f"Getting multiple kline records for symbol: {symbol}, skip: {skip}, limit: {limit}")
             model = self.get_model(symbol)
             # 使用ORM查询，更安全且支持多表
             query_result = db.query(model).order_by(model.open_time.desc()).offset(skip).limit(limit).all()
-            
-            # 将查询结果转换为字典列表
-            klines = []
-            for kline in query_result:
-                kline_dict = {
-                    "id": kline.id,
-                    "timestamp": kline.timestamp,
-                    "open_time": kline.open_time.isoformat(),
-                    "close_time": kline.close_time.isoformat(),
-                    "open_price": str(kline.open_price),
-                    "high_price": str(kline.high_price),
-                    "low_price": str(kline.low_price),
-                    "close_price": str(kline.close_price),
-                    "volume": str(kline.volume),
-                    "quote_volume": str(kline.quote_volume),
-                    "trades_count": kline.trades_count,
-                    "taker_buy_volume": str(kline.taker_buy_volume),
-                    "taker_buy_quote_volume": str(kline.taker_buy_quote_volume),
-                    "created_at": kline.created_at.isoformat(),
-                    "updated_at": kline.updated_at.isoformat()
-                }
-                klines.append(kline_dict)
-            
-            app_logger.debug(f"Successfully fetched {len(klines)} kline records")
-            return klines
+            app_logger.debug(f"Successfully fetched {len(query_result)} kline records")
+            return query_result
         except Exception as e:
             app_logger.error(f"Error getting multiple kline records: {str(e)}", exc_info=True)
             raise
 
+    def get_page(
+        self, db: Session, *, symbol: str, limit: int = 100, cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        按 (open_time, id) 键集分页获取K线数据（时间倒序）
+
+        每页都从上一页最后一条记录的键开始走索引，翻到任意深度的代价都与第一页相同。
+
+        Args:
+            cursor: 上一页返回的续页令牌，为空时从最新数据开始
+
+        Returns:
+            (当前页数据, 下一页的续页令牌；没有更多数据时为 None)
+        """
+        return self._page_to_dicts(self._query_page(db, symbol=symbol, limit=limit, cursor=cursor))
+
+    def _query_page(
+        self, db: Session, *, symbol: str, limit: int = 100, cursor: Optional[str] = None
+    ) -> Tuple[List[BtcUsdtKline], Optional[str]]:
+        try:
+            app_logger.debug(f"Getting kline page for symbol: {symbol}, limit: {limit}, cursor: {cursor}")
+            model = self.get_model(symbol)
+            query = db.query(model)
+            if cursor:
+                open_time, kline_id = decode_cursor(cursor)
+                query = query.filter(tuple_(model.open_time, model.id) < tuple_(open_time, kline_id))
+
+            # 多取一条用于判断是否还有下一页
+            query_result = query.order_by(model.open_time.desc(), model.id.desc()).limit(limit + 1).all()
+            has_more = len(query_result) > limit
+            query_result = query_result[:limit]
+
+            next_cursor = None
+            if has_more:
+                last = query_result[-1]
+                next_cursor = encode_cursor(last.open_time, last.id)
+
+            app_logger.debug(f"Successfully fetched {len(query_result)} kline records, has more: {has_more}")
+            return query_result, next_cursor
+        except Exception as e:
+            app_logger.error(f"Error getting kline page: {str(e)}", exc_info=True)
+            raise
+
+    def _klines_to_dicts(self, klines: List[BtcUsdtKline]) -> List[dict]:
+        return [self._kline_to_dict(kline) for kline in klines]
+
+    def _page_to_dicts(self, page: Tuple[List[BtcUsdtKline], Optional[str]]) -> Tuple[List[dict], Optional[str]]:
+        klines, next_cursor = page
+        return self._klines_to_dicts(klines), next_cursor
+
+    def _kline_to_dict(self, kline) -> dict:
+        return {
+            "id": kline.id,
+            "timestamp": kline.timestamp,
+            "open_time": kline.open_time.isoformat(),
+            "close_time": kline.close_time.isoformat(),
+            "open_price": str(kline.open_price),
+            "high_price": str(kline.high_price),
+            "low_price": str(kline.low_price),
+            "close_price": str(kline.close_price),
+            "volume": str(kline.volume),
+            "quote_volume": str(kline.quote_volume),
+            "trades_count": kline.trades_count,
+            "taker_buy_volume": str(kline.taker_buy_volume),
+            "taker_buy_quote_volume": str(kline.taker_buy_quote_volume),
+            "created_at": kline.created_at.isoformat(),
+            "updated_at": kline.updated_at.isoformat()
+        }
+
     def get_by_time_range(
         self, db: Session, *, symbol: str, start_time: datetime, end_time: datetime
     ) -> List[BtcUsdtKline]:
@@ -190,6 +296,45 @@ class KlineDao:
         db.commit()
         return db_objs
 
+    def plan_kline_query(
+        self,
+        db: Session,
+        *,
+        model,
+        interval_minutes: int,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 1000
+    ) -> KlineQueryPlan:
+        """
+        计算返回最新 limit 根K线所需的精确1分钟数据范围
+
+        以结束时间（未指定时取库中最新K线）所在的桶为最后一根，向前推 limit-1 个桶得到起点，
+        桶按Unix纪元对齐，与聚合时的分桶方式一致；指定了开始时间时取两者中较晚的一个。
+        带时区的时间（如接口解析的 ...Z）先转换为UTC无时区时间，与 open_time 字段一致。
+        """
+        start_time, end_time = _to_naive_utc(start_time), _to_naive_utc(end_time)
+        plan = KlineQueryPlan(interval_minutes=interval_minutes, limit=limit,
+                              start_time=start_time, end_time=end_time)
+        if interval_minutes == 1:
+            # 1分钟数据直接按 open_time 倒序取 limit 条，走索引
+            return plan
+
+        if end_time is None:
+            latest_open_time = db.query(func.max(model.open_time)).scalar()
+            if latest_open_time is None:
+                plan.empty = True
+                return plan
+            plan.end_time = latest_open_time + timedelta(minutes=1)
+
+        interval = timedelta(minutes=interval_minutes)
+        last_minute = plan.end_time - timedelta(minutes=1)
+        last_bucket = last_minute - (last_minute - EPOCH) % interval
+        plan.start_time = last_bucket - interval * (limit - 1)
+        if start_time and start_time > plan.start_time:
+            plan.start_time = start_time
+        return plan
+
     def get_kline_data(
         self, 
         db: Session, 
@@ -201,131 +346,187 @@ class KlineDao:
         limit: int = 1000
     ) -> List[dict]:
         """获取K线数据 - 优化版本，支持不同时间间隔和时间范围查询"""
+        klines, _ = self.get_kline_data_with_plan(
+            db, symbol=symbol, interval_minutes=interval_minutes,
+            start_time=start_time, end_time=end_time, limit=limit
+        )
+        return klines
+
+    def get_kline_data_with_plan(
+        self,
+        db: Session,
+        *,
+        symbol: str = "btc_usdt",
+        interval_minutes: int = 1,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        limit: int = 1000
+    ) -> Tuple[List[dict], KlineQueryPlan]:
+        """获取K线数据（按时间倒序），同时返回执行的查询计划及扫描的行数"""
+        columns, plan = self.get_kline_columns_with_plan(
+            db, symbol=symbol, interval_minutes=interval_minutes,
+            start_time=start_time, end_time=end_time, limit=limit
+        )
+        return self._columns_to_klines_with_plan((columns, plan))
+
+    def get_exact_kline_data_with_plan(
+        self,
+        db: Session,
+        *,
+        symbol: str = "btc_usdt",
+        interval_minutes: int = 1,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        limit: int = 1000
+    ) -> Tuple[List[dict], KlineQueryPlan]:
+        """获取精确值K线数据（按时间倒序，数值为十进制字符串），仅供显式要求精确值的接口使用"""
+        try:
+            model = self.get_model(symbol)
+            plan = self.plan_kline_query(
+                db, model=model, interval_minutes=interval_minutes,
+                start_time=start_time, end_time=end_time, limit=limit
+            )
+            if plan.empty:
+                return [], plan
+
+            klines = kline_columns_dao.get_exact_klines(
+                db, model, interval_minutes, plan.start_time, plan.end_time, limit=limit
+            )
+            klines.reverse()  # 按时间倒序
+            plan.source = f"exact:{kline_columns_dao.get_bucket_backend(db)}"
+            return klines, plan
+
+        except Exception as e:
+            app_logger.error(f"Error getting exact kline data: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to get kline data: {str(e)}")
+
+    def get_kline_columns_with_plan(
+        self,
+        db: Session,
+        *,
+        symbol: str = "btc_usdt",
+        interval_minutes: int = 1,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        limit: int = 1000
+    ) -> Tuple[KlineColumns, KlineQueryPlan]:
+        """获取列式K线数据（按时间正序），同时返回执行的查询计划及扫描的行数"""
         try:
             app_logger.debug(f"Getting kline data for symbol: {symbol}, interval: {interval_minutes} minutes")
             model = self.get_model(symbol)
-            
-            # 构建基础查询
-            query = db.query(model)
-            
-            # 添加时间范围过滤
-            if start_time:
-                query = query.filter(model.open_time >= start_time)
-            if end_time:
-                query = query.filter(model.open_time < end_time)
-            
-            # 对于所有时间间隔，都使用简化的查询逻辑
-            # 直接获取原始数据，在应用层进行聚合（更快）
-            query_result = query.order_by(model.open_time.desc()).limit(limit * 10).all()
-            
-            # 转换为字典格式
-            klines = []
-            for kline in query_result:
-                kline_dict = {
-                    "timestamp": kline.timestamp,
-                    "open_time": kline.open_time.isoformat(),
-                    "close_time": kline.close_time.isoformat(),
-                    "open_price": float(kline.open_price),
-                    "high_price": float(kline.high_price),
-                    "low_price": float(kline.low_price),
-                    "close_price": float(kline.close_price),
-                    "volume": float(kline.volume),
-                    "quote_volume": float(kline.quote_volume),
-                    "trades_count": kline.trades_count,
-                    "taker_buy_volume": float(kline.taker_buy_volume),
-                    "taker_buy_quote_volume": float(kline.taker_buy_quote_volume)
-                }
-                klines.append(kline_dict)
-            
-            # 如果需要聚合（非1分钟数据），在这里进行简单聚合
+
+            # 有对应持续聚合视图时直接读取已分桶数据
             if interval_minutes > 1:
-                klines = self._aggregate_klines(klines, interval_minutes, limit)
+                view_backed = kline_columns_dao.get_view_backed_columns(
+                    db, model=model, interval_minutes=interval_minutes,
+                    start_time=start_time, end_time=end_time, limit=limit
+                )
+                if view_backed is not None:
+                    view_columns, view_rows, raw_rows = view_backed
+                    plan = KlineQueryPlan(interval_minutes=interval_minutes, limit=limit,
+                                          start_time=start_time, end_time=end_time,
+                                          source='view', rows_scanned=raw_rows, view_rows=view_rows)
+                    app_logger.debug(f"Successfully fetched {len(view_columns)} kline records from continuous aggregate")
+                    return view_columns, plan
+
+            plan = self.plan_kline_query(
+                db, model=model, interval_minutes=interval_minutes,
+                start_time=start_time, end_time=end_time, limit=limit
+            )
+            if plan.empty:
+                return KlineColumns.empty(interval_minutes), plan
+
+            if interval_minutes == 1:
+                columns = kline_columns_dao.get_raw_columns(db, model, plan.start_time, plan.end_time, limit=limit)
+                plan.rows_scanned = len(columns)
             else:
-                klines = klines[:limit]  # 限制返回数量
-            
-            app_logger.debug(f"Successfully fetched {len(klines)} aggregated kline records")
-            return klines
+                # 一次有界的索引范围查询，在数据库中分桶聚合，只传输聚合后的行
+                columns, plan.rows_scanned = kline_columns_dao.get_sql_aggregated_columns(
+                    db, model, interval_minutes, plan.start_time, plan.end_time, limit=limit
+                )
+                plan.source = f"sql:{kline_columns_dao.get_bucket_backend(db)}"
+
+            app_logger.debug(
+                f"Successfully fetched {len(columns)} kline records, "
+                f"scanned {plan.rows_scanned} rows in [{plan.start_time}, {plan.end_time})"
+            )
+            return columns, plan
             
         except Exception as e:
             app_logger.error(f"Error getting kline data: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to get kline data: {str(e)}")
-    
-    def _aggregate_klines(self, klines: List[dict], interval_minutes: int, limit: int) -> List[dict]:
-        """在应用层进行K线数据聚合，比数据库聚合更快"""
-        from datetime import datetime, timedelta
-        
-        if not klines:
-            return []
-        
-        # 按时间间隔分组
-        grouped_data = {}
-        
-        for kline in klines:
-            # 解析时间
-            open_time = datetime.fromisoformat(kline['open_time'].replace('Z', '+00:00'))
-            
-            # 计算时间桶
-            if interval_minutes == 60:  # 1小时
-                bucket_time = open_time.replace(minute=0, second=0, microsecond=0)
-            elif interval_minutes == 240:  # 4小时
-                hour_bucket = (open_time.hour // 4) * 4
-                bucket_time = open_time.replace(hour=hour_bucket, minute=0, second=0, microsecond=0)
-            elif interval_minutes == 1440:  # 1天
-                bucket_time = open_time.replace(hour=0, minute=0, second=0, microsecond=0)
-            else:  # 其他间隔，简单按小时分组
-                bucket_time = open_time.replace(minute=0, second=0, microsecond=0)
-            
-            bucket_key = bucket_time.isoformat()
-            
-            if bucket_key not in grouped_data:
-                grouped_data[bucket_key] = {
-                    'open_time': bucket_time,
-                    'close_time': bucket_time + timedelta(minutes=interval_minutes),
-                    'open_price': kline['open_price'],
-                    'close_price': kline['close_price'],
-                    'high_price': kline['high_price'],
-                    'low_price': kline['low_price'],
-                    'volume': 0,
-                    'quote_volume': 0,
-                    'trades_count': 0,
-                    'taker_buy_volume': 0,
-                    'taker_buy_quote_volume': 0,
-                    'timestamp': int(bucket_time.timestamp() * 1000)
-                }
-            
-            # 聚合数据
-            group = grouped_data[bucket_key]
-            group['high_price'] = max(group['high_price'], kline['high_price'])
-            group['low_price'] = min(group['low_price'], kline['low_price'])
-            group['volume'] += kline['volume']
-            group['quote_volume'] += kline['quote_volume']
-            group['trades_count'] += kline['trades_count']
-            group['taker_buy_volume'] += kline['taker_buy_volume']
-            group['taker_buy_quote_volume'] += kline['taker_buy_quote_volume']
-            
-            # 更新收盘价（最新的数据）
-            if datetime.fromisoformat(kline['open_time'].replace('Z', '+00:00')) >= open_time:
-                group['close_price'] = kline['close_price']
-        
-        # 转换为列表并排序
-        result = []
-        for bucket_key in sorted(grouped_data.keys(), reverse=True):
-            group = grouped_data[bucket_key]
-            result.append({
-                'timestamp': group['timestamp'],
-                'open_time': group['open_time'].isoformat(),
-                'close_time': group['close_time'].isoformat(),
-                'open_price': group['open_price'],
-                'high_price': group['high_price'],
-                'low_price': group['low_price'],
-                'close_price': group['close_price'],
-                'volume': group['volume'],
-                'quote_volume': group['quote_volume'],
-                'trades_count': group['trades_count'],
-                'taker_buy_volume': group['taker_buy_volume'],
-                'taker_buy_quote_volume': group['taker_buy_quote_volume']
-            })
-        
-        return result[:limit]
-
-kline = CRUDKline()
\ No newline at end of file
+
+    def iter_kline_data(
+        self,
+        db: Session,
+        *,
+        symbol: str,
+        interval_minutes: int = 1,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        batch_size: int = 10_000
+    ) -> Iterator[List[dict]]:
+        """
+        按批次流式获取时间范围内的全部K线（按时间正序，不限条数）
+
+        通过服务端游标（yield_per）分批读取，每批转换为字典列表后立即交给调用方，
+        内存占用只与 batch_size 有关。
+        """
+        model = self.get_model(symbol)
+        if interval_minutes == 1:
+            batches = kline_columns_dao.iter_raw_column_batches(db, model, start_time, end_time, batch_size=batch_size)
+        else:
+            batches = kline_columns_dao.iter_sql_aggregated_batches(
+                db, model, interval_minutes, start_time, end_time, batch_size=batch_size
+            )
+        for columns in batches:
+            yield columns.to_dict_list(as_string=False)
+
+    def iter_export(
+        self,
+        db: Session,
+        *,
+        symbol: str,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        export_format: str = 'arrow',
+        batch_size: int = 100_000
+    ) -> Iterator[bytes]:
+        """
+        批量导出1分钟K线为二进制流（Arrow IPC / MessagePack）
+
+        数据通过服务端游标分批读取，每批直接编码，不构建逐行字典。
+        """
+        model = self.get_model(symbol)
+        batches = kline_columns_dao.iter_raw_column_batches(db, model, start_time, end_time, batch_size=batch_size)
+        return iter_export(batches, export_format)
+
+    def _columns_to_klines_with_plan(
+        self, result: Tuple[KlineColumns, KlineQueryPlan]
+    ) -> Tuple[List[dict], KlineQueryPlan]:
+        columns, plan = result
+        klines = columns.to_dict_list(as_string=False)
+        klines.reverse()  # 与原有结果一致，按时间倒序
+        return klines, plan
+
+    def _columns_to_klines(self, result: Tuple[KlineColumns, KlineQueryPlan]) -> List[dict]:
+        return self._columns_to_klines_with_plan(result)[0]
+
+    # ------------------------------------------------------------------
+    # 异步读取：查询和取数在 AsyncSession.run_sync 中执行，数据库IO在事件循环上等待；
+    # 取回后转换为字典列表的CPU处理在线程池中执行（见 app.crud.async_read）
+    # ------------------------------------------------------------------
+
+    get_async = async_read(get)
+    get_by_timestamp_async = async_read(get_by_timestamp)
+    get_by_time_range_async = async_read(get_by_time_range)
+    get_count_async = async_read(get_count)
+    get_multi_async = async_read(_query_multi, _klines_to_dicts)
+    get_page_async = async_read(_query_page, _page_to_dicts)
+    get_kline_data_async = async_read(get_kline_columns_with_plan, _columns_to_klines)
+    get_kline_data_with_plan_async = async_read(get_kline_columns_with_plan, _columns_to_klines_with_plan)
+    get_exact_kline_data_with_plan_async = async_read(get_exact_kline_data_with_plan)
+    get_kline_columns_with_plan_async = async_read(get_kline_columns_with_plan)
+
+
+kline = KlineDao()
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""
+Binance异步HTTP客户端
+
+基于 aiohttp 的连接池（keep-alive）复用 TLS 连接，替代 BinanceFetcher 每页新建一次 urlopen 连接：
+- get_klines_range 按周期预先计算每页的时间窗口，受并发上限约束同时请求所有页
+- 429/418 按 Retry-After 等待；5xx、超时和连接错误按指数退避 + 全抖动（full jitter）重试
+- 响应体用 orjson 解码（未安装时回退到标准库 json），结果直接构建为 KlineColumns（NumPy 数组），
+  也可输出 Arrow RecordBatch
+
+aiohttp / orjson 为可选依赖（pip install turtle-front[binance]）。base_url 可指向本地模拟服务。
+"""
+import asyncio
+import json
+import random
+import ssl
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.utils.kline_columnar import MS_PER_MINUTE, KlineColumns, concat_columns
+from app.utils.kline_export import ARROW_AVAILABLE, columns_to_record_batch
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+# 固定时长的周期（分钟）；1M（自然月）长度不固定，只能逐页顺序请求
+INTERVAL_MINUTES = {
+    '1m': 1, '3m': 3, '5m': 5, '15m': 15, '30m': 30,
+    '1h': 60, '2h': 120, '4h': 240, '6h': 360, '8h': 480, '12h': 720,
+    '1d': 1440, '3d': 4320, '1w': 10080,
+}
+
+PAGE_LIMIT = 1000
+_RETRY_STATUS = {500, 502, 503, 504}
+
+
+class BinanceHTTPError(Exception):
+    """币安接口返回不可重试的错误状态（如 400 参数错误）"""
+
+    def __init__(self, status: int, message: str):
+        self.status = status
+        super().__init__(f"HTTP {status}: {message}")
+
+
+class AsyncBinanceClient:
+    """币安 REST 异步客户端（连接池 + 并发分页 + 抖动重试）"""
+
+    def __init__(
+            self,
+            base_url: Optional[str] = None,
+            max_connections: int = 10,
+            timeout: float = 30.0,
+            max_retries: int = 5,
+            backoff_base: float = 0.5,
+            backoff_cap: float = 30.0,
+            weight_limit: int = settings.BINANCE_WEIGHT_PER_MINUTE
+    ):
+        if not AIOHTTP_AVAILABLE:
+            raise RuntimeError("aiohttp 未安装，无法使用异步币安客户端")
+        self.base_url = (base_url or settings.BINANCE_BASE_URL).rstrip('/')
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # 响应头报告的本分钟已用权重达到该值时，等待到下一分钟再发请求
+        self.weight_limit = weight_limit
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._weight_reset_at = 0.0
+        self.requests = 0
+        self.retries = 0
+
+    async def __aenter__(self) -> "AsyncBinanceClient":
+        await self._get_session()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=60,
+                ssl=ssl.create_default_context() if self.base_url.startswith('https') else False
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': 'Mozilla/5.0'}
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, endpoint: str, params: Optional[Dict] = None):
+        """发送 GET 请求并解码 JSON，按错误类型等待后重试"""
+        session = await self._get_session()
+        url = f"{self.base_url}{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            delay = self._weight_reset_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.requests += 1
+            try:
+                async with session.get(url, params=params) as resp:
+                    body = await resp.read()
+                    self._observe_weight(resp.headers.get('X-MBX-USED-WEIGHT-1M'))
+                    if resp.status == 200:
+                        return json_loads(body)
+                    if resp.status in (418, 429):
+                        retry_after = float(resp.headers.get('Retry-After') or 60)
+                        app_logger.warning(f"⚠️ 触发币安限流（HTTP {resp.status}），等待 {retry_after:.0f}s")
+                        self._weight_reset_at = max(self._weight_reset_at, time.monotonic() + retry_after)
+                        self.retries += 1
+                        continue
+                    if resp.status not in _RETRY_STATUS:
+                        raise BinanceHTTPError(resp.status, body[:200].decode(errors='replace'))
+                    error = BinanceHTTPError(resp.status, body[:200].decode(errors='replace'))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+        raise RuntimeError(f"{endpoint} 被持续限流，重试 {self.max_retries} 次后放弃")
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避 + 全抖动：在 [0, min(cap, base * 2^attempt)] 内随机等待，避免并发请求同时重试"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _observe_weight(self, used_weight: Optional[str]) -> None:
+        if used_weight and int(used_weight) >= self.weight_limit:
+            # 权重按自然分钟重置
+            now = time.time()
+            self._weight_reset_at = max(self._weight_reset_at, time.monotonic() + 60 - now % 60)
+
+    async def get_klines_page(
+            self,
+            symbol: str,
+            interval: str,
+            start_ms: int,
+            end_ms: int,
+            limit: int = PAGE_LIMIT
+    ) -> list:
+        """获取 [start_ms, end_ms] 内的一页原始K线（最多 limit 条）"""
+        params = {
+            'symbol': symbol.upper().replace('/', ''),
+            'interval': interval,
+            'startTime': start_ms,
+            'endTime': end_ms,
+            'limit': min(limit, PAGE_LIMIT)
+        }
+        return await self._request('/api/v3/klines', params)
+
+    async def get_klines_range(
+            self,
+            symbol: str,
+            interval: str,
+            start_ms: int,
+            end_ms: int,
+            concurrency: Optional[int] = None
+    ) -> KlineColumns:
+        """
+        获取 [start_ms, end_ms) 内的全部K线，返回按开盘时间升序的列式数据
+
+        固定时长的周期按每页 1000 根切分时间窗口并发请求；1M 周期逐页顺序请求。
+        """
+        interval_minutes = INTERVAL_MINUTES.get(interval)
+        if interval_minutes is None:
+            return await self._get_klines_sequential(symbol, interval, start_ms, end_ms)
+
+        windows = _page_windows(start_ms, end_ms, interval_minutes * MS_PER_MINUTE * PAGE_LIMIT)
+        semaphore = asyncio.Semaphore(concurrency or self.max_connections)
+
+        async def fetch(window: Tuple[int, int]) -> KlineColumns:
+            async with semaphore:
+                klines = await self.get_klines_page(symbol, interval, window[0], window[1] - 1)
+            return KlineColumns.from_binance_klines(klines, interval_minutes)
+
+        pages = await asyncio.gather(*(fetch(window) for window in windows))
+        if not pages:
+            return KlineColumns.empty(interval_minutes)
+        return concat_columns(*pages)
+
+    async def get_klines_range_arrow(
+            self,
+            symbol: str,
+            interval: str,
+            start_ms: int,
+            end_ms: int,
+            concurrency: Optional[int] = None
+    ):
+        """同 get_klines_range，返回 Arrow RecordBatch（需要 pyarrow）"""
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("pyarrow 未安装，无法输出 Arrow 格式")
+        columns = await self.get_klines_range(symbol, interval, start_ms, end_ms, concurrency)
+        return columns_to_record_batch(columns)
+
+    async def _get_klines_sequential(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> KlineColumns:
+        pages: List[KlineColumns] = []
+        current = start_ms
+        while current < end_ms:
+            klines = await self.get_klines_page(symbol, interval, current, end_ms - 1)
+            if not klines:
+                break
+            pages.append(KlineColumns.from_binance_klines(klines))
+            current = int(klines[-1][6]) + 1  # 最后一条的收盘时间+1
+        return concat_columns(*pages) if pages else KlineColumns.empty()
+
+
+def _page_windows(start_ms: int, end_ms: int, page_ms: int) -> List[Tuple[int, int]]:
+    """[start_ms, end_ms) 按 page_ms 切分为不重叠的请求窗口"""
+    return [(start, min(start + page_ms, end_ms)) for start in range(start_ms, end_ms, page_ms)]
@@ -11,9 +11,17 @@ from datetime import datetime, timedelta
 class BinanceFetcher:
     """Binance数据获取器"""
     BASE_URL = "https://api.binance.com"
+    # /api/v3/klines 的请求权重（limit 为 1000 时）
+    KLINES_WEIGHT = 2
 
 
-    def __init__(self):
+    def __init__(self, base_url=None, timeout=30):
+        """
+        base_url: 接口地址，默认 BASE_URL；可指向本地模拟服务用于测试
+        timeout: 单次请求超时（秒）
+        """
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.timeout = timeout
         # 禁用SSL验证避免Windows证书问题
         self.ctx = ssl.create_default_context()
         self.ctx.check_hostname = False
@@ -21,15 +29,19 @@ class BinanceFetcher:
     
     def _request(self, endpoint, params=None):
         """发送HTTP请求"""
-        url = f"{self.BASE_URL}{endpoint}"
+        return self._request_with_headers(endpoint, params)[0]
+
+    def _request_with_headers(self, endpoint, params=None):
+        """发送HTTP请求，同时返回响应头（含 X-MBX-USED-WEIGHT-1M 等限流信息）"""
+        url = f"{self.base_url}{endpoint}"
         if params:
             url = f"{url}?{parse.urlencode(params)}"
         
         req = request.Request(url)
         req.add_header('User-Agent', 'Mozilla/5.0')
         
-        with request.urlopen(req, timeout=30, context=self.ctx) as resp:
-            return json.loads(resp.read())
+        with request.urlopen(req, timeout=self.timeout, context=self.ctx) as resp:
+            return json.loads(resp.read()), resp.headers
     
     def get_klines(self, symbol, interval='1h', limit=500):
         """
@@ -77,6 +89,44 @@ class BinanceFetcher:
         
         return all_data
     
+    def get_klines_page(self, symbol, interval, start_ms, end_ms, limit=1000):
+        """
+        获取 [start_ms, end_ms] 内的一页K线（最多 limit 条）
+        返回 (K线列表, 当前分钟已用请求权重或 None)
+        """
+        params = {
+            'symbol': symbol.upper().replace('/', ''),
+            'interval': interval,
+            'startTime': start_ms,
+            'endTime': end_ms,
+            'limit': min(limit, 1000)
+        }
+        klines, headers = self._request_with_headers('/api/v3/klines', params)
+        used_weight = headers.get('X-MBX-USED-WEIGHT-1M')
+        return klines, int(used_weight) if used_weight else None
+    
+    def get_klines_columns(self, symbol, interval, start_time, end_time):
+        """
+        获取时间范围内的所有K线，返回列式数据（KlineColumns）
+        安装了 aiohttp 时通过 AsyncBinanceClient 连接池并发分页，否则回退到 get_klines_range
+        不能在已运行的事件循环中调用，异步代码请直接使用 AsyncBinanceClient
+        """
+        import asyncio
+        from app.data.binance.async_binance_client import AIOHTTP_AVAILABLE, INTERVAL_MINUTES, AsyncBinanceClient
+        from app.utils.kline_columnar import KlineColumns
+
+        if not AIOHTTP_AVAILABLE:
+            klines = self.get_klines_range(symbol, interval, start_time, end_time)
+            return KlineColumns.from_binance_klines(klines, INTERVAL_MINUTES.get(interval, 1))
+
+        async def fetch():
+            async with AsyncBinanceClient(base_url=self.base_url, timeout=self.timeout) as client:
+                return await client.get_klines_range(
+                    symbol, interval, int(start_time.timestamp() * 1000), int(end_time.timestamp() * 1000)
+                )
+
+        return asyncio.run(fetch())
+    
     def get_price(self, symbol):
         """获取最新价格"""
         params = {'symbol': symbol.upper().replace('/', '')}
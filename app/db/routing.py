@@ -0,0 +1,287 @@
+"""
+读写分离路由
+
+写入（KlineDao.create / bulk_create、数据抓取脚本）始终使用主库 SessionLocal；
+只读的K线查询和分析查询按副本的数据水位线路由：
+- 后台线程定期读取主库和每个副本上各K线表的 MAX(open_time)，作为该表的数据水位线
+- 指定了结束时间的查询，只选择水位线已覆盖该结束时间（或已追平主库）的副本
+- 请求最新数据的查询，只选择水位线落后主库不超过 REPLICA_MAX_LAG_SECONDS 的副本
+- 没有满足条件的副本（未配置、不可达或落后）时回退到主库
+
+水位线直接比较K线数据本身，流复制、逻辑复制或两个独立导入的本地实例都适用。
+"""
+import itertools
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.core.logger import db_logger
+from app.db.session import (
+    ASYNC_DB_AVAILABLE, AsyncSessionLocal, SessionLocal, engine, to_async_url
+)
+from app.models.kline import BtcUsdtKline, SYMBOL_TO_MODEL
+
+if ASYNC_DB_AVAILABLE:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+PRIMARY = "primary"
+
+
+@dataclass
+class ReplicaNode:
+    """一个只读副本：同步/异步会话工厂及最近一次探测到的各表水位线"""
+    name: str
+    session_factory: Callable[[], Session]
+    async_session_factory: Optional[Callable] = None
+    # 表名 -> 副本上最新K线的开盘时间
+    watermarks: Dict[str, Optional[datetime]] = field(default_factory=dict)
+    healthy: bool = False
+    checked_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "watermarks": {table: wm.isoformat() if wm else None for table, wm in self.watermarks.items()},
+            "error": self.error
+        }
+
+
+class DatabaseRouter:
+    """主库 + 只读副本池的会话路由"""
+
+    def __init__(
+            self,
+            replica_urls: Optional[List[str]] = None,
+            max_lag_seconds: float = 90.0,
+            check_interval: float = 5.0
+    ):
+        self.max_lag = timedelta(seconds=max_lag_seconds)
+        self.check_interval = check_interval
+        self.replicas: List[ReplicaNode] = [
+            self._create_replica(index, url) for index, url in enumerate(replica_urls or [])
+        ]
+        # 主库各表水位线，作为副本是否追平的参照
+        self._primary_watermarks: Dict[str, Optional[datetime]] = {}
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 会话获取
+    # ------------------------------------------------------------------
+
+    def write_session(self) -> Session:
+        """主库会话，用于所有写入"""
+        return SessionLocal()
+
+    def read_session(self, symbol: Optional[str] = None, end_time: Optional[datetime] = None) -> Session:
+        """只读会话：优先选择数据覆盖 [.., end_time) 的副本，否则使用主库"""
+        replica = self.select_replica(symbol, end_time)
+        return replica.session_factory() if replica else SessionLocal()
+
+    def async_read_session(self, symbol: Optional[str] = None, end_time: Optional[datetime] = None):
+        """只读异步会话：选择规则同 read_session"""
+        replica = self.select_replica(symbol, end_time)
+        if replica and replica.async_session_factory is not None:
+            return replica.async_session_factory()
+        if AsyncSessionLocal is None:
+            raise RuntimeError("asyncpg 未安装，无法创建异步数据库会话")
+        return AsyncSessionLocal()
+
+    def select_replica(self, symbol: Optional[str] = None, end_time: Optional[datetime] = None) -> Optional[ReplicaNode]:
+        """
+        选择一个满足时间范围的副本（轮询），没有时返回 None 表示使用主库
+
+        Args:
+            symbol: 交易品种，用于确定K线表
+            end_time: 查询的结束时间；为空表示请求最新数据
+        """
+        if not self.replicas:
+            return None
+        self.start()
+
+        table_name = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline).__tablename__
+        end_time = _to_naive_utc(end_time)
+        with self._lock:
+            primary_wm = self._primary_watermarks.get(table_name)
+            candidates = [
+                replica for replica in self.replicas
+                if replica.healthy and self._covers(replica.watermarks.get(table_name), primary_wm, end_time)
+            ]
+        if not candidates:
+            return None
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    def _covers(
+            self,
+            replica_wm: Optional[datetime],
+            primary_wm: Optional[datetime],
+            end_time: Optional[datetime]
+    ) -> bool:
+        """副本水位线是否足以回答结束时间为 end_time 的查询"""
+        if primary_wm is None:
+            # 主库尚未探测成功或表为空，无从判断副本是否落后
+            return False
+        if replica_wm is None:
+            return False
+        if end_time is None:
+            return replica_wm >= primary_wm - self.max_lag
+        # 查询需要 open_time < end_time 的全部K线，主库也没有的部分不要求副本具备
+        required = min(end_time - timedelta(minutes=1), primary_wm)
+        return replica_wm >= required
+
+    # ------------------------------------------------------------------
+    # 水位线探测
+    # ------------------------------------------------------------------
+
+    def check_replicas(self) -> None:
+        """探测主库和所有副本的各表水位线"""
+        try:
+            with SessionLocal() as db:
+                primary_watermarks = self._read_watermarks(db)
+            with self._lock:
+                self._primary_watermarks = primary_watermarks
+        except Exception as e:
+            db_logger.error(f"❌ 读取主库K线水位线失败: {str(e)}")
+
+        for replica in self.replicas:
+            try:
+                with replica.session_factory() as db:
+                    watermarks = self._read_watermarks(db)
+                with self._lock:
+                    replica.watermarks = watermarks
+                    replica.healthy = True
+                    replica.error = None
+                    replica.checked_at = datetime.now()
+            except Exception as e:
+                with self._lock:
+                    replica.healthy = False
+                    replica.error = str(e)
+                    replica.checked_at = datetime.now()
+                db_logger.warning(f"⚠️ 副本 {replica.name} 不可用，读请求回退到主库: {str(e)}")
+
+    def _read_watermarks(self, db: Session) -> Dict[str, Optional[datetime]]:
+        # MAX(open_time) 走 open_time 索引的反向扫描，只读取一行
+        return {
+            model.__tablename__: db.execute(select(func.max(model.open_time))).scalar()
+            for model in set(SYMBOL_TO_MODEL.values())
+        }
+
+    def start(self) -> None:
+        """启动后台探测线程（没有配置副本或重复调用时无副作用）"""
+        if not self.replicas or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._check_loop, name="db-replica-check", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台探测线程"""
+        self._stop_event.set()
+
+    def _check_loop(self) -> None:
+        while True:
+            self.check_replicas()
+            if self._stop_event.wait(self.check_interval):
+                break
+
+    def get_status(self) -> Dict:
+        """路由状态：主库与各副本的水位线"""
+        with self._lock:
+            return {
+                "replicas_configured": len(self.replicas),
+                "max_lag_seconds": self.max_lag.total_seconds(),
+                "primary_watermarks": {
+                    table: wm.isoformat() if wm else None for table, wm in self._primary_watermarks.items()
+                },
+                "replicas": [replica.to_dict() for replica in self.replicas]
+            }
+
+    def _create_replica(self, index: int, url: str) -> ReplicaNode:
+        """为副本创建同步/异步引擎（连接参数与主库一致，连接池较小）"""
+        name = f"replica-{index}@{make_url(url).host}:{make_url(url).port or 5432}"
+        replica_engine = create_engine(
+            url,
+            pool_pre_ping=True,
+            pool_size=5,
+            max_overflow=10,
+            pool_timeout=30,
+            pool_recycle=3600,
+            echo=settings.DEBUG,
+            connect_args={
+                "connect_timeout": 10,
+                "application_name": "turtle_trading_system_replica",
+                "options": "-c search_path=public"
+            }
+        )
+        async_session_factory = None
+        if ASYNC_DB_AVAILABLE:
+            replica_async_engine = create_async_engine(
+                to_async_url(url),
+                pool_pre_ping=True,
+                pool_size=settings.ASYNC_DB_POOL_SIZE,
+                max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+                pool_timeout=30,
+                pool_recycle=3600,
+                echo=settings.DEBUG,
+                connect_args={
+                    "timeout": 10,
+                    "server_settings": {
+                        "application_name": "turtle_trading_system_replica",
+                        "search_path": "public"
+                    }
+                }
+            )
+            async_session_factory = async_sessionmaker(
+                bind=replica_async_engine, autoflush=False, expire_on_commit=False
+            )
+        db_logger.info(f"🔀 已配置只读副本 {name}")
+        return ReplicaNode(
+            name=name,
+            session_factory=sessionmaker(autocommit=False, autoflush=False, bind=replica_engine),
+            async_session_factory=async_session_factory
+        )
+
+
+def _to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """带时区的时间转换为UTC无时区时间，与 open_time 字段一致"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_end_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    解析请求中的结束时间（毫秒时间戳或ISO格式）为UTC无时区时间，无法解析时返回 None（按最新数据处理）
+
+    毫秒时间戳按UTC转换，不受服务器本地时区影响；不带时区的ISO时间视为UTC。
+    """
+    if not value:
+        return None
+    try:
+        if value.isdigit():
+            return _to_naive_utc(datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc))
+        return _to_naive_utc(datetime.fromisoformat(value.replace('Z', '+00:00')))
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+# 创建全局实例
+db_router = DatabaseRouter(
+    replica_urls=[url.strip() for url in settings.DATABASE_REPLICA_URLS.split(',') if url.strip()],
+    max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_CHECK_INTERVAL
+)
@@ -1,4 +1,7 @@
+from typing import AsyncGenerator
+
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 from app.core.logger import db_logger
@@ -41,4 +44,67 @@ def get_db():
         raise
     finally:
         db_logger.debug("Closing database session")
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def to_async_url(database_url: str):
+    """将同步连接地址转换为 asyncpg 地址（去掉 asyncpg 不支持的 client_encoding 参数，asyncpg 固定使用 UTF-8）"""
+    url = make_url(database_url)
+    return url.set(drivername='postgresql+asyncpg').difference_update_query(['client_encoding'])
+
+
+def _async_database_url():
+    """异步引擎的连接地址，未配置 ASYNC_DATABASE_URL 时由 DATABASE_URL 推导"""
+    if settings.ASYNC_DATABASE_URL:
+        return make_url(settings.ASYNC_DATABASE_URL)
+    return to_async_url(settings.DATABASE_URL)
+
+
+try:
+    import asyncpg  # noqa: F401
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    ASYNC_DB_AVAILABLE = True
+except ImportError:
+    AsyncSession = None
+    ASYNC_DB_AVAILABLE = False
+
+if ASYNC_DB_AVAILABLE:
+    # 异步引擎：连接在等待数据库时让出事件循环，并发不再受线程池大小限制
+    async_engine = create_async_engine(
+        _async_database_url(),
+        pool_pre_ping=True,
+        pool_size=settings.ASYNC_DB_POOL_SIZE,
+        max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+        pool_timeout=30,
+        pool_recycle=3600,
+        echo=settings.DEBUG,
+        connect_args={
+            "timeout": 10,  # 连接超时
+            "server_settings": {
+                "application_name": "turtle_trading_system",
+                "search_path": "public"
+            }
+        }
+    )
+    # expire_on_commit=False：提交后仍可访问已加载的属性，避免在异步上下文中触发隐式IO
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+    db_logger.warning("⚠️ asyncpg 未安装，异步数据库会话不可用")
+
+
+async def get_async_db() -> AsyncGenerator:
+    """获取异步数据库会话"""
+    if AsyncSessionLocal is None:
+        raise RuntimeError("asyncpg 未安装，无法创建异步数据库会话")
+    async with AsyncSessionLocal() as db:
+        try:
+            db_logger.debug("Creating new async database session")
+            yield db
+        except Exception as e:
+            db_logger.error(f"Async database session error: {str(e)}")
+            await db.rollback()
+            raise
+        finally:
+            db_logger.debug("Closing async database session")
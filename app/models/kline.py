@@ -0,0 +1,16 @@
+"""
+K线数据模型
+
+各交易品种的K线实体定义在 common.model 中，这里按表名（SymbolEnum.tablePrefix）建立品种到模型的映射，
+供 DAO、服务和接口通过品种名查找对应的数据表。
+"""
+from common.model import BtcUsdtKline, EthUsdtKline, SolUsdtKline
+
+# 交易品种（表名） -> K线模型
+SYMBOL_TO_MODEL = {
+    "btc_usdt": BtcUsdtKline,
+    "eth_usdt": EthUsdtKline,
+    "sol_usdt": SolUsdtKline,
+}
+
+__all__ = ["BtcUsdtKline", "EthUsdtKline", "SolUsdtKline", "SYMBOL_TO_MODEL"]
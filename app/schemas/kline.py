@@ -0,0 +1,39 @@
+"""
+K线数据的请求/响应模型
+
+各品种K线表结构相同，统一使用 BtcUsdtKline* 模型。
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from pydantic import BaseModel, ConfigDict
+
+
+class BtcUsdtKlineBase(BaseModel):
+    """K线公共字段"""
+    timestamp: int
+    open_time: datetime
+    close_time: datetime
+    open_price: Decimal
+    high_price: Decimal
+    low_price: Decimal
+    close_price: Decimal
+    volume: Decimal
+    quote_volume: Decimal
+    trades_count: int
+    taker_buy_volume: Decimal
+    taker_buy_quote_volume: Decimal
+
+
+class BtcUsdtKlineCreate(BtcUsdtKlineBase):
+    """创建K线数据"""
+    pass
+
+
+class BtcUsdtKline(BtcUsdtKlineBase):
+    """数据库中的K线数据"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    created_at: datetime
+    updated_at: datetime
@@ -0,0 +1,108 @@
+"""
+分型识别性能基准
+
+对比两种分型识别实现在相同K线上的耗时，并校验结果完全一致：
+- loop : 逐根K线比较相邻三根的高低点（原有实现）
+- numpy: app.utils.fenxing.find_fenxings 错位数组向量化比较
+
+使用合成数据，不依赖数据库：
+    python -m app.scripts.benchmark_fenxing --bars 500 10000 1000000
+"""
+import argparse
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from app.utils.fenxing import find_fenxings
+
+
+def generate_klines(bars: int, seed: int = 42) -> List[Dict]:
+    """生成合成K线（价格为字符串，与接口返回的K线字典一致）"""
+    rng = np.random.default_rng(seed)
+    close = 40000 + np.cumsum(rng.normal(0, 15, bars))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.round(np.maximum(open_, close) + rng.random(bars) * 10, 2)
+    low = np.round(np.minimum(open_, close) - rng.random(bars) * 10, 2)
+    timestamps = 1704067200000 + np.arange(bars, dtype=np.int64) * 60000
+    return [
+        {'timestamp': ts, 'high_price': str(h), 'low_price': str(l)}
+        for ts, h, l in zip(timestamps.tolist(), high.tolist(), low.tolist())
+    ]
+
+
+def loop_fenxings(klines: List[Dict]) -> List[Dict]:
+    """原有的逐根实现（ChanMultiLevelStrategy._identify_fenxings 向量化之前的版本）"""
+    fenxings = []
+    if len(klines) < 3:
+        return fenxings
+    highs = [float(k['high_price']) for k in klines]
+    lows = [float(k['low_price']) for k in klines]
+
+    def strength(i: int) -> float:
+        prev_range = highs[i-1] - lows[i-1]
+        curr_range = highs[i] - lows[i]
+        next_range = highs[i+1] - lows[i+1]
+        avg_range = (prev_range + curr_range + next_range) / 3
+        value = curr_range / avg_range if avg_range > 0 else 1.0
+        return min(max(value, 0.1), 3.0)
+
+    for i in range(1, len(klines) - 1):
+        prev_high, curr_high, next_high = highs[i-1], highs[i], highs[i+1]
+        prev_low, curr_low, next_low = lows[i-1], lows[i], lows[i+1]
+        if (curr_high > prev_high and curr_high > next_high and
+                curr_low > prev_low and curr_low > next_low):
+            fenxings.append({'type': 'top', 'timestamp': klines[i]['timestamp'], 'price': curr_high,
+                             'index': i, 'strength': strength(i)})
+        elif (curr_low < prev_low and curr_low < next_low and
+              curr_high < prev_high and curr_high < next_high):
+            fenxings.append({'type': 'bottom', 'timestamp': klines[i]['timestamp'], 'price': curr_low,
+                             'index': i, 'strength': strength(i)})
+    return fenxings
+
+
+def numpy_fenxings(klines: List[Dict]) -> List[Dict]:
+    """向量化实现（含字典 -> 数组转换和结果转字典）"""
+    highs = np.array([k['high_price'] for k in klines], dtype=np.float64)
+    lows = np.array([k['low_price'] for k in klines], dtype=np.float64)
+    return find_fenxings(highs, lows).to_dict_list([k['timestamp'] for k in klines])
+
+
+def timed(func: Callable, repeat: int) -> Tuple[float, object]:
+    """执行 repeat 次，返回最短耗时（秒）和最后一次结果"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - begin)
+    return best, result
+
+
+def run_benchmark(bars: int, repeat: int) -> None:
+    klines = generate_klines(bars)
+    highs = np.array([k['high_price'] for k in klines], dtype=np.float64)
+    lows = np.array([k['low_price'] for k in klines], dtype=np.float64)
+
+    loop_time, loop_result = timed(lambda: loop_fenxings(klines), repeat)
+    numpy_time, numpy_result = timed(lambda: numpy_fenxings(klines), repeat)
+    kernel_time, _ = timed(lambda: find_fenxings(highs, lows), repeat)
+
+    # 计算顺序相同，结果应逐位一致
+    assert loop_result == numpy_result, "分型识别结果不一致"
+
+    print(f"📊 {bars} 根K线 -> {len(numpy_result)} 个分型 (最佳 {repeat} 次)")
+    print(f"   loop        : {loop_time * 1000:10.2f} ms")
+    print(f"   numpy       : {numpy_time * 1000:10.2f} ms  (含字典转换)")
+    print(f"   numpy kernel: {kernel_time * 1000:10.2f} ms  (仅数组计算)")
+    print(f"   加速比: {loop_time / numpy_time:.1f}x / kernel {loop_time / kernel_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='分型识别性能基准')
+    parser.add_argument('--bars', type=int, nargs='+', default=[500, 10000, 1000000], help='K线数量')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    args = parser.parse_args()
+
+    for bars in args.bars:
+        run_benchmark(bars, args.repeat)
@@ -0,0 +1,116 @@
+"""
+K线聚合性能基准
+
+对比两种聚合实现在相同的1分钟数据上的耗时，并校验结果一致：
+- pandas: ORM对象 -> DataFrame -> resample -> iterrows 转字典（原有实现）
+- numpy : 列式数组 -> reduceat 按桶聚合 -> 列转字典
+
+使用合成数据，不依赖数据库：
+    python -m app.scripts.benchmark_kline_aggregation --days 365 --timeframe 1d
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from app.services.kline_aggregator import KlineAggregator
+from app.utils.kline_columnar import KlineColumns, aggregate_columns
+
+
+def generate_rows(minutes: int, seed: int = 42) -> List[Tuple]:
+    """生成合成的1分钟K线数据行（与 KlineColumnsDao.get_raw_columns 的列顺序一致）"""
+    rng = np.random.default_rng(seed)
+    start = 1704067200.0  # 2024-01-01T00:00:00Z
+    epoch = start + np.arange(minutes) * 60.0
+
+    close = 40000 + np.cumsum(rng.normal(0, 15, minutes))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) + rng.random(minutes) * 10
+    low = np.minimum(open_, close) - rng.random(minutes) * 10
+    volume = rng.random(minutes) * 50
+    quote_volume = volume * close
+    trades = rng.integers(100, 1000, minutes).astype(np.float64)
+    taker_volume = volume * 0.5
+    taker_quote_volume = quote_volume * 0.5
+
+    data = np.column_stack([
+        epoch, open_, high, low, close, volume, quote_volume, trades, taker_volume, taker_quote_volume
+    ])
+    return [tuple(row) for row in np.round(data, 8).tolist()]
+
+
+def rows_to_orm_like(rows: List[Tuple]) -> List[SimpleNamespace]:
+    """将数据行转换为与ORM实体字段相同的对象（Decimal价格），模拟原有实现的输入"""
+    klines = []
+    for row in rows:
+        open_time = datetime(1970, 1, 1) + timedelta(seconds=row[0])
+        klines.append(SimpleNamespace(
+            timestamp=int(row[0] * 1000),
+            open_time=open_time,
+            open_price=Decimal(str(row[1])),
+            high_price=Decimal(str(row[2])),
+            low_price=Decimal(str(row[3])),
+            close_price=Decimal(str(row[4])),
+            volume=Decimal(str(row[5])),
+            quote_volume=Decimal(str(row[6])),
+            trades_count=int(row[7]),
+            taker_buy_volume=Decimal(str(row[8])),
+            taker_buy_quote_volume=Decimal(str(row[9]))
+        ))
+    return klines
+
+
+def timed(func: Callable, repeat: int) -> Tuple[float, object]:
+    """执行 repeat 次，返回最短耗时（秒）和最后一次结果"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - begin)
+    return best, result
+
+
+def run_benchmark(days: int, timeframe: str, repeat: int) -> None:
+    aggregator = KlineAggregator()
+    interval_minutes = aggregator.TIMEFRAMES[timeframe]
+    rows = generate_rows(days * 1440)
+    orm_klines = rows_to_orm_like(rows)
+
+    def pandas_path():
+        df = aggregator._klines_to_dataframe(orm_klines)
+        return aggregator._dataframe_to_dict_list(aggregator._aggregate_dataframe(df, interval_minutes))
+
+    def numpy_path():
+        return aggregate_columns(KlineColumns.from_rows(rows), interval_minutes).to_dict_list()
+
+    pandas_time, pandas_result = timed(pandas_path, repeat)
+    numpy_time, numpy_result = timed(numpy_path, repeat)
+
+    # 校验结果一致（浮点求和顺序不同，数值按相对误差比较）
+    assert len(pandas_result) == len(numpy_result), "聚合结果条数不一致"
+    for key in ('timestamp', 'open_time', 'close_time', 'trades_count'):
+        assert [k[key] for k in pandas_result] == [k[key] for k in numpy_result], f"字段 {key} 不一致"
+    for key in ('open_price', 'high_price', 'low_price', 'close_price', 'volume', 'quote_volume'):
+        expected = np.array([float(k[key]) for k in pandas_result])
+        actual = np.array([float(k[key]) for k in numpy_result])
+        assert np.allclose(expected, actual, rtol=1e-12), f"字段 {key} 不一致"
+
+    print(f"📊 {len(rows)} 条1分钟K线 -> {len(numpy_result)} 条 {timeframe} K线 (最佳 {repeat} 次)")
+    print(f"   pandas: {pandas_time * 1000:10.2f} ms")
+    print(f"   numpy : {numpy_time * 1000:10.2f} ms")
+    print(f"   加速比: {pandas_time / numpy_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='K线聚合性能基准')
+    parser.add_argument('--days', type=int, default=365, help='合成数据的天数')
+    parser.add_argument('--timeframe', type=str, default='1d', help='目标时间周期')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    args = parser.parse_args()
+
+    run_benchmark(args.days, args.timeframe, args.repeat)
@@ -0,0 +1,22 @@
+"""
+单独运行K线实时写入
+
+python -m app.scripts.run_kline_stream
+
+API 以多个 worker 运行时，实时写入应只在一个独立进程中运行（每个 worker 都写入虽然幂等，但会重复请求）。
+"""
+import asyncio
+
+from app.core.logger import app_logger
+from app.services.kline_stream import kline_stream
+
+
+def main():
+    try:
+        asyncio.run(kline_stream.run())
+    except KeyboardInterrupt:
+        app_logger.info("⏹️ 用户中断K线实时写入")
+
+
+if __name__ == "__main__":
+    main()
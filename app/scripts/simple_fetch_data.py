@@ -4,16 +4,15 @@ import certifi
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3 import poolmanager
-import pandas as pd
 from datetime import datetime, timedelta
 import time
-import ssl
-from decimal import Decimal
 from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
 from app.core.config import settings
 from app.core.logger import app_logger
-from app.models.kline import BtcUsdtKline
+from app.services.kline_backfill import kline_backfill
+from app.services.kline_ingest import OHLCV_UPDATE_COLUMNS, kline_ingest_writer
+from app.utils.kline_columnar import KlineColumns
 
 
 def create_ssl_context():
@@ -153,126 +152,40 @@ class SimpleBinanceDataFetcher:
         """
         保存K线数据到数据库
 
+        按开盘时间幂等写入（INSERT ... ON CONFLICT (open_time) DO UPDATE），不再逐条查询是否已存在：
+        冲突时只比较和覆盖 OHLCV 列（OHLCV_UPDATE_COLUMNS），重复抓取的已收盘K线不会被改写，
+        实时流、补数写入的真实成交额/成交笔数/主动买入量保持不变；
+        抓取时尚未收盘的最新一根K线在下次抓取时原地更新开高低收和成交量。
+
         Args:
             db: 数据库会话
             klines_data: K线数据列表 [timestamp, open, high, low, close, volume]
 
         Returns:
-            int: 成功保存的数据条数
+            int: 新写入或更新的数据条数
         """
-        saved_count = 0
-        skipped_count = 0
-        error_count = 0
-
         app_logger.info(f"💾 开始保存 {len(klines_data)} 条K线数据到数据库...")
 
-        # 批量处理，每批1000条
-        batch_size = 1000
-        total_batches = (len(klines_data) + batch_size - 1) // batch_size
-
-        for batch_idx in range(total_batches):
-            start_idx = batch_idx * batch_size
-            end_idx = min((batch_idx + 1) * batch_size, len(klines_data))
-            batch_data = klines_data[start_idx:end_idx]
-
-            app_logger.info(f"📦 处理批次 {batch_idx + 1}/{total_batches}: {len(batch_data)} 条数据")
+        if not klines_data:
+            return 0
 
-            for kline in batch_data:
-                try:
-                    timestamp = kline[0]
-
-                    # 检查数据是否已存在（避免重复）
-                    existing = db.query(BtcUsdtKline).filter(
-                        BtcUsdtKline.timestamp == timestamp
-                    ).first()
-
-                    if existing:
-                        skipped_count += 1
-                        continue
-
-                    # 验证数据完整性
-                    if not self._validate_kline_data(kline):
-                        app_logger.warning(f"⚠️ 数据验证失败，跳过: {kline}")
-                        error_count += 1
-                        continue
-
-                    # 创建新的K线记录
-                    kline_obj = BtcUsdtKline(
-                        timestamp=timestamp,
-                        open_time=datetime.fromtimestamp(timestamp / 1000),
-                        close_time=datetime.fromtimestamp(timestamp / 1000) + timedelta(minutes=1),
-                        open_price=Decimal(str(kline[1])),
-                        high_price=Decimal(str(kline[2])),
-                        low_price=Decimal(str(kline[3])),
-                        close_price=Decimal(str(kline[4])),
-                        volume=Decimal(str(kline[5])),
-                        quote_volume=Decimal(str(kline[5] * kline[4])),  # 计算成交额
-                        trades_count=0,  # 1分钟数据不包含此字段，设为0
-                        taker_buy_volume=Decimal(str(kline[5] * 0.5)),  # 估算值
-                        taker_buy_quote_volume=Decimal(str(kline[5] * kline[4] * 0.5)),  # 估算值
-                    )
-
-                    db.add(kline_obj)
-                    saved_count += 1
-
-                except Exception as e:
-                    app_logger.error(f"❌ 保存单条数据失败: {str(e)}")
-                    error_count += 1
-                    continue
-
-            # 每批次提交一次
-            try:
-                db.commit()
-                app_logger.info(f"✅ 批次 {batch_idx + 1} 提交成功")
-            except Exception as e:
-                app_logger.error(f"❌ 批次 {batch_idx + 1} 提交失败: {str(e)}")
-                db.rollback()
-                continue
+        try:
+            columns = KlineColumns.from_ohlcv(klines_data)
+            result = kline_ingest_writer.write(
+                db, 'btc_usdt', columns, update_existing=True, update_columns=OHLCV_UPDATE_COLUMNS
+            )
+        except Exception as e:
+            app_logger.error(f"❌ 保存K线数据失败: {str(e)}")
+            return 0
 
         # 最终统计
         app_logger.info(f"📊 数据保存完成:")
-        app_logger.info(f"   ✅ 成功保存: {saved_count} 条")
-        app_logger.info(f"   ⏭️ 跳过重复: {skipped_count} 条")
-        app_logger.info(f"   ❌ 保存失败: {error_count} 条")
+        app_logger.info(f"   ✅ 新增: {result.rows_inserted} 条")
+        app_logger.info(f"   🔄 更新: {result.rows_updated} 条")
+        app_logger.info(f"   ⏭️ 已存在且未变化: {result.rows_skipped} 条")
+        app_logger.info(f"   ❌ 校验失败: {result.rows_rejected} 条 {result.rejected_reasons or ''}")
 
-        return saved_count
-
-    def _validate_kline_data(self, kline: list) -> bool:
-        """验证K线数据的有效性"""
-        try:
-            if len(kline) < 6:
-                return False
-
-            timestamp, open_price, high_price, low_price, close_price, volume = kline[:6]
-
-            # 检查时间戳
-            if not isinstance(timestamp, (int, float)) or timestamp <= 0:
-                return False
-
-            # 检查价格数据
-            prices = [open_price, high_price, low_price, close_price]
-            for price in prices:
-                if not isinstance(price, (int, float)) or price <= 0:
-                    return False
-
-            # 检查价格逻辑关系
-            if high_price < low_price:
-                return False
-
-            if not (low_price <= open_price <= high_price):
-                return False
-
-            if not (low_price <= close_price <= high_price):
-                return False
-
-            # 检查成交量
-            if not isinstance(volume, (int, float)) or volume < 0:
-                return False
-
-            return True
-
-        except Exception:
-            return False
+        return result.rows_written
 
     def get_market_info(self, symbol: str = 'BTC/USDT') -> dict:
         """获取市场信息"""
@@ -306,39 +219,28 @@ class SimpleBinanceDataFetcher:
 
 def fetch_historical_data(days: int = 30) -> bool:
     """
-    获取历史数据
+    补齐最近几天的历史数据
+
+    根据覆盖索引找出数据库中缺失的分钟区间，只抓取这些区间（分片并发、共享请求权重限额）。
 
     Args:
-        days: 获取最近几天的数据
+        days: 检查最近几天的数据
 
     Returns:
         bool: 是否成功
     """
     try:
-        fetcher = SimpleBinanceDataFetcher()
-
-        # 测试连接
-        if not fetcher.test_connection():
-            app_logger.error("❌ 币安API连接失败")
-            return False
-
-        # 按天分批获取，避免一次获取过多数据
-        success_count = 0
+        end_ms = int(time.time() * 1000)
+        start_ms = end_ms - days * 24 * 60 * 60 * 1000
+        app_logger.info(f"📅 检查最近 {days} 天的数据缺口...")
 
-        for day in range(days):
-            start_day = days - day - 1  # 从最早的一天开始
-            app_logger.info(f"📅 获取第 {day + 1}/{days} 天的数据...")
+        result = kline_backfill.run('btc_usdt', start_ms, end_ms, only_missing=True)
 
-            success = fetcher.fetch_recent_data(hours=24)  # 每次获取24小时
-            if success:
-                success_count += 1
-
-            # 休息一下，避免API限制
-            if day < days - 1:  # 不是最后一天
-                time.sleep(2)
-
-        app_logger.info(f"🎉 历史数据获取完成！成功获取 {success_count}/{days} 天的数据")
-        return success_count > 0
+        app_logger.info(
+            f"🎉 历史数据补齐完成！{result.shards_completed}/{result.shards_total} 个分片，"
+            f"写入 {result.ingest.rows_inserted} 条"
+        )
+        return result.success
 
     except Exception as e:
         app_logger.error(f"❌ 获取历史数据失败: {str(e)}")
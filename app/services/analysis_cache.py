@@ -0,0 +1,271 @@
+"""
+缠论分析结果缓存
+
+同一组K线的分析结果在进程内复用，仪表盘连续请求 /chan/analyze、/chan/summary、/chan/fenxings、
+/chan/chart-data 时只计算一次：
+- 键：分析类型、品种、周期、窗口起点和长度、最新已收盘K线时间戳、配置哈希；
+  结果依赖未收盘K线的分析（ChanMultiLevelStrategy）还会带上最后一根K线的高/低/收
+- 同一（分析类型, 品种, 周期, 窗口长度, 配置）只保留最新的一条：新K线收盘后写入新结果时淘汰旧结果
+- 已缓存窗口内的K线被修正或回补时（kline_ingest 写入早于最新收盘K线的数据），invalidate_since 清除受影响的结果
+- 品种统一为表名前缀格式（BTC/USDT -> btc_usdt），与写入侧的表名一致
+- 按条目数 LRU 淘汰
+- 其他进程（回补/抓取脚本、单独运行的实时流）写入的数据无法通知到 invalidate_since，
+  因此结果最多复用 max_age_seconds，超过后重新计算
+- 单飞（single-flight）：相同键的并发请求只有第一个执行计算，其余等待并共享结果；计算失败不缓存
+- 返回结果的深拷贝，调用方修改返回值不会影响缓存
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.utils.kline_columnar import MS_PER_MINUTE, TIMEFRAME_MINUTES, KlineColumns
+
+
+@dataclass(frozen=True)
+class AnalysisKey:
+    """分析结果缓存键"""
+    namespace: str
+    symbol: str
+    timeframe: str
+    window_start: int
+    window_size: int
+    last_closed: int
+    config_hash: str
+    live_bar: Optional[Tuple[int, float, float, float]] = None
+
+    @property
+    def stream(self) -> Tuple[str, str, str, int, str]:
+        """同一数据流（随新K线收盘滚动）的标识"""
+        return self.namespace, self.symbol, self.timeframe, self.window_size, self.config_hash
+
+
+def normalize_symbol(symbol: str) -> str:
+    """品种名 -> 表名前缀格式（BTC/USDT、BTC_USDT -> btc_usdt）"""
+    return symbol.lower().replace('/', '_')
+
+
+def config_hash(*parts: Any) -> str:
+    """配置内容的短哈希（键排序后序列化，值不可序列化时取 str）"""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def make_key(
+        namespace: str,
+        symbol: str,
+        timeframe: str,
+        klines: List[Dict],
+        interval_ms: int,
+        config_digest: str,
+        include_live_bar: bool = False,
+        now_ms: Optional[int] = None
+) -> AnalysisKey:
+    """
+    由K线窗口构建缓存键
+
+    Args:
+        klines: 升序K线（非空）
+        interval_ms: 周期毫秒数，开盘时间 + 周期不晚于当前时间的K线视为已收盘
+        include_live_bar: 分析结果是否依赖未收盘的最后一根K线（是则把它的价格加入键）
+    """
+    last = klines[-1]
+    return _build_key(
+        namespace, symbol, timeframe, config_digest,
+        window_start=int(klines[0]['timestamp']),
+        window_size=len(klines),
+        previous_timestamp=int(klines[-2]['timestamp']) if len(klines) > 1 else -1,
+        last_bar=(int(last['timestamp']), float(last['high_price']), float(last['low_price']),
+                  float(last['close_price'])),
+        interval_ms=interval_ms,
+        include_live_bar=include_live_bar,
+        now_ms=now_ms
+    )
+
+
+def make_columns_key(
+        namespace: str,
+        symbol: str,
+        timeframe: str,
+        columns: KlineColumns,
+        config_digest: str,
+        include_live_bar: bool = False,
+        now_ms: Optional[int] = None
+) -> AnalysisKey:
+    """由列式K线窗口（非空）构建缓存键，与相同数据的 make_key 结果相同"""
+    return _build_key(
+        namespace, symbol, timeframe, config_digest,
+        window_start=int(columns.timestamp[0]),
+        window_size=len(columns),
+        previous_timestamp=int(columns.timestamp[-2]) if len(columns) > 1 else -1,
+        last_bar=(int(columns.timestamp[-1]), float(columns.high[-1]), float(columns.low[-1]),
+                  float(columns.close[-1])),
+        interval_ms=columns.interval_minutes * MS_PER_MINUTE,
+        include_live_bar=include_live_bar,
+        now_ms=now_ms
+    )
+
+
+def _build_key(
+        namespace: str,
+        symbol: str,
+        timeframe: str,
+        config_digest: str,
+        window_start: int,
+        window_size: int,
+        previous_timestamp: int,
+        last_bar: Tuple[int, float, float, float],
+        interval_ms: int,
+        include_live_bar: bool,
+        now_ms: Optional[int]
+) -> AnalysisKey:
+    """last_bar 为最后一根K线的（开盘时间, 高, 低, 收），previous_timestamp 为倒数第二根的开盘时间（没有时为 -1）"""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    last_timestamp = last_bar[0]
+    live = last_timestamp + interval_ms > now_ms
+    return AnalysisKey(
+        namespace=namespace,
+        symbol=normalize_symbol(symbol),
+        timeframe=timeframe,
+        window_start=window_start,
+        window_size=window_size,
+        last_closed=previous_timestamp if live else last_timestamp,
+        config_hash=config_digest,
+        live_bar=last_bar if live and include_live_bar else None
+    )
+
+
+class AnalysisResultCache:
+    """分析结果 LRU 缓存（带单飞）"""
+
+    def __init__(self, max_entries: int = 256, max_age_seconds: Optional[float] = settings.ANALYSIS_CACHE_DURATION):
+        self.max_entries = max_entries
+        # 结果的最长复用时间，为空时只依赖本进程写入时的清除
+        self.max_age_seconds = max_age_seconds
+        # 键 -> (结果, 计算完成时间 time.monotonic)
+        self._entries: "OrderedDict[AnalysisKey, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[AnalysisKey, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.superseded = 0
+        self.expirations = 0
+
+    def get_or_compute(self, key: AnalysisKey, compute: Callable[[], Any]) -> Any:
+        """命中时返回缓存结果；否则计算（相同键的并发调用只计算一次）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not owner:
+            return copy.deepcopy(future.result())
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._supersede(key)
+            self._entries[key] = (value, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        future.set_result(value)
+        return copy.deepcopy(value)
+
+    def invalidate(self, symbol: Optional[str] = None, timeframe: Optional[str] = None) -> None:
+        """清除指定品种 / 周期（或全部）的缓存结果"""
+        symbol = normalize_symbol(symbol) if symbol is not None else None
+        with self._lock:
+            for key in [key for key in self._entries
+                        if (symbol is None or key.symbol == symbol)
+                        and (timeframe is None or key.timeframe == timeframe)]:
+                del self._entries[key]
+
+    def invalidate_since(self, symbol: str, timestamp: int) -> int:
+        """
+        清除依赖 timestamp（毫秒）之后K线的结果：最新收盘K线的开盘时间不早于 timestamp 的窗口
+
+        timestamp 落在某根已收盘K线的周期内时，该K线的开盘时间不晚于 timestamp 但聚合值已变化，
+        因此按周期比较：last_closed + 周期 > timestamp 即受影响。返回清除的条数。
+        """
+        symbol = normalize_symbol(symbol)
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key.symbol == symbol and key.last_closed >= 0
+                and key.last_closed + TIMEFRAME_MINUTES.get(key.timeframe, 1) * MS_PER_MINUTE > timestamp
+            ]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            app_logger.info(f"🧹 {symbol} 修正/回补了已缓存窗口内的K线，清除 {len(stale)} 条分析结果")
+        return len(stale)
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses + self.shared
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_inflight": self.shared,
+                "hit_rate": round((self.hits + self.shared) / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "superseded": self.superseded,
+                "expirations": self.expirations,
+                "max_age_seconds": self.max_age_seconds,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "inflight": len(self._inflight)
+            }
+
+    def _expired(self, entry: Tuple[Any, float]) -> bool:
+        return self.max_age_seconds is not None and time.monotonic() - entry[1] > self.max_age_seconds
+
+    def _supersede(self, key: AnalysisKey) -> None:
+        """同一数据流只保留最新结果：新K线收盘（或未收盘K线变化）后淘汰旧结果（调用方持有锁）"""
+        stale = [
+            old for old in self._entries
+            if old.stream == key.stream and (
+                old.last_closed < key.last_closed
+                or (old.last_closed == key.last_closed and old.live_bar != key.live_bar)
+            )
+        ]
+        for old in stale:
+            del self._entries[old]
+        if stale:
+            self.superseded += len(stale)
+            app_logger.debug(f"分析缓存淘汰 {len(stale)} 条旧结果: {key.namespace} {key.symbol} {key.timeframe}")
+
+
+# 创建全局实例
+analysis_cache = AnalysisResultCache()
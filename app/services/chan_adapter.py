@@ -0,0 +1,527 @@
+"""
+缠论引擎适配器（chan.py）
+
+把K线（kline_aggregator 输出的字典，或列式 KlineColumns）转换为 CKLine_Unit，通过 CChan.trigger_load
+喂给 chan.py 引擎，结果（分型、笔、线段、中枢、买卖点）转换为接口使用的标准JSON结构：
+- 每个（品种, 时间周期）保留一个预热好的 CChan 实例（LRU），配置开启 trigger_step，
+  每根新K线到来时引擎增量更新笔、线段、中枢和买卖点，请求之间只推送上次之后新收盘的K线
+- 尚未收盘的最后一根K线不推送（chan.py 不支持修改已输入的K线），收盘后的请求再推送
+- 请求窗口比缓存实例更早、与缓存之间有缺口，或实例累计超过 max_bars 根K线时重新创建实例
+- 返回结果只包含在请求窗口内结束的结构；缓存实例保留了窗口之前的历史，起点附近的笔/线段更完整
+- chan.py 不可用或分析出错时，退回 ChanMultiLevelStrategy 的简化分型/笔识别
+- 标准化结果经 analysis_cache 按窗口和最新收盘K线缓存，多个接口请求同一窗口时只分析一次
+- 已推送给实例的K线被修正或回补时（kline_ingest 调用 invalidate_since），丢弃受影响的实例和结果；
+  注册的监听器（add_invalidation_listener）同时收到通知，用于让其他进程中的实例同样失效
+
+chan.py 作为子模块放在项目根目录（git submodule update --init）。
+"""
+import calendar
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.logger import app_logger
+from app.services.analysis_cache import AnalysisKey, analysis_cache, config_hash, make_columns_key, normalize_symbol
+from app.services.chan_strategy import CHAN_CONFIG, CHAN_MODULE_AVAILABLE, chan_strategy
+from app.utils.fenxing import find_fenxings
+from app.utils.kline_columnar import MS_PER_MINUTE, TIMEFRAME_MINUTES, KlineColumns
+
+try:
+    # chan_strategy 已将 chan.py 目录加入 sys.path
+    from Chan import CChan
+    from ChanConfig import CChanConfig
+    from Common.CEnum import AUTYPE, BI_DIR, DATA_FIELD, DATA_SRC, FX_TYPE, KL_TYPE
+    from Common.CTime import CTime
+    from KLine.KLine_Unit import CKLine_Unit
+    CHAN_ENGINE_AVAILABLE = CHAN_MODULE_AVAILABLE
+except ImportError:
+    CHAN_ENGINE_AVAILABLE = False
+
+# chan.py 的级别枚举只用作单级别分析的标签，没有对应枚举的周期（4h）使用最接近的小时级别
+_KL_TYPE_NAMES = {
+    '1m': 'K_1M', '5m': 'K_5M', '15m': 'K_15M', '30m': 'K_30M',
+    '1h': 'K_60M', '4h': 'K_60M', '1d': 'K_DAY',
+}
+
+# 趋势判断使用的K线数（与 ChanMultiLevelStrategy._analyze_trend 一致）
+_TREND_BARS = 10
+
+# 失效通知：(品种, 周期, 起始毫秒时间戳)，品种/周期为 None 表示全部，起始时间为 None 表示整体失效
+InvalidationListener = Callable[[Optional[str], Optional[str], Optional[int]], None]
+
+_SUGGESTIONS = {
+    'up': "趋势向上，可考虑逢低建仓，注意风险控制",
+    'down': "趋势向下，建议观望或逢高减仓",
+    'neutral': "震荡整理，等待方向明确后再操作",
+}
+
+
+@dataclass
+class _ChanEntry:
+    """缓存中的 CChan 实例及其已输入的K线范围"""
+    chan: Any
+    first_timestamp: int
+    last_timestamp: int
+    bar_count: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ChanAdapter:
+    """chan.py 引擎适配器（按品种和周期缓存预热的 CChan 实例）"""
+
+    def __init__(self, cache_size: int = 16, max_bars: int = 5000):
+        self.cache_size = cache_size
+        # 单个实例累计K线上限，超过后以当前窗口重新创建，限制内存和线段计算量
+        self.max_bars = max_bars
+        self._entries: "OrderedDict[Tuple[str, str], _ChanEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.fallbacks = 0
+        self.config_hash = config_hash(CHAN_CONFIG, CHAN_ENGINE_AVAILABLE)
+        self._listeners: List[InvalidationListener] = []
+
+    @property
+    def is_available(self) -> bool:
+        return CHAN_ENGINE_AVAILABLE
+
+    def get_chan_info(self) -> Dict[str, Any]:
+        """模块状态和实例缓存统计"""
+        return {
+            "is_available": self.is_available,
+            "module_loaded": CHAN_MODULE_AVAILABLE,
+            "supported_features": ["fenxing", "bi", "xianduan", "zhongshu", "buy_sell_points"]
+            if self.is_available else ["fenxing", "bi"],
+            "status": "ready" if self.is_available else "fallback",
+            "engine_mode": "trigger_step" if self.is_available else "simplified",
+            "cache": self.get_cache_statistics(),
+            "result_cache": analysis_cache.get_statistics(),
+            "integration_guide": {
+                "step1": "确保chan.py子模块已初始化: git submodule update --init",
+                "step2": "chan.py 目录需位于项目根目录（与 app 同级）",
+                "step3": "通过 /api/v1/chan/health 确认 analysis_capability 为 full"
+            }
+        }
+
+    def get_cache_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            instances = [
+                {"symbol": symbol, "timeframe": timeframe, "bars": entry.bar_count}
+                for (symbol, timeframe), entry in self._entries.items()
+            ]
+        return {
+            "capacity": self.cache_size,
+            "size": len(instances),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+            "fallbacks": self.fallbacks,
+            "instances": instances
+        }
+
+    def invalidate(self, symbol: Optional[str] = None, timeframe: Optional[str] = None) -> None:
+        """丢弃缓存的引擎实例和分析结果（数据被修正或回补后调用）"""
+        symbol = normalize_symbol(symbol) if symbol is not None else None
+        with self._lock:
+            for key in [k for k in self._entries
+                        if (symbol is None or k[0] == symbol) and (timeframe is None or k[1] == timeframe)]:
+                del self._entries[key]
+        analysis_cache.invalidate(symbol, timeframe)
+        self._notify(symbol, timeframe, None)
+
+    def invalidate_since(self, symbol: str, timestamp: int) -> None:
+        """
+        1分钟K线 timestamp（毫秒）及之后的数据被写入后调用：
+        丢弃已推送过该时间所在K线的引擎实例，以及依赖该时间之后K线的分析结果
+        """
+        symbol = normalize_symbol(symbol)
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if key[0] == symbol
+                and entry.last_timestamp + TIMEFRAME_MINUTES.get(key[1], 1) * MS_PER_MINUTE > timestamp
+            ]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            app_logger.info(f"🧹 {symbol} 已推送的K线被修正/回补，丢弃引擎实例: {[key[1] for key in stale]}")
+        analysis_cache.invalidate_since(symbol, timestamp)
+        self._notify(symbol, None, timestamp)
+
+    def add_invalidation_listener(self, listener: InvalidationListener) -> None:
+        """注册失效通知（invalidate / invalidate_since 之后调用）"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def _notify(self, symbol: Optional[str], timeframe: Optional[str], timestamp: Optional[int]) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(symbol, timeframe, timestamp)
+
+    # ------------------------------------------------------------------
+    # 分析
+    # ------------------------------------------------------------------
+
+    def analyze_klines(
+            self,
+            klines: List[Dict],
+            timeframe: Optional[str] = None,
+            symbol: str = "btc_usdt",
+            use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        缠论分析
+
+        Args:
+            klines: 升序K线（kline_aggregator 输出格式，价格为浮点数或字符串）
+            timeframe: 时间周期，为空时按相邻K线间隔推断
+            symbol: 品种（与 timeframe 一起作为引擎实例的缓存键）
+            use_cache: 是否复用相同窗口的分析结果（analysis_cache）
+        """
+        if not klines:
+            return {"error": "没有K线数据", **_empty_result()}
+
+        timeframe, interval_ms = _resolve_timeframe(klines, timeframe)
+        columns = _klines_to_columns(klines, interval_ms // MS_PER_MINUTE)
+        return self.analyze_columns(columns, timeframe=timeframe, symbol=symbol, use_cache=use_cache)
+
+    def analyze_columns(
+            self,
+            columns: KlineColumns,
+            timeframe: Optional[str] = None,
+            symbol: str = "btc_usdt",
+            use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        缠论分析（列式K线，interval_minutes 为周期），参数同 analyze_klines
+
+        只有新收盘的K线逐根构建 CKLine_Unit 推送给引擎，不再把整个窗口转换为字典。
+        """
+        if len(columns) == 0:
+            return {"error": "没有K线数据", **_empty_result()}
+
+        symbol = normalize_symbol(symbol)
+        timeframe = timeframe or _timeframe_name(columns.interval_minutes)
+        if not use_cache:
+            return self._analyze(columns, symbol, timeframe)
+        return analysis_cache.get_or_compute(
+            self.cache_key(columns, timeframe, symbol), lambda: self._analyze(columns, symbol, timeframe)
+        )
+
+    def cache_key(self, columns: KlineColumns, timeframe: str, symbol: str) -> AnalysisKey:
+        """analyze_columns / analyze_klines 使用的结果缓存键"""
+        # 引擎只使用已收盘K线；简化分析包含未收盘K线，其价格变化也要体现在键中
+        return make_columns_key(
+            'chan_adapter', symbol, timeframe, columns, self.config_hash, include_live_bar=not self.is_available
+        )
+
+    def _analyze(self, columns: KlineColumns, symbol: str, timeframe: str) -> Dict[str, Any]:
+        """缠论分析（不经过结果缓存）"""
+        if not self.is_available:
+            return self._fallback_analysis(columns)
+
+        interval_ms = columns.interval_minutes * MS_PER_MINUTE
+        try:
+            begin = time.perf_counter()
+            entry, cache_hit = self._get_entry(symbol, timeframe, interval_ms, int(columns.timestamp[0]))
+            with entry.lock:
+                pushed = self._push_closed(entry, columns, interval_ms)
+                result = self._standardize(entry.chan, columns)
+            result['analysis_summary'].update({
+                "engine_cache_hit": cache_hit,
+                "bars_pushed": pushed,
+                "engine_bars": entry.bar_count,
+                "elapsed_ms": round((time.perf_counter() - begin) * 1000, 2)
+            })
+            return result
+
+        except Exception as e:
+            app_logger.warning(f"⚠️ chan.py 分析失败，使用简化分析: {str(e)}")
+            self.invalidate(symbol, timeframe)
+            return self._fallback_analysis(columns)
+
+    def _get_entry(
+            self,
+            symbol: str,
+            timeframe: str,
+            interval_ms: int,
+            window_start: int
+    ) -> Tuple[_ChanEntry, bool]:
+        """取出缓存实例；不存在或不能衔接当前窗口（起点 window_start）时新建"""
+        key = (symbol, timeframe)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                reusable = (
+                    window_start >= entry.first_timestamp
+                    and window_start <= entry.last_timestamp + interval_ms
+                    and entry.bar_count < self.max_bars
+                )
+                if reusable:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, True
+                self.rebuilds += 1
+            else:
+                self.misses += 1
+
+            entry = _ChanEntry(
+                chan=_create_chan(symbol, timeframe),
+                first_timestamp=window_start,
+                last_timestamp=window_start - 1
+            )
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+            app_logger.info(f"🧠 创建 chan.py 引擎实例 {symbol} {timeframe}")
+            return entry, False
+
+    def _push_closed(self, entry: _ChanEntry, columns: KlineColumns, interval_ms: int) -> int:
+        """把实例中尚未包含且已收盘的K线逐根推送给引擎（trigger_step 模式下每根K线增量更新结构）"""
+        now_ms = int(time.time() * 1000)
+        timestamps = columns.timestamp
+        index = np.flatnonzero((timestamps > entry.last_timestamp) & (timestamps + interval_ms <= now_ms))
+        if index.size == 0:
+            return 0
+        kl_type = entry.chan.lv_list[0]
+        rows = zip(
+            timestamps[index].tolist(), columns.open[index].tolist(), columns.high[index].tolist(),
+            columns.low[index].tolist(), columns.close[index].tolist(), columns.volume[index].tolist()
+        )
+        for row in rows:
+            entry.chan.trigger_load({kl_type: [_to_kline_unit(*row)]})
+            entry.last_timestamp = row[0]
+            entry.bar_count += 1
+        return int(index.size)
+
+    # ------------------------------------------------------------------
+    # 结果转换
+    # ------------------------------------------------------------------
+
+    def _standardize(self, chan: "CChan", columns: KlineColumns) -> Dict[str, Any]:
+        """引擎结构 -> 标准JSON（只保留请求窗口内的结构）"""
+        window_start, window_end = int(columns.timestamp[0]), int(columns.timestamp[-1])
+        kl_list = chan[0]
+
+        def in_window(timestamp: int) -> bool:
+            return window_start <= timestamp <= window_end
+
+        fenxings = [fx for fx in _convert_fenxings(kl_list) if in_window(fx['timestamp'])]
+        bis = [bi for bi in map(_convert_line, kl_list.bi_list) if in_window(bi['end']['timestamp'])]
+        xianduan = [seg for seg in map(_convert_line, kl_list.seg_list) if in_window(seg['end']['timestamp'])]
+        zhongshu = [zs for zs in map(_convert_zs, kl_list.zs_list) if in_window(zs['end'])]
+        buy_sell_points = [bsp for bsp in map(_convert_bsp, chan.get_bsp()) if in_window(bsp['timestamp'])]
+
+        return _build_result(
+            columns, fenxings, bis, xianduan, zhongshu, buy_sell_points, data_source="chan_module"
+        )
+
+    def _fallback_analysis(self, columns: KlineColumns) -> Dict[str, Any]:
+        """简化分析：与 ChanMultiLevelStrategy 相同的分型和笔识别"""
+        self.fallbacks += 1
+        fenxings = find_fenxings(columns.high, columns.low).to_dict_list(columns.timestamp.tolist())
+        bis = chan_strategy._identify_bis(fenxings, [])
+        return _build_result(columns, fenxings, bis, [], [], [], data_source="fallback")
+
+
+def _create_chan(symbol: str, timeframe: str) -> "CChan":
+    """创建 trigger_step 模式的单级别 CChan 实例（不从数据源加载，K线由 trigger_load 推送）"""
+    config = CChanConfig({**CHAN_CONFIG, "trigger_step": True})
+    return CChan(
+        code=symbol,
+        begin_time=None,
+        end_time=None,
+        data_src=DATA_SRC.CSV,
+        lv_list=[getattr(KL_TYPE, _KL_TYPE_NAMES.get(timeframe, 'K_60M'))],
+        config=config,
+        autype=AUTYPE.NONE
+    )
+
+
+def _to_kline_unit(
+        timestamp: int,
+        open_price: float,
+        high_price: float,
+        low_price: float,
+        close_price: float,
+        volume: float
+) -> "CKLine_Unit":
+    """一根K线 -> CKLine_Unit（时间按UTC）"""
+    open_time = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+    return CKLine_Unit({
+        DATA_FIELD.FIELD_TIME: CTime(open_time.year, open_time.month, open_time.day, open_time.hour, open_time.minute),
+        DATA_FIELD.FIELD_OPEN: open_price,
+        DATA_FIELD.FIELD_HIGH: high_price,
+        DATA_FIELD.FIELD_LOW: low_price,
+        DATA_FIELD.FIELD_CLOSE: close_price,
+        DATA_FIELD.FIELD_VOLUME: volume,
+    }, autofix=True)
+
+
+def _klines_to_columns(klines: List[Dict], interval_minutes: int) -> KlineColumns:
+    """K线字典（价格为浮点数或字符串）-> 列式数据；分析不使用的成交额等列填0"""
+    def column(key: str) -> np.ndarray:
+        return np.array([kline.get(key) or 0 for kline in klines], dtype=np.float64)
+
+    zeros = np.zeros(len(klines))
+    return KlineColumns(
+        timestamp=np.array([int(kline['timestamp']) for kline in klines], dtype=np.int64),
+        open=column('open_price'),
+        high=column('high_price'),
+        low=column('low_price'),
+        close=column('close_price'),
+        volume=column('volume'),
+        quote_volume=zeros,
+        trades_count=np.zeros(len(klines), dtype=np.int64),
+        taker_buy_volume=zeros,
+        taker_buy_quote_volume=zeros,
+        interval_minutes=interval_minutes
+    )
+
+
+def _ctime_to_ms(ctime: "CTime") -> int:
+    """CTime（UTC 字段）-> 毫秒时间戳；不使用 CTime.ts，它按本地时区计算"""
+    return calendar.timegm((
+        ctime.year, ctime.month, ctime.day, ctime.hour, ctime.minute, getattr(ctime, 'second', 0)
+    )) * 1000
+
+
+def _convert_fenxings(kl_list) -> List[Dict]:
+    """合并K线上的顶/底分型，强度按中间K线振幅 / 三根平均振幅计算（同简化分析）"""
+    fenxings = []
+    for klc in kl_list.lst:
+        if klc.fx not in (FX_TYPE.TOP, FX_TYPE.BOTTOM) or klc.pre is None or klc.next is None:
+            continue
+        is_top = klc.fx == FX_TYPE.TOP
+        ranges = [k.high - k.low for k in (klc.pre, klc, klc.next)]
+        avg_range = sum(ranges) / 3
+        strength = ranges[1] / avg_range if avg_range > 0 else 1.0
+        fenxings.append({
+            'type': 'top' if is_top else 'bottom',
+            'timestamp': _ctime_to_ms(klc.get_peak_klu(is_high=is_top).time),
+            'price': klc.high if is_top else klc.low,
+            'index': klc.idx,
+            'strength': min(max(strength, 0.1), 3.0)
+        })
+    return fenxings
+
+
+def _convert_line(line) -> Dict:
+    """笔 / 线段 -> 起止点、方向、长度"""
+    start = {'timestamp': _ctime_to_ms(line.get_begin_klu().time), 'price': line.get_begin_val()}
+    end = {'timestamp': _ctime_to_ms(line.get_end_klu().time), 'price': line.get_end_val()}
+    return {
+        'start': start,
+        'end': end,
+        'direction': 'up' if line.dir == BI_DIR.UP else 'down',
+        'length': abs(end['price'] - start['price']),
+        'time_span': end['timestamp'] - start['timestamp'],
+        'is_sure': line.is_sure
+    }
+
+
+def _convert_zs(zs) -> Dict:
+    return {
+        'start': _ctime_to_ms(zs.begin.time),
+        'end': _ctime_to_ms(zs.end.time),
+        'high': zs.high,
+        'low': zs.low,
+        'peak_high': zs.peak_high,
+        'peak_low': zs.peak_low
+    }
+
+
+def _convert_bsp(bsp) -> Dict:
+    types = bsp.type2str()
+    return {
+        'timestamp': _ctime_to_ms(bsp.klu.time),
+        'price': bsp.klu.low if bsp.is_buy else bsp.klu.high,
+        'type': f"{'买' if bsp.is_buy else '卖'}点{types}",
+        'bsp_types': types.split(','),
+        'is_buy': bsp.is_buy
+    }
+
+
+def _build_result(
+        columns: KlineColumns,
+        fenxings: List[Dict],
+        bis: List[Dict],
+        xianduan: List[Dict],
+        zhongshu: List[Dict],
+        buy_sell_points: List[Dict],
+        data_source: str
+) -> Dict[str, Any]:
+    """组装标准结果：趋势沿用 ChanMultiLevelStrategy 的判断（sideways 记为 neutral）"""
+    trend_klines = [{'close_price': close} for close in columns.close[-_TREND_BARS:].tolist()]
+    trend_analysis = chan_strategy._analyze_trend(trend_klines, bis)
+    direction = trend_analysis.get('direction')
+    direction = direction if direction in ('up', 'down') else 'neutral'
+    strength = trend_analysis.get('strength', 0)
+
+    suggestion = _SUGGESTIONS[direction]
+    if buy_sell_points:
+        suggestion += f"；最近买卖点: {buy_sell_points[-1]['type']}"
+
+    return {
+        'fenxings': fenxings,
+        'bis': bis,
+        'xianduan': xianduan,
+        'zhongshu': zhongshu,
+        'buy_sell_points': buy_sell_points,
+        'trend': {'direction': direction, 'strength': strength},
+        'support_resistance': chan_strategy._analyze_support_resistance(fenxings),
+        'analysis_summary': {
+            'trend_direction': direction,
+            'trend_strength': strength,
+            'total_fenxings': len(fenxings),
+            'total_bis': len(bis),
+            'total_xianduan': len(xianduan),
+            'total_buy_sell_points': len(buy_sell_points),
+            'suggestion': suggestion,
+            'analysis_quality': 'good' if len(bis) >= 3 else 'limited',
+            'data_source': data_source
+        }
+    }
+
+
+def _empty_result() -> Dict[str, Any]:
+    return {
+        'fenxings': [], 'bis': [], 'xianduan': [], 'zhongshu': [], 'buy_sell_points': [],
+        'trend': {'direction': 'neutral', 'strength': 0},
+        'analysis_summary': {'total_fenxings': 0, 'total_bis': 0, 'analysis_quality': 'unknown',
+                             'data_source': 'none'}
+    }
+
+
+def _resolve_timeframe(klines: List[Dict], timeframe: Optional[str]) -> Tuple[str, int]:
+    """确定周期和周期毫秒数；未指定时按相邻K线的最小间隔推断"""
+    if timeframe in TIMEFRAME_MINUTES:
+        return timeframe, TIMEFRAME_MINUTES[timeframe] * MS_PER_MINUTE
+    timestamps = [int(k['timestamp']) for k in klines[:50]]
+    gaps = [b - a for a, b in zip(timestamps, timestamps[1:]) if b > a]
+    interval_ms = min(gaps) if gaps else MS_PER_MINUTE
+    for name, minutes in TIMEFRAME_MINUTES.items():
+        if minutes * MS_PER_MINUTE == interval_ms:
+            return name, interval_ms
+    return timeframe or f"{interval_ms // MS_PER_MINUTE}m", interval_ms
+
+
+def _timeframe_name(interval_minutes: int) -> str:
+    """周期分钟数 -> 周期名称"""
+    for name, minutes in TIMEFRAME_MINUTES.items():
+        if minutes == interval_minutes:
+            return name
+    return f"{interval_minutes}m"
+
+
+# 创建全局实例
+chan_adapter = ChanAdapter()
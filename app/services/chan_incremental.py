@@ -0,0 +1,301 @@
+"""
+缠论增量分析
+
+按（品种, 时间周期）维护分型 -> 笔 -> 趋势的状态，每根K线只做常数次计算，不再对整个窗口重新识别：
+- on_bar: 追加一根新K线，确认上一根K线的分型，并以最新K线为右侧判断倒数第二根是否构成分型
+- on_bar_update: 更新最后一根（未收盘）K线；依赖它的那个分型先撤销再重新判断
+- on_minute_bar: 输入1分钟K线，按纪元对齐的周期桶合并为当前周期的K线后更新，
+  供 WebSocket 实时流（KlineStreamIngester）驱动各周期的分析
+- 分型、笔只保留最近一段（max_fenxings / max_bis），趋势只需要最近 10 根K线和最近 3 笔
+
+分型、笔、趋势、市场阶段和信号的规则与 ChanMultiLevelStrategy 完全一致（直接复用其方法）；
+分型 index 为分析器启动以来的K线序号。支撑阻力位只在保留的分型范围内计算。
+"""
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.logger import app_logger
+from app.services.chan_strategy import ChanMultiLevelStrategy, chan_strategy
+from app.utils.fenxing import FENXING_TOP, classify_fenxing
+from app.utils.kline_columnar import MS_PER_MINUTE, TIMEFRAME_MINUTES
+
+# 趋势判断使用的K线数和笔数（与 ChanMultiLevelStrategy._analyze_trend 一致）
+_TREND_BARS = 10
+_TREND_BIS = 3
+
+
+class IncrementalChanAnalyzer:
+    """单个（品种, 时间周期）的缠论增量分析状态"""
+
+    def __init__(
+            self,
+            symbol: str,
+            timeframe: str,
+            max_fenxings: int = 200,
+            max_bis: int = 200,
+            strategy: ChanMultiLevelStrategy = chan_strategy
+    ):
+        if timeframe not in TIMEFRAME_MINUTES:
+            raise ValueError(f"不支持的时间周期: {timeframe}")
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.interval_ms = TIMEFRAME_MINUTES[timeframe] * MS_PER_MINUTE
+        self.strategy = strategy
+
+        self._bars: deque = deque(maxlen=_TREND_BARS)
+        self._fenxings: deque = deque(maxlen=max_fenxings)
+        self._bis: deque = deque(maxlen=max_bis)
+        # 最新一个分型是否以最后一根（可能变化的）K线为右侧，是则在 on_bar_update 时需要重新判断
+        self._provisional = False
+        self._bar_count = 0
+        self.fenxing_total = 0
+        self.bi_total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """已处理的K线数量"""
+        return self._bar_count
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        return self._bars[-1]['timestamp'] if self._bars else None
+
+    # ------------------------------------------------------------------
+    # K线输入
+    # ------------------------------------------------------------------
+
+    def warm_up(self, klines: List[Dict]) -> Dict:
+        """用历史K线（升序）初始化状态"""
+        for kline in klines:
+            self.on_bar(kline)
+        return self.get_state()
+
+    def on_bar(self, bar: Dict) -> Dict:
+        """
+        追加一根新K线（字典格式同 kline_aggregator 输出，价格可以是字符串或浮点数）
+
+        与最后一根K线时间戳相同时按 on_bar_update 处理，更早的K线忽略。
+        """
+        bar = _normalize_bar(bar)
+        with self._lock:
+            self._push(bar)
+            return self._state()
+
+    def on_bar_update(self, bar: Dict) -> Dict:
+        """更新最后一根K线（时间戳与最后一根不同时按 on_bar 处理）"""
+        return self.on_bar(bar)
+
+    def on_minute_bar(self, bar: Dict) -> Dict:
+        """输入1分钟K线，合并到所属周期桶后更新状态"""
+        bar = _normalize_bar(bar)
+        bucket = bar['timestamp'] - bar['timestamp'] % self.interval_ms
+        with self._lock:
+            current = self._bars[-1] if self._bars else None
+            if current is not None and current['timestamp'] == bucket and self.interval_ms > MS_PER_MINUTE:
+                # 同一分钟的多次推送中最高价只增不减、最低价只减不增，按最值合并是幂等的
+                bar = {
+                    'timestamp': bucket,
+                    'high_price': max(current['high_price'], bar['high_price']),
+                    'low_price': min(current['low_price'], bar['low_price']),
+                    'close_price': bar['close_price']
+                }
+            else:
+                bar['timestamp'] = bucket
+            self._push(bar)
+            return self._state()
+
+    # ------------------------------------------------------------------
+    # 状态输出
+    # ------------------------------------------------------------------
+
+    def get_state(self) -> Dict:
+        """轻量状态：最新分型、最新笔、趋势和市场阶段"""
+        with self._lock:
+            return self._state()
+
+    def get_analysis(self, include_signals: bool = True) -> Dict[str, Any]:
+        """
+        与 ChanMultiLevelStrategy._execute_chan_analysis 结构相同的分析结果（分型、笔为保留的最近一段）
+
+        include_signals 为 True 时附带交易信号和建议。
+        """
+        with self._lock:
+            fenxings = list(self._fenxings)
+            bis = list(self._bis)
+            state = self._state()
+
+        analysis = {
+            'fenxings': fenxings,
+            'bis': bis,
+            'trend_analysis': state.pop('trend_analysis'),
+            'support_resistance': self.strategy._analyze_support_resistance(fenxings),
+            'market_structure': {
+                'trend_direction': state['trend_direction'],
+                'trend_strength': state['trend_strength'],
+                'current_phase': state['current_phase']
+            }
+        }
+        result = {'analysis': analysis, 'state': state}
+        if include_signals:
+            signals = self.strategy._generate_trading_signals(analysis, self.timeframe)
+            result['signals'] = [signal.to_dict() for signal in signals]
+            result['recommendation'] = self.strategy._generate_recommendation(signals)
+        return result
+
+    # ------------------------------------------------------------------
+    # 内部实现（调用方持有 self._lock）
+    # ------------------------------------------------------------------
+
+    def _push(self, bar: Dict) -> None:
+        last = self._bars[-1]['timestamp'] if self._bars else None
+        if last is not None and bar['timestamp'] < last:
+            return
+        if bar['timestamp'] == last:
+            # 最后一根K线变化：以它为右侧的待定分型先撤销再重新判断
+            self._bars[-1] = bar
+            if self._provisional:
+                self._retract_last_fenxing()
+        else:
+            self._bars.append(bar)
+            self._bar_count += 1
+            # 上一个待定分型的右侧K线已经确定
+            self._provisional = False
+        self._evaluate_last_fenxing()
+
+    def _evaluate_last_fenxing(self) -> None:
+        """以最后一根K线为右侧，判断倒数第二根K线是否构成分型"""
+        if len(self._bars) < 3:
+            return
+        prev_bar, curr_bar, next_bar = self._bars[-3], self._bars[-2], self._bars[-1]
+        found = classify_fenxing(
+            prev_bar['high_price'], prev_bar['low_price'],
+            curr_bar['high_price'], curr_bar['low_price'],
+            next_bar['high_price'], next_bar['low_price']
+        )
+        if found is None:
+            return
+
+        kind, price, strength = found
+        fenxing = {
+            'type': 'top' if kind == FENXING_TOP else 'bottom',
+            'timestamp': curr_bar['timestamp'],
+            'price': price,
+            'index': self._bar_count - 2,
+            'strength': strength
+        }
+        previous = self._fenxings[-1] if self._fenxings else None
+        self._fenxings.append(fenxing)
+        self.fenxing_total += 1
+        self._provisional = True
+
+        # 相邻分型类型不同即构成一笔（规则同 ChanMultiLevelStrategy._identify_bis）
+        if previous is not None and previous['type'] != fenxing['type']:
+            self._bis.append({
+                'start': previous,
+                'end': fenxing,
+                'direction': 'up' if previous['type'] == 'bottom' else 'down',
+                'length': abs(fenxing['price'] - previous['price']),
+                'time_span': fenxing['timestamp'] - previous['timestamp'],
+                'bars_count': abs(fenxing['index'] - previous['index'])
+            })
+            self.bi_total += 1
+
+    def _retract_last_fenxing(self) -> None:
+        """撤销待定分型及以它为终点的笔"""
+        fenxing = self._fenxings.pop()
+        self.fenxing_total -= 1
+        if self._bis and self._bis[-1]['end'] is fenxing:
+            self._bis.pop()
+            self.bi_total -= 1
+        self._provisional = False
+
+    def _state(self) -> Dict:
+        """当前状态（趋势只依赖最近 10 根K线和最近 3 笔，常数时间）"""
+        bars = list(self._bars)
+        recent_bis = [self._bis[i] for i in range(-min(len(self._bis), _TREND_BIS), 0)]
+        trend_analysis = self.strategy._analyze_trend(bars, recent_bis)
+        return {
+            'symbol': self.symbol,
+            'timeframe': self.timeframe,
+            'bars_processed': self._bar_count,
+            'last_timestamp': bars[-1]['timestamp'] if bars else None,
+            'last_price': bars[-1]['close_price'] if bars else None,
+            'fenxing_count': self.fenxing_total,
+            'bi_count': self.bi_total,
+            'last_fenxing': self._fenxings[-1] if self._fenxings else None,
+            'last_fenxing_confirmed': not self._provisional,
+            'last_bi': recent_bis[-1] if recent_bis else None,
+            'trend_direction': trend_analysis.get('direction'),
+            'trend_strength': trend_analysis.get('strength'),
+            'current_phase': self.strategy._determine_market_phase(recent_bis),
+            'trend_analysis': trend_analysis
+        }
+
+
+class IncrementalChanRegistry:
+    """按（品种, 时间周期）管理增量分析器"""
+
+    def __init__(self, max_fenxings: int = 200, max_bis: int = 200):
+        self.max_fenxings = max_fenxings
+        self.max_bis = max_bis
+        self._analyzers: Dict[Tuple[str, str], IncrementalChanAnalyzer] = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, timeframe: str) -> Optional[IncrementalChanAnalyzer]:
+        with self._lock:
+            return self._analyzers.get((symbol, timeframe))
+
+    def get_or_create(
+            self,
+            symbol: str,
+            timeframe: str,
+            warmup_klines: Optional[List[Dict]] = None
+    ) -> IncrementalChanAnalyzer:
+        """获取分析器，不存在时创建并用 warmup_klines 初始化"""
+        with self._lock:
+            analyzer = self._analyzers.get((symbol, timeframe))
+            if analyzer is None:
+                analyzer = IncrementalChanAnalyzer(symbol, timeframe, self.max_fenxings, self.max_bis)
+                if warmup_klines:
+                    analyzer.warm_up(warmup_klines)
+                self._analyzers[(symbol, timeframe)] = analyzer
+                app_logger.info(
+                    f"🧮 创建缠论增量分析器 {symbol} {timeframe}，预热K线 {len(warmup_klines or [])} 根"
+                )
+            return analyzer
+
+    def remove(self, symbol: str, timeframe: Optional[str] = None) -> None:
+        """移除品种的分析器（timeframe 为空时移除该品种全部周期）"""
+        with self._lock:
+            for key in [k for k in self._analyzers if k[0] == symbol and (timeframe is None or k[1] == timeframe)]:
+                del self._analyzers[key]
+
+    def on_minute_bar(self, symbol: str, bar: Dict) -> None:
+        """将1分钟K线推送给该品种的全部分析器（无分析器时直接返回）"""
+        with self._lock:
+            analyzers = [a for (s, _), a in self._analyzers.items() if s == symbol]
+        for analyzer in analyzers:
+            try:
+                analyzer.on_minute_bar(bar)
+            except Exception as e:
+                app_logger.warning(f"⚠️ 缠论增量分析更新失败 {symbol} {analyzer.timeframe}: {str(e)}")
+
+    def get_status(self) -> List[Dict]:
+        with self._lock:
+            analyzers = list(self._analyzers.values())
+        return [analyzer.get_state() for analyzer in analyzers]
+
+
+def _normalize_bar(bar: Dict) -> Dict:
+    """只保留增量分析需要的字段并转换为浮点数"""
+    return {
+        'timestamp': int(bar['timestamp']),
+        'high_price': float(bar['high_price']),
+        'low_price': float(bar['low_price']),
+        'close_price': float(bar['close_price'])
+    }
+
+
+# 创建全局实例
+chan_incremental = IncrementalChanRegistry()
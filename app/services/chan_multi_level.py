@@ -0,0 +1,429 @@
+"""
+缠论多级别联立分析
+
+按 doc/缠论多级别/多级别联立交易策略-核心决策逻辑.md 的三级别体系组合各周期的分析结果：
+- 大级别（最粗周期）定方向：最近买卖点，其次价格相对最近中枢的位置，决定是否允许做多/做空
+- 中级别找机会：允许方向上的买卖点，或价格回到中枢边沿（±3%）
+- 小级别（最细周期）定入场：同方向的买卖点，其次同方向的分型，给出入场价和止损
+
+执行流程：
+1. kline_aggregator.aggregate_many 一次扫描1分钟数据，逐级汇总出所有周期
+2. 各周期先查 analysis_cache（与 /chan 接口共用 chan_adapter 的缓存键），命中的周期不再分析
+3. 未命中的周期并行交给常驻的 worker 进程：每个（品种, 周期）固定分配给同一个 worker，
+   worker 中的 chan_adapter 保留预热的 CChan 实例，请求之间只推送新收盘的K线
+4. K线列经共享内存（multiprocessing.shared_memory）传给 worker，直接构建 KlineColumns 交给
+   chan_adapter.analyze_columns，不转换为逐根字典；总耗时接近最慢的单个周期
+5. 本进程中 chan_adapter 的失效通知（K线修正、回补）在下一次分配任务时转发给对应 worker
+6. CHAN_PROCESS_WORKERS=1、worker 无法启动或异常退出时，在当前进程内分析
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.services.analysis_cache import analysis_cache, normalize_symbol
+from app.services.chan_adapter import chan_adapter
+from app.services.kline_aggregator import kline_aggregator
+from app.utils.kline_columnar import ROW_FIELDS, TIMEFRAME_MINUTES, KlineColumns
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+# 共享内存中的行：时间戳（毫秒，float64 可精确表示）+ 各价格/成交量列
+_SHARED_FIELDS = ('timestamp',) + ROW_FIELDS
+
+DEFAULT_TIMEFRAMES = ['30m', '1h', '4h']
+
+# 转发给 worker 的失效通知：(品种, 周期) -> 起始毫秒时间戳（None 表示整体失效）
+Invalidations = Dict[Tuple[Optional[str], Optional[str]], Optional[int]]
+
+
+def _analyze_level(
+        shm_name: str,
+        count: int,
+        timeframe: str,
+        symbol: str,
+        invalidations: Invalidations
+) -> Dict:
+    """worker 任务：应用失效通知，从共享内存读取一个周期的K线并执行缠论分析"""
+    for (invalid_symbol, invalid_timeframe), since in invalidations.items():
+        if since is None:
+            chan_adapter.invalidate(invalid_symbol, invalid_timeframe)
+        else:
+            chan_adapter.invalidate_since(invalid_symbol, since)
+
+    shm = SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray((len(_SHARED_FIELDS), count), dtype=np.float64, buffer=shm.buf)
+        columns = _columns_from_block(block, TIMEFRAME_MINUTES[timeframe])
+        del block
+    finally:
+        shm.close()
+    return chan_adapter.analyze_columns(columns, timeframe=timeframe, symbol=symbol, use_cache=False)
+
+
+class ChanMultiLevelAnalyzer:
+    """多级别联立分析（按品种和周期固定分配的常驻 worker 进程并行）"""
+
+    def __init__(self, max_workers: int = settings.CHAN_PROCESS_WORKERS):
+        self.max_workers = max_workers or min(len(TIMEFRAME_MINUTES), os.cpu_count() or 1)
+        # 每个 worker 是只有一个进程的进程池，进程常驻，进程内的 chan_adapter 实例缓存跨请求保留
+        self._workers: List[Optional[ProcessPoolExecutor]] = [None] * self.max_workers
+        self._assignments: Dict[Tuple[str, str], int] = {}
+        self._pending: List[Invalidations] = [{} for _ in range(self.max_workers)]
+        self._listening = False
+        self._lock = threading.Lock()
+        # 等待各周期结果的线程（只做 IO 等待，同时等待多个 worker）
+        self._dispatcher = ThreadPoolExecutor(max_workers=len(TIMEFRAME_MINUTES), thread_name_prefix="chan-level")
+        self.worker_tasks = 0
+        self.local_tasks = 0
+
+    def analyze_multi_level(
+            self,
+            db: Session,
+            symbol: str = "btc_usdt",
+            timeframes: Optional[List[str]] = None,
+            limit: int = 200
+    ) -> Dict:
+        """读取各周期K线（一次聚合）并执行多级别联立分析"""
+        timeframes = timeframes or DEFAULT_TIMEFRAMES
+        levels = kline_aggregator.aggregate_many(db, timeframes, symbol=symbol, limit=limit)
+        return self.analyze_columns(symbol, levels)
+
+    async def analyze_multi_level_async(
+            self,
+            db: "AsyncSession",
+            symbol: str = "btc_usdt",
+            timeframes: Optional[List[str]] = None,
+            limit: int = 200
+    ) -> Dict:
+        """同 analyze_multi_level（异步）：聚合在会话上执行，分析在线程中等待 worker"""
+        timeframes = timeframes or DEFAULT_TIMEFRAMES
+        levels = await kline_aggregator.aggregate_many_async(db, timeframes, symbol=symbol, limit=limit)
+        return await asyncio.to_thread(self.analyze_columns, symbol, levels)
+
+    def analyze_columns(self, symbol: str, levels: Dict[str, KlineColumns]) -> Dict:
+        """对已聚合的各周期K线执行并行分析并组合为联立信号"""
+        begin = time.perf_counter()
+        symbol = normalize_symbol(symbol)
+        level_order = sorted(
+            (timeframe for timeframe, columns in levels.items() if len(columns) > 0),
+            key=TIMEFRAME_MINUTES.get
+        )
+        cache_before = analysis_cache.get_statistics()['hits']
+        futures = {
+            timeframe: self._dispatcher.submit(self._analyze_cached, symbol, timeframe, levels[timeframe])
+            for timeframe in level_order
+        }
+        results: Dict[str, Dict] = {}
+        timings: Dict[str, float] = {}
+        for timeframe, future in futures.items():
+            results[timeframe], timings[timeframe] = future.result()
+            results[timeframe]['last_price'] = float(levels[timeframe].close[-1])
+            results[timeframe]['bars'] = len(levels[timeframe])
+
+        wall_ms = (time.perf_counter() - begin) * 1000
+        cache_hits = analysis_cache.get_statistics()['hits'] - cache_before
+        app_logger.info(
+            f"✅ 多级别联立分析完成 {symbol} {level_order}，总耗时 {wall_ms:.1f}ms，"
+            f"各级别 {timings}，缓存命中 {cache_hits}"
+        )
+        return {
+            'levels': results,
+            'joint_signal': combine_levels(results, level_order),
+            'metadata': {
+                'symbol': symbol,
+                'timeframes': level_order,
+                'workers': self.max_workers,
+                'elapsed_ms': round(wall_ms, 2),
+                'level_elapsed_ms': timings,
+                'level_elapsed_sum_ms': round(sum(timings.values()), 2)
+            }
+        }
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'running_workers': sum(worker is not None for worker in self._workers),
+                'assignments': {f"{symbol} {timeframe}": index
+                                for (symbol, timeframe), index in self._assignments.items()},
+                'worker_tasks': self.worker_tasks,
+                'local_tasks': self.local_tasks
+            }
+
+    def shutdown(self) -> None:
+        """关闭全部 worker 进程"""
+        with self._lock:
+            workers, self._workers = self._workers, [None] * self.max_workers
+        for worker in workers:
+            if worker is not None:
+                worker.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------------
+    # 任务分配
+    # ------------------------------------------------------------------
+
+    def _analyze_cached(self, symbol: str, timeframe: str, columns: KlineColumns) -> Tuple[Dict, float]:
+        """单个周期：先查结果缓存，未命中时交给 worker（或在当前进程内）分析，返回结果和耗时毫秒"""
+        begin = time.perf_counter()
+        key = chan_adapter.cache_key(columns, timeframe, symbol)
+        result = analysis_cache.get_or_compute(key, lambda: self._compute(symbol, timeframe, columns))
+        return result, round((time.perf_counter() - begin) * 1000, 2)
+
+    def _compute(self, symbol: str, timeframe: str, columns: KlineColumns) -> Dict:
+        index, worker, invalidations = self._acquire_worker(symbol, timeframe)
+        if worker is not None:
+            shm = _write_shared(columns)
+            try:
+                result = worker.submit(
+                    _analyze_level, shm.name, len(columns), timeframe, symbol, invalidations
+                ).result()
+                with self._lock:
+                    self.worker_tasks += 1
+                return result
+            except BrokenProcessPool as e:
+                app_logger.warning(f"⚠️ 多级别分析 worker {index} 异常退出，{symbol} {timeframe} 改为当前进程分析: {str(e)}")
+                self._discard_worker(index, worker)
+            finally:
+                shm.close()
+                shm.unlink()
+
+        with self._lock:
+            self.local_tasks += 1
+        return chan_adapter.analyze_columns(columns, timeframe=timeframe, symbol=symbol, use_cache=False)
+
+    def _acquire_worker(
+            self,
+            symbol: str,
+            timeframe: str
+    ) -> Tuple[int, Optional[ProcessPoolExecutor], Invalidations]:
+        """（品种, 周期）固定分配的 worker 及待转发的失效通知；单 worker 配置或无法启动时返回 None"""
+        if self.max_workers <= 1:
+            return 0, None, {}
+        with self._lock:
+            index = self._assignments.get((symbol, timeframe))
+            if index is None:
+                # 分配给已分配（品种, 周期）最少的 worker，同一次请求的各周期落在不同 worker 上
+                loads = [0] * self.max_workers
+                for assigned in self._assignments.values():
+                    loads[assigned] += 1
+                index = loads.index(min(loads))
+                self._assignments[(symbol, timeframe)] = index
+
+            worker = self._workers[index]
+            if worker is None:
+                try:
+                    # spawn：不继承父进程的线程和锁状态（事件循环、数据库连接池、实时流线程）
+                    worker = ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn"))
+                except (OSError, NotImplementedError) as e:
+                    app_logger.warning(f"⚠️ 无法启动多级别分析 worker，改为当前进程分析: {str(e)}")
+                    return index, None, {}
+                self._workers[index] = worker
+                # 新进程没有任何缓存实例，之前积累的失效通知不再需要
+                self._pending[index] = {}
+                if not self._listening:
+                    chan_adapter.add_invalidation_listener(self._on_invalidate)
+                    self._listening = True
+                app_logger.info(f"🧵 多级别分析 worker {index} 启动")
+            invalidations, self._pending[index] = self._pending[index], {}
+            return index, worker, invalidations
+
+    def _discard_worker(self, index: int, worker: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._workers[index] is worker:
+                self._workers[index] = None
+        worker.shutdown(wait=False, cancel_futures=True)
+
+    def _on_invalidate(self, symbol: Optional[str], timeframe: Optional[str], since: Optional[int]) -> None:
+        """chan_adapter 失效通知：记录下来，下次向 worker 分配任务时一并发送（同一键只保留最早的时间）"""
+        key = (symbol, timeframe)
+        with self._lock:
+            for index, pending in enumerate(self._pending):
+                if self._workers[index] is None:
+                    continue
+                if key in pending:
+                    previous = pending[key]
+                    since_value = None if previous is None or since is None else min(previous, since)
+                else:
+                    since_value = since
+                pending[key] = since_value
+
+
+def _write_shared(columns: KlineColumns) -> SharedMemory:
+    """把一个周期的K线列写入新的共享内存块（调用方负责 unlink）"""
+    shm = SharedMemory(create=True, size=max(len(_SHARED_FIELDS) * len(columns) * 8, 1))
+    block = np.ndarray((len(_SHARED_FIELDS), len(columns)), dtype=np.float64, buffer=shm.buf)
+    for row, name in enumerate(_SHARED_FIELDS):
+        block[row] = getattr(columns, name)
+    del block
+    return shm
+
+
+def _columns_from_block(block: np.ndarray, interval_minutes: int) -> KlineColumns:
+    """共享内存中的二维数组 -> KlineColumns（复制出来，共享内存随后关闭）"""
+    fields = {name: block[row].copy() for row, name in enumerate(_SHARED_FIELDS)}
+    fields['timestamp'] = fields['timestamp'].astype(np.int64)
+    fields['trades_count'] = fields['trades_count'].astype(np.int64)
+    return KlineColumns(interval_minutes=interval_minutes, **fields)
+
+
+# ----------------------------------------------------------------------
+# 级别组合（决策逻辑见 doc/缠论多级别/多级别联立交易策略-核心决策逻辑.md）
+# ----------------------------------------------------------------------
+
+def combine_levels(results: Dict[str, Dict], level_order: List[str]) -> Dict:
+    """
+    组合各级别结果为联立信号
+
+    level_order 按周期从细到粗排列：最粗为大级别，最细为小级别，三个及以上周期时次粗为中级别，
+    两个周期时中级别与小级别相同。
+    """
+    if not level_order:
+        return {'action': 'WAIT', 'reason': '没有K线数据', 'confidence': 0}
+
+    major_tf, minor_tf = level_order[-1], level_order[0]
+    middle_tf = level_order[-2] if len(level_order) >= 3 else minor_tf
+
+    major = major_trend(results[major_tf], major_tf)
+    opportunities = find_opportunities(results[middle_tf], middle_tf, major)
+    best = max(opportunities, key=lambda o: o['confidence']) if opportunities else None
+    entry = determine_entry(results[minor_tf], minor_tf, best) if best else None
+
+    if entry is not None:
+        action = 'BUY' if entry['action'] == 'open_long' else 'SELL'
+        reason, confidence = entry['reason'], entry['confidence']
+    elif best is not None:
+        action = 'WAIT'
+        reason = f"{best['trigger']}，等待{minor_tf}确认信号"
+        confidence = 0
+    else:
+        action = 'WAIT'
+        reason = major.get('reason', f"{major_tf}方向不明确")
+        confidence = 0
+
+    return {
+        'action': action,
+        'reason': reason,
+        'confidence': round(confidence, 4),
+        'levels': {'major': major_tf, 'middle': middle_tf, 'minor': minor_tf},
+        'major_trend': major,
+        'opportunities': opportunities,
+        'entry': entry
+    }
+
+
+def major_trend(level: Dict, timeframe: str) -> Dict:
+    """大级别方向：最近买卖点 > 价格相对最近中枢 > 趋势判断（chan.py 不可用时）"""
+    bsps = level.get('buy_sell_points', [])
+    if bsps:
+        latest = bsps[-1]
+        continuation = any(t.startswith('3') for t in latest['bsp_types'])
+        direction = 'up' if latest['is_buy'] else 'down'
+        stage = '延续' if continuation else '启动'
+        return _trend(direction, 0.8 if continuation else 0.7,
+                      f"{timeframe}出现{latest['type']}，{'上涨' if latest['is_buy'] else '下跌'}趋势{stage}")
+
+    zhongshu = level.get('zhongshu', [])
+    price = level.get('last_price')
+    if zhongshu and price is not None:
+        latest_zs = zhongshu[-1]
+        if price > latest_zs['high']:
+            return _trend('up', 0.6, f"价格在{timeframe}中枢上方")
+        if price < latest_zs['low']:
+            return _trend('down', 0.6, f"价格在{timeframe}中枢下方")
+        return _trend('neutral', 0.3, f"价格在{timeframe}中枢内震荡")
+
+    trend = level.get('trend', {})
+    direction = trend.get('direction', 'neutral')
+    if direction in ('up', 'down'):
+        return _trend(direction, trend.get('strength', 0), f"{timeframe}笔结构趋势{'向上' if direction == 'up' else '向下'}")
+    return _trend('neutral', 0, f"{timeframe}方向不明确")
+
+
+def find_opportunities(level: Dict, timeframe: str, major: Dict) -> List[Dict]:
+    """中级别机会：允许方向上的买卖点，或价格回到最近中枢边沿（±3%）"""
+    permission = major['trade_permission']
+    if not (permission['can_long'] or permission['can_short']):
+        return []
+    is_long = permission['can_long']
+    opportunities = []
+
+    bsps = level.get('buy_sell_points', [])
+    if bsps and bsps[-1]['is_buy'] == is_long:
+        latest = bsps[-1]
+        second_type = any(t.startswith('2') for t in latest['bsp_types'])
+        opportunities.append({
+            'type': 'long' if is_long else 'short',
+            'trigger': f"{timeframe}{'买' if is_long else '卖'}点: {latest['type']}",
+            'confidence': 0.7 if second_type else 0.8,
+            'entry_reference': latest['price'],
+            'stop_reference': latest['price'] * (0.98 if is_long else 1.02)
+        })
+
+    zhongshu = level.get('zhongshu', [])
+    price = level.get('last_price')
+    if zhongshu and price is not None:
+        latest_zs = zhongshu[-1]
+        edge, stop = (latest_zs['high'], latest_zs['low']) if is_long else (latest_zs['low'], latest_zs['high'])
+        if edge and abs(price - edge) / edge < 0.03:
+            opportunities.append({
+                'type': 'long' if is_long else 'short',
+                'trigger': f"{timeframe}{'回调至中枢上沿' if is_long else '反弹至中枢下沿'}",
+                'confidence': 0.6,
+                'entry_reference': edge,
+                'stop_reference': stop
+            })
+    return opportunities
+
+
+def determine_entry(level: Dict, timeframe: str, opportunity: Dict) -> Optional[Dict]:
+    """小级别入场：同方向买卖点（置信度 ×0.9），其次同方向分型（×0.8）"""
+    is_long = opportunity['type'] == 'long'
+    action = 'open_long' if is_long else 'open_short'
+
+    bsps = level.get('buy_sell_points', [])
+    if bsps and bsps[-1]['is_buy'] == is_long:
+        latest = bsps[-1]
+        return {
+            'action': action,
+            'entry_price': latest['price'],
+            'stop_loss': latest['price'] * (0.98 if is_long else 1.02),
+            'confidence': opportunity['confidence'] * 0.9,
+            'reason': f"{opportunity['trigger']} + {timeframe}{'买' if is_long else '卖'}点:{latest['type']}"
+        }
+
+    fenxings = level.get('fenxings', [])
+    if fenxings and fenxings[-1]['type'] == ('bottom' if is_long else 'top'):
+        price = fenxings[-1]['price']
+        return {
+            'action': action,
+            'entry_price': price * (1.001 if is_long else 0.999),
+            'stop_loss': price * (0.98 if is_long else 1.02),
+            'confidence': opportunity['confidence'] * 0.8,
+            'reason': f"{opportunity['trigger']} + {timeframe}{'底' if is_long else '顶'}分型"
+        }
+    return None
+
+
+def _trend(direction: str, strength: float, reason: str) -> Dict:
+    return {
+        'direction': direction,
+        'strength': strength,
+        'trade_permission': {'can_long': direction == 'up', 'can_short': direction == 'down'},
+        'reason': reason
+    }
+
+
+# 创建全局实例
+chan_multi_level = ChanMultiLevelAnalyzer()
@@ -11,6 +11,8 @@ from enum import Enum
 import sys
 import os
 
+import numpy as np
+
 # 添加chan.py模块到路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'chan.py'))
 
@@ -24,6 +26,24 @@ except ImportError as e:
     CHAN_MODULE_AVAILABLE = False
 
 from app.core.logger import app_logger
+from app.services.analysis_cache import analysis_cache, config_hash, make_key
+from app.utils.fenxing import find_fenxings
+from app.utils.kline_columnar import MS_PER_MINUTE, TIMEFRAME_MINUTES
+
+# chan.py 引擎配置（chan_adapter 在此基础上开启 trigger_step 逐根计算）
+CHAN_CONFIG = {
+    "trigger_step": False,
+    "bi_strict": True,
+    "seg_algo": "chan",
+    "zs_algo": "normal",
+    "bs_type": "1,1p,2,2s,3a,3b",
+    "divergence_rate": 0.8,
+    "min_zs_cnt": 1,
+    "bsp1_only_multibi_zs": True,
+    "macd": {"fast": 12, "slow": 26, "signal": 9},
+    "mean_metrics": [5, 10, 20],
+    "print_warning": False,
+}
 
 
 class SignalType(Enum):
@@ -86,28 +106,33 @@ class ChanMultiLevelStrategy:
         
         app_logger.info(f"🏗️ 缠论多级别策略初始化完成 - 品种: {symbol}")
 
-    def _init_chan_config(self) -> Optional[CChanConfig]:
+    def _init_chan_config(self) -> Optional["CChanConfig"]:
         """初始化缠论配置"""
         if not CHAN_MODULE_AVAILABLE:
             app_logger.warning("⚠️ Chan模块不可用，策略功能受限")
             return None
             
-        return CChanConfig({
-            "trigger_step": False,
-            "bi_strict": True,
-            "seg_algo": "chan",
-            "zs_algo": "normal",
-            "bs_type": "1,1p,2,2s,3a,3b",
-            "divergence_rate": 0.8,
-            "min_zs_cnt": 1,
-            "bsp1_only_multibi_zs": True,
-            "macd": {"fast": 12, "slow": 26, "signal": 9},
-            "mean_metrics": [5, 10, 20],
-            "print_warning": False,
-        })
-
-    def analyze_klines(self, klines: List[Dict], timeframe: str) -> Dict[str, Any]:
-        """分析K线数据生成交易信号"""
+        return CChanConfig(dict(CHAN_CONFIG))
+
+    def analyze_klines(self, klines: List[Dict], timeframe: str, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        分析K线数据生成交易信号
+
+        use_cache 为 True 时相同窗口（同一最新收盘K线和未收盘K线价格）的结果从 analysis_cache 复用；
+        逐窗口回测等不会重复请求的场景传 False。
+        """
+        if not use_cache or not klines:
+            return self._analyze_klines(klines, timeframe)
+
+        interval_ms = TIMEFRAME_MINUTES.get(timeframe, 60) * MS_PER_MINUTE
+        key = make_key(
+            'chan_strategy', self.symbol, timeframe, klines, interval_ms,
+            config_hash(self.config, CHAN_CONFIG), include_live_bar=True
+        )
+        return analysis_cache.get_or_compute(key, lambda: self._analyze_klines(klines, timeframe))
+
+    def _analyze_klines(self, klines: List[Dict], timeframe: str) -> Dict[str, Any]:
+        """分析K线数据生成交易信号（不经过缓存）"""
         if not CHAN_MODULE_AVAILABLE:
             return self._fallback_analysis(klines, timeframe)
             
@@ -172,66 +197,24 @@ class ChanMultiLevelStrategy:
             return self._get_empty_analysis()
 
     def _identify_fenxings(self, klines: List[Dict]) -> List[Dict]:
-        """识别分型"""
+        """识别分型（向量化实现见 app.utils.fenxing）"""
         fenxings = []
         
         try:
             if len(klines) < 3:
                 return fenxings
             
-            for i in range(1, len(klines) - 1):
-                prev_high = float(klines[i-1]['high_price'])
-                prev_low = float(klines[i-1]['low_price'])
-                curr_high = float(klines[i]['high_price'])
-                curr_low = float(klines[i]['low_price'])
-                next_high = float(klines[i+1]['high_price'])
-                next_low = float(klines[i+1]['low_price'])
-                
-                # 顶分型
-                if (curr_high > prev_high and curr_high > next_high and
-                    curr_low > prev_low and curr_low > next_low):
-                    fenxings.append({
-                        'type': 'top',
-                        'timestamp': klines[i]['timestamp'],
-                        'price': curr_high,
-                        'index': i,
-                        'strength': self._calculate_fenxing_strength(klines, i)
-                    })
-                
-                # 底分型
-                elif (curr_low < prev_low and curr_low < next_low and
-                      curr_high < prev_high and curr_high < next_high):
-                    fenxings.append({
-                        'type': 'bottom',
-                        'timestamp': klines[i]['timestamp'],
-                        'price': curr_low,
-                        'index': i,
-                        'strength': self._calculate_fenxing_strength(klines, i)
-                    })
+            # 一次性转换为浮点数组
+            highs = np.array([k['high_price'] for k in klines], dtype=np.float64)
+            lows = np.array([k['low_price'] for k in klines], dtype=np.float64)
+
+            fenxings = find_fenxings(highs, lows).to_dict_list([k['timestamp'] for k in klines])
         
         except Exception as e:
             app_logger.warning(f"⚠️ 分型识别失败: {str(e)}")
         
         return fenxings
 
-    def _calculate_fenxing_strength(self, klines: List[Dict], index: int) -> float:
-        """计算分型强度"""
-        try:
-            if index < 1 or index >= len(klines) - 1:
-                return 1.0
-            
-            prev_range = float(klines[index-1]['high_price']) - float(klines[index-1]['low_price'])
-            curr_range = float(klines[index]['high_price']) - float(klines[index]['low_price'])
-            next_range = float(klines[index+1]['high_price']) - float(klines[index+1]['low_price'])
-            
-            avg_range = (prev_range + curr_range + next_range) / 3
-            strength = curr_range / avg_range if avg_range > 0 else 1.0
-            
-            return min(max(strength, 0.1), 3.0)
-            
-        except Exception:
-            return 1.0
-
     def _identify_bis(self, fenxings: List[Dict], klines: List[Dict]) -> List[Dict]:
         """识别笔"""
         bis = []
@@ -620,7 +603,7 @@ chan_strategy = ChanMultiLevelStrategy()
 
 
 def analyze_with_chan_strategy(klines: List[Dict], timeframe: str = "1h", 
-                              symbol: str = "BTC/USDT") -> Dict[str, Any]:
+                              symbol: str = "BTC/USDT", use_cache: bool = True) -> Dict[str, Any]:
     """
     使用缠论策略分析K线数据
     
@@ -628,6 +611,7 @@ def analyze_with_chan_strategy(klines: List[Dict], timeframe: str = "1h",
         klines: K线数据列表
         timeframe: 时间周期
         symbol: 交易品种
+        use_cache: 是否复用相同窗口的分析结果
         
     Returns:
         分析结果字典
@@ -639,7 +623,7 @@ def analyze_with_chan_strategy(klines: List[Dict], timeframe: str = "1h",
             app_logger.info(f"🔄 更新策略品种为: {symbol}")
         
         # 执行分析
-        result = chan_strategy.analyze_klines(klines, timeframe)
+        result = chan_strategy.analyze_klines(klines, timeframe, use_cache=use_cache)
         
         # 添加策略信息
         result['strategy_info'] = {
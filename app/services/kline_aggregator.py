@@ -1,4 +1,6 @@
-from typing import List, Dict, Optional
+import asyncio
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
 from sqlalchemy.orm import Session
@@ -7,24 +9,75 @@ import pandas as pd
 
 from app.models.kline import BtcUsdtKline, SYMBOL_TO_MODEL
 from app.core.logger import app_logger
+from app.crud.async_read import async_read, run_read
+from app.crud.kline_columns_dao import kline_columns_dao, raw_rows_to_dicts
+from app.crud.kline_dao import kline as kline_dao
+from app.services.kline_bar_cache import kline_bar_cache
+from app.services.kline_statistics import kline_statistics
+from app.utils.kline_columnar import TIMEFRAME_MINUTES, KlineColumns, aggregate_columns
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@dataclass
+class _PendingColumns:
+    """
+    单周期聚合读取阶段的结果
+
+    stage: done（视图/1分钟数据，已是最终结果）、aggregate（待聚合的1分钟原始数据）、
+    merge（增量缓存最后一根K线以来的1分钟数据，待聚合后合并进缓存）
+    """
+    table: str
+    timeframe: str
+    limit: int
+    columns: KlineColumns
+    stage: str = 'done'
+    # 结果是否写入增量缓存
+    cache: bool = False
+
+
+@dataclass
+class _PendingLevels:
+    """多周期聚合读取阶段的结果"""
+    table: str
+    limit: int
+    cache: bool
+    # 增量缓存命中的周期 -> 最后一根K线以来的1分钟数据
+    tails: Dict[str, KlineColumns] = field(default_factory=dict)
+    # 需要级联汇总的周期及其共用的1分钟原始数据
+    missing: List[str] = field(default_factory=list)
+    raw: Optional[KlineColumns] = None
 
 
 class KlineAggregator:
     """K线数据聚合器 - 将1分钟K线聚合为不同时间周期"""
 
     # 支持的时间周期（分钟）
-    TIMEFRAMES = {
-        '1m': 1,
-        '5m': 5,
-        '15m': 15,
-        '30m': 30,
-        '1h': 60,
-        '4h': 240,
-        '1d': 1440
+    TIMEFRAMES = TIMEFRAME_MINUTES
+
+    # 级联汇总：每个时间周期由上一级更细的周期聚合而来
+    ROLLUP_PARENTS = {
+        '5m': '1m',
+        '15m': '5m',
+        '30m': '15m',
+        '1h': '30m',
+        '4h': '1h',
+        '1d': '4h'
     }
 
-    def __init__(self):
-        app_logger.info("🔄 K线聚合器初始化完成")
+    # 聚合引擎: numpy(列式向量化) / pandas(原有resample实现)
+    ENGINES = ('numpy', 'pandas')
+
+    def __init__(self, engine: str = 'numpy', use_views: bool = True, use_cache: bool = True):
+        if engine not in self.ENGINES:
+            raise ValueError(f"不支持的聚合引擎: {engine}")
+        self.engine = engine
+        # 是否优先读取TimescaleDB持续聚合视图
+        self.use_views = use_views
+        # 是否对最新窗口的请求使用增量K线缓存
+        self.use_cache = use_cache
+        app_logger.info(f"🔄 K线聚合器初始化完成，聚合引擎: {engine}")
 
     def aggregate_klines(
             self,
@@ -33,7 +86,9 @@ class KlineAggregator:
             symbol: str = "btc_usd",
             start_time: Optional[datetime] = None,
             end_time: Optional[datetime] = None,
-            limit: int = 200
+            limit: int = 200,
+            as_string: bool = True,
+            exact: bool = False
     ) -> List[Dict]:
         """
         聚合K线数据
@@ -45,38 +100,388 @@ class KlineAggregator:
             start_time: 开始时间
             end_time: 结束时间
             limit: 返回数据条数限制
+            as_string: True 时以字符串表示（1分钟为数据库中的十进制值，聚合周期保留8位小数）；
+                False 时直接输出浮点数（供内部计算使用）
+            exact: True 时在数据库中按 Numeric 精度聚合，价格以精确的十进制字符串输出
 
         Returns:
             List[Dict]: 聚合后的K线数据
         """
+        if exact:
+            return self._aggregate_klines_exact(db, timeframe, symbol, start_time, end_time, limit)
+
+        if timeframe == '1m' and as_string:
+            # 1分钟数据无需聚合，原样输出数据库中的十进制字符串
+            return raw_rows_to_dicts(self._fetch_raw_decimal_rows(db, symbol, start_time, end_time, limit))
+
+        if self.engine == 'pandas' and timeframe != '1m':
+            return self._aggregate_klines_pandas(db, timeframe, symbol, start_time, end_time, limit)
+
+        return self.aggregate_kline_columns(
+            db, timeframe, symbol=symbol, start_time=start_time, end_time=end_time, limit=limit
+        ).to_dict_list(as_string=as_string)
+
+    def _fetch_raw_decimal_rows(
+            self,
+            db: Session,
+            symbol: str,
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int
+    ) -> List[Tuple]:
+        model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
+        return kline_columns_dao.get_raw_decimal_rows(db, model, start_time, end_time, limit)
+
+    def _aggregate_klines_exact(
+            self,
+            db: Session,
+            timeframe: str,
+            symbol: str,
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int
+    ) -> List[Dict]:
+        """精确值聚合：不经过浮点转换，仅用于显式要求精确值的请求"""
         try:
             if timeframe not in self.TIMEFRAMES:
                 raise ValueError(f"不支持的时间周期: {timeframe}")
 
-            # 选择模型
             model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
+            interval_minutes = self.TIMEFRAMES[timeframe]
+            start_time, end_time = self._resolve_time_range(db, model, interval_minutes, start_time, end_time, limit)
+            return kline_columns_dao.get_exact_klines(db, model, interval_minutes, start_time, end_time, limit)
 
-            # 如果是1分钟，直接返回原始数据
-            if timeframe == '1m':
-                return self._get_raw_klines(db, model, start_time, end_time, limit)
+        except Exception as e:
+            app_logger.error(f"❌ 精确值K线聚合失败: {str(e)}")
+            raise
 
-            # 获取聚合间隔（分钟）
-            interval_minutes = self.TIMEFRAMES[timeframe]
+    def aggregate_kline_columns(
+            self,
+            db: Session,
+            timeframe: str,
+            symbol: str = "btc_usd",
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            limit: int = 200
+    ) -> KlineColumns:
+        """
+        聚合K线数据（列式结果）
+
+        有对应的持续聚合视图时直接读取已分桶数据，仅对水位线之后的尾部做原始聚合；
+        否则从数据库读取原始列到NumPy数组，按桶边界向量化计算OHLCV，全程不创建ORM对象。
+        未指定时间范围的请求使用增量缓存，只重新聚合最后一根未收盘的K线。
+
+        Args:
+            db: 数据库会话
+            timeframe: 目标时间周期 (1m, 5m, 15m, 30m, 1h, 4h, 1d)
+            symbol: 交易品种（默认 btc_usd）
+            start_time: 开始时间
+            end_time: 结束时间
+            limit: 返回数据条数限制
+
+        Returns:
+            KlineColumns: 聚合后的列式K线数据
+        """
+        try:
+            result = self._finish_columns(self._fetch_columns(db, timeframe, symbol, start_time, end_time, limit))
+            if result is None:
+                # 增量缓存条目在读取期间被淘汰，改为完整查询
+                result = self._finish_columns(
+                    self._fetch_columns(db, timeframe, symbol, start_time, end_time, limit, lookup_cache=False)
+                )
+            return result
+
+        except Exception as e:
+            app_logger.error(f"❌ K线聚合失败: {str(e)}")
+            raise
+
+    def _fetch_columns(
+            self,
+            db: Session,
+            timeframe: str,
+            symbol: str,
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int,
+            lookup_cache: bool = True
+    ) -> _PendingColumns:
+        """读取阶段：只做数据库查询，聚合留给 _finish_columns"""
+        if timeframe not in self.TIMEFRAMES:
+            raise ValueError(f"不支持的时间周期: {timeframe}")
+
+        # 选择模型
+        model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
+
+        # 最新窗口的请求走增量缓存，指定时间范围的请求直接查询
+        use_cache = self.use_cache and start_time is None and end_time is None
+        if use_cache and lookup_cache:
+            raw_tail = self._fetch_cached_tail(db, model, timeframe, limit)
+            if raw_tail is not None:
+                return _PendingColumns(model.__tablename__, timeframe, limit, raw_tail, stage='merge')
+
+        pending = self._query_columns(db, model, timeframe, symbol, start_time, end_time, limit)
+        pending.cache = use_cache
+        return pending
+
+    def _finish_columns(self, pending: _PendingColumns) -> Optional[KlineColumns]:
+        """
+        计算阶段：对读取阶段取回的1分钟数据做向量化聚合，不访问数据库
+
+        Returns:
+            聚合结果；增量缓存条目在读取期间被淘汰时返回 None
+        """
+        interval_minutes = self.TIMEFRAMES[pending.timeframe]
+        if pending.stage == 'merge':
+            new_bars = aggregate_columns(pending.columns, interval_minutes)
+            result = kline_bar_cache.merge(pending.table, pending.timeframe, new_bars, pending.limit)
+            if result is not None:
+                app_logger.debug(
+                    f"K线缓存命中 {pending.table}:{pending.timeframe}，增量读取 {len(pending.columns)} 条1分钟数据"
+                )
+            return result
+
+        if pending.stage == 'aggregate':
+            # 向量化聚合并限制返回数量
+            result = aggregate_columns(pending.columns, interval_minutes).tail(pending.limit)
+            app_logger.info(f"✅ 成功聚合生成 {len(result)} 条 {pending.timeframe} K线数据")
+        else:
+            result = pending.columns
+
+        if pending.cache:
+            kline_bar_cache.put(pending.table, pending.timeframe, result)
+        return result
+
+    def _query_columns(
+            self,
+            db: Session,
+            model,
+            timeframe: str,
+            symbol: str,
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int
+    ) -> _PendingColumns:
+        """从数据库查询K线（视图优先，原始数据兜底，原始数据的聚合留给计算阶段）"""
+        table = model.__tablename__
+
+        # 如果是1分钟，直接返回原始数据
+        if timeframe == '1m':
+            return _PendingColumns(table, timeframe, limit,
+                                   kline_columns_dao.get_raw_columns(db, model, start_time, end_time, limit=limit))
+
+        # 获取聚合间隔（分钟）
+        interval_minutes = self.TIMEFRAMES[timeframe]
+
+        # 优先读取持续聚合视图
+        if self.use_views:
+            view_backed = kline_columns_dao.get_view_backed_columns(
+                db, model=model, interval_minutes=interval_minutes,
+                start_time=start_time, end_time=end_time, limit=limit
+            )
+            if view_backed is not None:
+                view_columns = view_backed[0]
+                app_logger.info(f"✅ 从持续聚合视图获取 {len(view_columns)} 条 {timeframe} K线数据，品种: {symbol}")
+                return _PendingColumns(table, timeframe, limit, view_columns)
+
+        start_time, end_time = self._resolve_time_range(db, model, interval_minutes, start_time, end_time, limit)
+
+        app_logger.info(f"🔄 聚合 {timeframe} K线数据，时间范围: {start_time} 到 {end_time}，品种: {symbol}")
+
+        # 获取1分钟原始数据
+        raw_columns = kline_columns_dao.get_raw_columns(db, model, start_time, end_time)
+
+        if len(raw_columns) == 0:
+            app_logger.warning("没有找到原始K线数据")
+            return _PendingColumns(table, timeframe, limit, KlineColumns.empty(interval_minutes))
+
+        return _PendingColumns(table, timeframe, limit, raw_columns, stage='aggregate')
+
+    def _fetch_cached_tail(self, db: Session, model, timeframe: str, limit: int) -> Optional[KlineColumns]:
+        """
+        增量缓存命中时读取最后一根（未收盘）K线开盘以来的1分钟数据
+
+        已收盘的K线直接复用，计算阶段只重新聚合这段数据，替换最后一根K线并追加新出现的K线。
+        """
+        last_open_ms = kline_bar_cache.lookup(model.__tablename__, timeframe, limit)
+        if last_open_ms is None:
+            return None
+
+        last_open_time = datetime(1970, 1, 1) + timedelta(milliseconds=last_open_ms)
+        return kline_columns_dao.get_raw_columns(db, model, last_open_time, None)
+
+    def get_cache_statistics(self) -> Dict:
+        """获取K线缓存的命中统计"""
+        return kline_bar_cache.get_statistics()
+
+    def aggregate_many(
+            self,
+            db: Session,
+            timeframes: List[str],
+            symbol: str = "btc_usd",
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            limit: int = 200
+    ) -> Dict[str, KlineColumns]:
+        """
+        一次性聚合多个时间周期
+
+        只扫描一次1分钟原始数据，之后按 1m→5m→15m→30m→1h→4h→1d 逐级汇总，
+        每一级都由上一级更细的结果聚合得到。未指定时间范围时，已缓存的周期直接走增量缓存。
+
+        Args:
+            db: 数据库会话
+            timeframes: 目标时间周期列表
+            symbol: 交易品种（默认 btc_usd）
+            start_time: 开始时间
+            end_time: 结束时间
+            limit: 每个周期返回的数据条数限制
+
+        Returns:
+            Dict[str, KlineColumns]: 时间周期 -> 聚合后的列式K线数据
+        """
+        try:
+            results = self._finish_levels(self._fetch_levels(db, timeframes, symbol, start_time, end_time, limit))
+            missing = [timeframe for timeframe in timeframes if timeframe not in results]
+            if missing:
+                # 增量缓存条目在读取期间被淘汰，这些周期改为级联汇总
+                results.update(self._finish_levels(
+                    self._fetch_levels(db, missing, symbol, start_time, end_time, limit, lookup_cache=False)
+                ))
+            return self._collect_levels(results, timeframes, symbol)
+
+        except Exception as e:
+            app_logger.error(f"❌ 多周期K线聚合失败: {str(e)}")
+            raise
+
+    def _fetch_levels(
+            self,
+            db: Session,
+            timeframes: List[str],
+            symbol: str,
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int,
+            lookup_cache: bool = True
+    ) -> _PendingLevels:
+        """多周期聚合的读取阶段：缓存命中周期的增量尾部 + 其余周期共用的一次原始数据扫描"""
+        for timeframe in timeframes:
+            if timeframe not in self.TIMEFRAMES:
+                raise ValueError(f"不支持的时间周期: {timeframe}")
+
+        model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
+        use_cache = self.use_cache and start_time is None and end_time is None
+        pending = _PendingLevels(model.__tablename__, limit, use_cache)
+
+        for timeframe in dict.fromkeys(timeframes):
+            raw_tail = self._fetch_cached_tail(db, model, timeframe, limit) if use_cache and lookup_cache else None
+            if raw_tail is not None:
+                pending.tails[timeframe] = raw_tail
+            else:
+                pending.missing.append(timeframe)
+
+        if pending.missing:
+            pending.raw = self._fetch_rollup_source(db, model, pending.missing, start_time, end_time, limit)
+        return pending
+
+    def _finish_levels(self, pending: _PendingLevels) -> Dict[str, KlineColumns]:
+        """多周期聚合的计算阶段：合并增量尾部并逐级汇总，不访问数据库（合并失败的周期不在结果中）"""
+        results: Dict[str, KlineColumns] = {}
+        for timeframe, raw_tail in pending.tails.items():
+            merged = self._finish_columns(_PendingColumns(pending.table, timeframe, pending.limit, raw_tail, stage='merge'))
+            if merged is not None:
+                results[timeframe] = merged
+
+        if pending.missing:
+            levels = self._rollup_levels(pending.raw, pending.missing)
+            for timeframe in pending.missing:
+                results[timeframe] = levels[timeframe].tail(pending.limit)
+                if pending.cache:
+                    kline_bar_cache.put(pending.table, timeframe, results[timeframe])
+        return results
+
+    def _collect_levels(
+            self, results: Dict[str, KlineColumns], timeframes: List[str], symbol: str
+    ) -> Dict[str, KlineColumns]:
+        app_logger.info(f"✅ 多周期聚合完成，品种: {symbol}，周期: {list(results)}")
+        return {timeframe: results[timeframe] for timeframe in timeframes}
+
+    def _fetch_rollup_source(
+            self,
+            db: Session,
+            model,
+            timeframes: List[str],
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int
+    ) -> KlineColumns:
+        """读取级联汇总所需的1分钟原始数据（起点对齐到最粗周期的桶边界）"""
+        coarsest = max(timeframes, key=self.TIMEFRAMES.get)
+        interval_minutes = self.TIMEFRAMES[coarsest]
+        if interval_minutes == 1:
+            return kline_columns_dao.get_raw_columns(db, model, start_time, end_time, limit=limit)
+
+        # 未指定开始时间时起点对齐到最粗周期的桶边界，每一级的第一根K线都是完整的
+        resolved_start, end_time = self._resolve_time_range(db, model, interval_minutes, start_time, end_time, limit)
+
+        app_logger.info(f"🔄 级联聚合 {timeframes}，原始数据范围: {resolved_start} 到 {end_time}")
+        return kline_columns_dao.get_raw_columns(db, model, resolved_start, end_time)
+
+    def _rollup_levels(self, raw_columns: KlineColumns, timeframes: List[str]) -> Dict[str, KlineColumns]:
+        """由一次扫描的1分钟数据逐级汇总到所需的最粗周期"""
+        coarsest = max(timeframes, key=self.TIMEFRAMES.get)
+
+        # 由最粗周期沿父级链回溯到1分钟，再自下而上逐级汇总
+        chain = [coarsest]
+        while chain[-1] in self.ROLLUP_PARENTS:
+            chain.append(self.ROLLUP_PARENTS[chain[-1]])
+        chain.reverse()
+
+        levels = {'1m': raw_columns}
+        for child in chain[1:]:
+            levels[child] = aggregate_columns(levels[self.ROLLUP_PARENTS[child]], self.TIMEFRAMES[child])
+        return levels
+
+    def _resolve_time_range(
+            self,
+            db: Session,
+            model,
+            interval_minutes: int,
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int
+    ) -> Tuple[datetime, datetime]:
+        """
+        确定聚合所需的原始数据时间范围
 
-            # 设置默认时间范围
-            if not end_time:
-                # 如果没有指定结束时间，使用数据库中的最新时间
-                latest_kline = db.query(model).order_by(model.open_time.desc()).first()
-                if latest_kline:
-                    end_time = latest_kline.open_time + timedelta(minutes=1)
-                else:
-                    end_time = datetime.now()
-            if not start_time:
-                # 根据需要的数据量和时间周期计算开始时间
-                total_minutes = limit * interval_minutes
-                start_time = end_time - timedelta(minutes=total_minutes * 2)  # 多取一些数据确保足够
-
-            app_logger.info(f"🔄 聚合 {timeframe} K线数据，时间范围: {start_time} 到 {end_time}，品种: {symbol}")
+        由 KlineDao.plan_kline_query 精确计算最新 limit 个桶覆盖的1分钟范围（起点对齐桶边界），
+        不再按 limit 的倍数多取数据；库中没有数据时返回空范围。
+        """
+        plan = kline_dao.plan_kline_query(
+            db, model=model, interval_minutes=interval_minutes,
+            start_time=start_time, end_time=end_time, limit=limit
+        )
+        if plan.empty:
+            now = datetime.now()
+            return now, now
+        return plan.start_time, plan.end_time
+
+    def _aggregate_klines_pandas(
+            self,
+            db: Session,
+            timeframe: str,
+            symbol: str,
+            start_time: Optional[datetime],
+            end_time: Optional[datetime],
+            limit: int
+    ) -> List[Dict]:
+        """基于ORM对象和pandas.resample的聚合实现（保留用于对比基准）"""
+        try:
+            if timeframe not in self.TIMEFRAMES:
+                raise ValueError(f"不支持的时间周期: {timeframe}")
+
+            model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
+            interval_minutes = self.TIMEFRAMES[timeframe]
+            start_time, end_time = self._resolve_time_range(db, model, interval_minutes, start_time, end_time, limit)
 
             # 获取1分钟原始数据
             raw_klines = db.query(model).filter(
@@ -98,41 +503,12 @@ class KlineAggregator:
             result = self._dataframe_to_dict_list(aggregated_df)
 
             # 限制返回数量
-            result = result[-limit:] if len(result) > limit else result
-
-            app_logger.info(f"✅ 成功聚合生成 {len(result)} 条 {timeframe} K线数据")
-            return result
+            return result[-limit:] if len(result) > limit else result
 
         except Exception as e:
             app_logger.error(f"❌ K线聚合失败: {str(e)}")
             raise
 
-    def _get_raw_klines(
-            self,
-            db: Session,
-            model,
-            start_time: Optional[datetime],
-            end_time: Optional[datetime],
-            limit: int
-    ) -> List[Dict]:
-        """获取原始1分钟K线数据"""
-        query = db.query(model)
-
-        if start_time:
-            query = query.filter(model.open_time >= start_time)
-        if end_time:
-            query = query.filter(model.open_time < end_time)
-
-        # 如果没有时间范围限制，直接获取最新的数据
-        if not start_time and not end_time:
-            klines = query.order_by(model.open_time.desc()).limit(limit).all()
-            klines.reverse()  # 按时间正序
-        else:
-            klines = query.order_by(model.open_time.desc()).limit(limit).all()
-            klines.reverse()  # 按时间正序
-
-        return [self._kline_to_dict(kline) for kline in klines]
-
     def _klines_to_dataframe(self, klines: List[BtcUsdtKline]) -> pd.DataFrame:
         """将K线数据转换为DataFrame"""
         data = []
@@ -200,23 +576,6 @@ class KlineAggregator:
 
         return result
 
-    def _kline_to_dict(self, kline: BtcUsdtKline) -> Dict:
-        """将K线对象转换为字典"""
-        return {
-            'timestamp': kline.timestamp,
-            'open_time': kline.open_time.isoformat(),
-            'close_time': kline.close_time.isoformat(),
-            'open_price': str(kline.open_price),
-            'high_price': str(kline.high_price),
-            'low_price': str(kline.low_price),
-            'close_price': str(kline.close_price),
-            'volume': str(kline.volume),
-            'quote_volume': str(kline.quote_volume),
-            'trades_count': kline.trades_count,
-            'taker_buy_volume': str(kline.taker_buy_volume),
-            'taker_buy_quote_volume': str(kline.taker_buy_quote_volume)
-        }
-
     def get_available_timeframes(self) -> List[str]:
         """获取支持的时间周期列表"""
         return list(self.TIMEFRAMES.keys())
@@ -230,40 +589,106 @@ class KlineAggregator:
         return latest[0] if latest else None
 
     def get_data_statistics(self, db: Session, symbol: str = "btc_usd") -> Dict:
-        """获取数据统计信息"""
+        """获取数据统计信息（读取内存中的统计快照，由后台定期刷新）"""
         try:
-            model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
-            total_count = db.query(model).count()
-
-            if total_count == 0:
-                return {
-                    "total_klines": 0,
-                    "date_range": None,
-                    "latest_price": None
-                }
-
-            earliest = db.query(model.open_time).order_by(
-                model.open_time.asc()
-            ).first()
-
-            latest = db.query(model).order_by(
-                model.open_time.desc()
-            ).first()
-
-            return {
-                "total_klines": total_count,
-                "date_range": {
-                    "start": earliest[0].isoformat() if earliest else None,
-                    "end": latest.open_time.isoformat() if latest else None
-                },
-                "latest_price": float(latest.close_price) if latest else None,
-                "data_coverage": f"{total_count // 1440:.1f} 天" if total_count > 1440 else f"{total_count} 条记录"
-            }
+            return kline_statistics.get_statistics(db, symbol=symbol).to_dict()
 
         except Exception as e:
             app_logger.error(f"获取数据统计失败: {str(e)}")
             return {"error": str(e)}
 
+    # 异步接口：数据库查询在 AsyncSession.run_sync 中执行（数据库IO在事件循环上等待），
+    # NumPy聚合和字典转换在线程池中执行，不阻塞事件循环
+
+    async def aggregate_klines_async(
+            self,
+            db: "AsyncSession",
+            timeframe: str,
+            symbol: str = "btc_usd",
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            limit: int = 200,
+            as_string: bool = True,
+            exact: bool = False
+    ) -> List[Dict]:
+        """聚合K线数据（异步），参数同 aggregate_klines"""
+        if exact:
+            # 精确值在数据库中聚合，取回的已是十进制字符串字典
+            return await db.run_sync(self._aggregate_klines_exact, timeframe, symbol, start_time, end_time, limit)
+
+        if timeframe == '1m' and as_string:
+            return await run_read(
+                db, self._fetch_raw_decimal_rows, symbol, start_time, end_time, limit, finish=raw_rows_to_dicts
+            )
+
+        if self.engine == 'pandas' and timeframe != '1m':
+            return await db.run_sync(
+                self._aggregate_klines_pandas, timeframe, symbol, start_time, end_time, limit
+            )
+
+        columns = await self.aggregate_kline_columns_async(
+            db, timeframe, symbol=symbol, start_time=start_time, end_time=end_time, limit=limit
+        )
+        return await asyncio.to_thread(columns.to_dict_list, as_string=as_string)
+
+    async def aggregate_kline_columns_async(
+            self,
+            db: "AsyncSession",
+            timeframe: str,
+            symbol: str = "btc_usd",
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            limit: int = 200
+    ) -> KlineColumns:
+        """聚合K线数据（异步，列式结果），参数同 aggregate_kline_columns"""
+        try:
+            result = await run_read(
+                db, self._fetch_columns, timeframe, symbol, start_time, end_time, limit,
+                finish=self._finish_columns
+            )
+            if result is None:
+                # 增量缓存条目在读取期间被淘汰，改为完整查询
+                result = await run_read(
+                    db, self._fetch_columns, timeframe, symbol, start_time, end_time, limit,
+                    lookup_cache=False, finish=self._finish_columns
+                )
+            return result
+
+        except Exception as e:
+            app_logger.error(f"❌ K线聚合失败: {str(e)}")
+            raise
+
+    async def aggregate_many_async(
+            self,
+            db: "AsyncSession",
+            timeframes: List[str],
+            symbol: str = "btc_usd",
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            limit: int = 200
+    ) -> Dict[str, KlineColumns]:
+        """一次性聚合多个时间周期（异步），参数同 aggregate_many"""
+        try:
+            results = await run_read(
+                db, self._fetch_levels, timeframes, symbol, start_time, end_time, limit,
+                finish=self._finish_levels
+            )
+            missing = [timeframe for timeframe in timeframes if timeframe not in results]
+            if missing:
+                # 增量缓存条目在读取期间被淘汰，这些周期改为级联汇总
+                results.update(await run_read(
+                    db, self._fetch_levels, missing, symbol, start_time, end_time, limit,
+                    lookup_cache=False, finish=self._finish_levels
+                ))
+            return self._collect_levels(results, timeframes, symbol)
+
+        except Exception as e:
+            app_logger.error(f"❌ 多周期K线聚合失败: {str(e)}")
+            raise
+
+    get_latest_timestamp_async = async_read(get_latest_timestamp)
+    get_data_statistics_async = async_read(get_data_statistics)
+
 
 # 创建全局实例
 kline_aggregator = KlineAggregator()
\ No newline at end of file
@@ -0,0 +1,382 @@
+"""
+K线历史数据分片并行回补
+
+将 [start, end) 按固定时长切分为分片，多个线程并发抓取，所有请求共享一个请求权重令牌桶：
+- 令牌桶容量为每分钟允许的请求权重，按 容量/60 每秒匀速补充；响应头 X-MBX-USED-WEIGHT-1M
+  报告的已用权重高于本地估计时同步扣减（同一IP上的其他进程也在消耗权重）
+- 429/418 响应按 Retry-After 暂停整个令牌桶，其他错误按指数退避重试
+- 抓取完成的分片由主线程依次经 kline_ingest_writer 写入（单个数据库会话），提交后记录到检查点文件，
+  中断后以相同参数重新运行会跳过已完成的分片
+- 只写入已收盘的K线；尚未收盘的最新一根留给增量抓取更新
+- only_missing=True 时按覆盖索引（kline_coverage）只抓取数据库中缺失的区间，
+  相距不足一页的缺口合并为一个分片，减少请求次数
+
+BinanceFetcher 的 base_url 可指向本地模拟服务，整个流程可在没有外网的环境中验证。
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.error import HTTPError
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.data.binance.binance_fetcher import BinanceFetcher
+from app.db.session import SessionLocal
+from app.models.kline import SYMBOL_TO_MODEL
+from app.services.kline_coverage import kline_coverage
+from app.services.kline_ingest import IngestResult, KlineIngestWriter, kline_ingest_writer
+from app.utils.kline_columnar import MS_PER_MINUTE, KlineColumns, concat_columns
+
+# 币安单页最多返回的K线数
+PAGE_LIMIT = 1000
+
+
+class TokenBucket:
+    """线程安全的请求权重令牌桶"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # 服务端要求暂停（429/418）时，在此时刻之前不发放令牌
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def acquire(self, weight: float = 1) -> float:
+        """取得 weight 个令牌（不足时阻塞），返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= weight:
+                    self._tokens -= weight
+                    return waited
+                delay = max(self._paused_until - now, (weight - self._tokens) / self.refill_per_second)
+            time.sleep(delay)
+            waited += delay
+
+    def sync_used(self, used_weight: int) -> None:
+        """按服务端报告的本分钟已用权重校正剩余令牌"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, self.capacity - used_weight)
+
+    def pause(self, seconds: float) -> None:
+        """暂停发放令牌 seconds 秒并清空令牌"""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = now
+
+
+@dataclass(frozen=True)
+class BackfillShard:
+    """一个回补分片：开盘时间 [start_ms, end_ms)"""
+    start_ms: int
+    end_ms: int
+
+    @property
+    def expected_bars(self) -> int:
+        return (self.end_ms - self.start_ms) // MS_PER_MINUTE
+
+
+class BackfillCheckpoint:
+    """
+    已完成分片的检查点文件（JSON）
+
+    文件记录回补参数（品种、时间范围、分片时长），参数不一致时视为新任务，忽略旧的进度。
+    """
+
+    def __init__(self, path: Optional[str], params: Dict):
+        self.path = path
+        self.params = params
+        self.completed: Set[int] = set()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            app_logger.warning(f"⚠️ 回补检查点 {self.path} 无法读取，从头开始: {str(e)}")
+            return
+        if data.get('params') != self.params:
+            app_logger.warning(f"⚠️ 回补检查点 {self.path} 的参数与本次不一致，从头开始")
+            return
+        self.completed = set(data.get('completed', []))
+
+    def is_done(self, shard: BackfillShard) -> bool:
+        return shard.start_ms in self.completed
+
+    def mark_done(self, shard: BackfillShard) -> None:
+        """记录分片已完成（先写临时文件再替换，中断时不会留下损坏的检查点）"""
+        self.completed.add(shard.start_ms)
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': self.params, 'completed': sorted(self.completed)}, f)
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class BackfillResult:
+    """一次回补的统计"""
+    shards_total: int = 0
+    shards_skipped: int = 0
+    shards_completed: int = 0
+    failed_shards: List[BackfillShard] = field(default_factory=list)
+    requests: int = 0
+    rate_limit_wait_seconds: float = 0.0
+    seconds: float = 0.0
+    ingest: Optional[IngestResult] = None
+
+    @property
+    def success(self) -> bool:
+        return not self.failed_shards
+
+    def to_dict(self) -> Dict:
+        return {
+            "shards_total": self.shards_total,
+            "shards_skipped": self.shards_skipped,
+            "shards_completed": self.shards_completed,
+            "shards_failed": len(self.failed_shards),
+            "requests": self.requests,
+            "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 3),
+            "seconds": round(self.seconds, 3),
+            "ingest": self.ingest.to_dict() if self.ingest else None
+        }
+
+
+class KlineBackfill:
+    """分片并行的1分钟K线回补"""
+
+    def __init__(
+            self,
+            fetcher: Optional[BinanceFetcher] = None,
+            writer: KlineIngestWriter = kline_ingest_writer,
+            session_factory: Callable[[], Session] = SessionLocal,
+            concurrency: int = settings.BACKFILL_CONCURRENCY,
+            weight_per_minute: int = settings.BINANCE_WEIGHT_PER_MINUTE,
+            shard_minutes: int = 7 * 24 * 60,
+            max_retries: int = 5
+    ):
+        self.fetcher = fetcher or BinanceFetcher(base_url=settings.BINANCE_BASE_URL)
+        self.writer = writer
+        self.session_factory = session_factory
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(weight_per_minute, weight_per_minute / 60)
+        self.shard_minutes = shard_minutes
+        self.max_retries = max_retries
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._wait_seconds = 0.0
+
+    def plan_shards(self, start_ms: int, end_ms: int) -> List[BackfillShard]:
+        """将 [start_ms, end_ms) 对齐到分钟后按 shard_minutes 切分"""
+        start_ms -= start_ms % MS_PER_MINUTE
+        shard_ms = self.shard_minutes * MS_PER_MINUTE
+        return [
+            BackfillShard(shard_start, min(shard_start + shard_ms, end_ms))
+            for shard_start in range(start_ms, end_ms, shard_ms)
+        ]
+
+    def plan_gap_shards(self, gaps: List[Tuple[int, int]]) -> List[BackfillShard]:
+        """
+        将缺失区间规划为分片
+
+        相邻缺口合并后所需的页数不多于分别抓取时，合并为一个区间（夹在中间的已有K线写入时跳过），
+        合并后的区间再按 shard_minutes 切分。
+        """
+        page_ms = PAGE_LIMIT * MS_PER_MINUTE
+        merged: List[Tuple[int, int, int]] = []  # (开始, 结束, 分别抓取所需页数)
+        for start, end in gaps:
+            pages = -(-(end - start) // page_ms)
+            if merged:
+                last_start, last_end, last_pages = merged[-1]
+                if -(-(end - last_start) // page_ms) <= last_pages + pages:
+                    merged[-1] = (last_start, end, last_pages + pages)
+                    continue
+            merged.append((start, end, pages))
+        return [shard for start, end, _ in merged for shard in self.plan_shards(start, end)]
+
+    def run(
+            self,
+            symbol: str,
+            start_ms: int,
+            end_ms: int,
+            checkpoint_path: Optional[str] = None,
+            only_missing: bool = False
+    ) -> BackfillResult:
+        """
+        回补 [start_ms, end_ms) 内的1分钟K线
+
+        Args:
+            symbol: 交易品种（SYMBOL_TO_MODEL 中的键，如 btc_usdt），对应币安交易对 BTCUSDT
+            start_ms: 开始时间（毫秒时间戳，UTC）
+            end_ms: 结束时间（毫秒时间戳，UTC，不含）
+            checkpoint_path: 检查点文件路径，为空时不记录进度
+            only_missing: 只抓取数据库中缺失的区间（覆盖索引本身即为进度记录，不使用检查点）
+        """
+        model = SYMBOL_TO_MODEL.get(symbol)
+        if model is None:
+            raise ValueError(f"不支持的交易品种: {symbol}")
+
+        begin = time.perf_counter()
+        with self._stats_lock:
+            self._requests = 0
+            self._wait_seconds = 0.0
+        pair = symbol.replace('_', '').upper()
+        db = self.session_factory()
+        try:
+            if only_missing:
+                gaps = kline_coverage.missing_ranges(db, symbol, start_ms, end_ms)
+                shards = self.plan_gap_shards(gaps)
+                checkpoint = BackfillCheckpoint(None, {})
+                app_logger.info(
+                    f"🗺️ {symbol} 缺失 {len(gaps)} 段共 "
+                    f"{sum(end - start for start, end in gaps) // MS_PER_MINUTE} 分钟"
+                )
+            else:
+                shards = self.plan_shards(start_ms, end_ms)
+                checkpoint = BackfillCheckpoint(checkpoint_path, {
+                    'symbol': symbol, 'start_ms': start_ms, 'end_ms': end_ms, 'shard_minutes': self.shard_minutes
+                })
+            pending = [shard for shard in shards if not checkpoint.is_done(shard)]
+            result = BackfillResult(shards_total=len(shards), shards_skipped=len(shards) - len(pending))
+            result.ingest = IngestResult(table_name=model.__tablename__)
+            app_logger.info(
+                f"🚀 开始回补 {symbol}：{len(shards)} 个分片，已完成 {result.shards_skipped} 个，"
+                f"并发 {self.concurrency}，权重上限 {self.bucket.capacity:.0f}/分钟"
+            )
+
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='kline-backfill') as executor:
+                # 限制在途分片数，抓取快于写入时不会在内存中堆积过多分片
+                queue = iter(pending)
+                in_flight: Dict[Future, BackfillShard] = {}
+
+                def submit_next() -> None:
+                    shard = next(queue, None)
+                    if shard is not None:
+                        in_flight[executor.submit(self._fetch_shard, pair, shard)] = shard
+
+                for _ in range(self.concurrency * 2):
+                    submit_next()
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        shard = in_flight.pop(future)
+                        submit_next()
+                        self._complete_shard(db, symbol, shard, future, checkpoint, result)
+        finally:
+            db.close()
+
+        result.requests = self._requests
+        result.rate_limit_wait_seconds = self._wait_seconds
+        result.seconds = time.perf_counter() - begin
+        app_logger.info(
+            f"✅ 回补 {symbol} 结束：完成 {result.shards_completed} 个分片，失败 {len(result.failed_shards)} 个，"
+            f"写入 {result.ingest.rows_inserted} 条，请求 {result.requests} 次，"
+            f"限流等待 {result.rate_limit_wait_seconds:.1f}s，耗时 {result.seconds:.1f}s"
+        )
+        return result
+
+    def _complete_shard(
+            self,
+            db: Session,
+            symbol: str,
+            shard: BackfillShard,
+            future: Future,
+            checkpoint: BackfillCheckpoint,
+            result: BackfillResult
+    ) -> None:
+        """写入一个已抓取的分片并记录检查点；抓取或写入失败的分片留待下次运行"""
+        try:
+            columns = future.result()
+            if len(columns):
+                result.ingest.merge(self.writer.write(db, symbol, columns))
+        except Exception as e:
+            result.failed_shards.append(shard)
+            app_logger.error(f"❌ 分片 {_format_ms(shard.start_ms)} 回补失败: {str(e)}")
+            return
+        # 结束时间还未到的分片（包含最新数据）下次运行仍需抓取，不记录检查点
+        if shard.end_ms <= int(time.time() * 1000):
+            checkpoint.mark_done(shard)
+        result.shards_completed += 1
+        app_logger.info(
+            f"📦 分片 {_format_ms(shard.start_ms)} 完成：{len(columns)}/{shard.expected_bars} 根，"
+            f"进度 {result.shards_skipped + result.shards_completed}/{result.shards_total}"
+        )
+
+    def _fetch_shard(self, pair: str, shard: BackfillShard) -> KlineColumns:
+        """逐页抓取一个分片内已收盘的K线"""
+        pages: List[KlineColumns] = []
+        current = shard.start_ms
+        while current < shard.end_ms:
+            klines = self._fetch_page(pair, current, shard.end_ms - 1)
+            if not klines:
+                break
+            pages.append(KlineColumns.from_binance_klines(klines))
+            current = int(klines[-1][0]) + MS_PER_MINUTE
+
+        if not pages:
+            return KlineColumns.empty()
+        columns = concat_columns(*pages)
+        closed = columns.close_timestamp() <= int(time.time() * 1000)
+        return columns if closed.all() else columns.take(np.flatnonzero(closed))
+
+    def _fetch_page(self, pair: str, start_ms: int, end_ms: int) -> list:
+        """在令牌桶限制下抓取一页，限流时暂停所有线程，其他错误指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire(BinanceFetcher.KLINES_WEIGHT)
+            with self._stats_lock:
+                self._requests += 1
+                self._wait_seconds += waited
+            try:
+                klines, used_weight = self.fetcher.get_klines_page(pair, '1m', start_ms, end_ms, PAGE_LIMIT)
+            except HTTPError as e:
+                if e.code in (418, 429):
+                    retry_after = float(e.headers.get('Retry-After') or 60)
+                    app_logger.warning(f"⚠️ 触发币安限流（HTTP {e.code}），暂停 {retry_after:.0f}s")
+                    self.bucket.pause(retry_after)
+                elif attempt == self.max_retries:
+                    raise
+                else:
+                    time.sleep(min(2 ** attempt, 30))
+                continue
+            except (OSError, ValueError):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            if used_weight is not None:
+                self.bucket.sync_used(used_weight)
+            return klines
+        raise RuntimeError(f"{pair} {_format_ms(start_ms)} 重试 {self.max_retries} 次后仍失败")
+
+
+def _format_ms(timestamp_ms: int) -> str:
+    return str(np.datetime64(timestamp_ms, 'ms').astype('datetime64[m]'))
+
+
+# 创建全局实例
+kline_backfill = KlineBackfill()
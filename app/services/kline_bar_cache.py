@@ -0,0 +1,217 @@
+"""
+K线聚合结果缓存
+
+按 (品种, 时间周期) 在进程内缓存已聚合的K线：
+- 每个键对应一个固定容量的列式环形缓冲区，最后一根视为未收盘的K线
+- 增量更新时只需读取最后一根K线开盘之后的1分钟数据，替换未收盘K线并追加新K线
+- 总内存按字节数限制，超出时淘汰最久未使用的键
+- 写入只能清除本进程的缓存（invalidate_since），其他进程写入的数据（回补/抓取脚本、单独运行的实时流）
+  无法通知到这里，因此已收盘K线最多复用 max_age_seconds，超过后从数据库重新聚合
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.utils.kline_columnar import ROW_FIELDS, KlineColumns
+
+# 每根K线占用的字节数（时间戳 + 各字段均为8字节）
+BYTES_PER_BAR = 8 * (len(ROW_FIELDS) + 1)
+
+
+class BarRingBuffer:
+    """列式环形缓冲区，按时间升序保存最近 capacity 根K线"""
+
+    def __init__(self, capacity: int, interval_minutes: int):
+        self.capacity = capacity
+        self.interval_minutes = interval_minutes
+        self._timestamp = np.empty(capacity, dtype=np.int64)
+        self._fields = {
+            name: np.empty(capacity, dtype=np.int64 if name == 'trades_count' else np.float64)
+            for name in ROW_FIELDS
+        }
+        self._start = 0
+        self._size = 0
+        # 从数据库完整聚合的时间（time.monotonic），增量合并不更新
+        self.built_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self.capacity * BYTES_PER_BAR
+
+    def last_timestamp(self) -> Optional[int]:
+        """最后一根（未收盘）K线的开盘时间戳"""
+        if self._size == 0:
+            return None
+        return int(self._timestamp[(self._start + self._size - 1) % self.capacity])
+
+    def to_columns(self, limit: Optional[int] = None) -> KlineColumns:
+        """按时间顺序导出最后 limit 根K线"""
+        count = self._size if limit is None else min(limit, self._size)
+        index = (self._start + self._size - count + np.arange(count)) % self.capacity
+        return KlineColumns(
+            timestamp=self._timestamp[index],
+            interval_minutes=self.interval_minutes,
+            **{name: values[index] for name, values in self._fields.items()}
+        )
+
+    def merge(self, columns: KlineColumns) -> None:
+        """
+        合并新聚合出的K线
+
+        columns 中开盘时间不早于缓冲区最后一根的K线会覆盖对应位置，其余追加到末尾，
+        超出容量时丢弃最旧的K线。
+        """
+        if len(columns) == 0:
+            return
+
+        # 丢弃缓冲区中被新数据覆盖的尾部（通常只有未收盘的那一根）
+        first_new = int(columns.timestamp[0])
+        while self._size > 0 and self.last_timestamp() >= first_new:
+            self._size -= 1
+
+        columns = columns.tail(self.capacity)
+        count = len(columns)
+        overflow = max(0, self._size + count - self.capacity)
+        self._start = (self._start + overflow) % self.capacity
+        self._size -= overflow
+
+        index = (self._start + self._size + np.arange(count)) % self.capacity
+        self._timestamp[index] = columns.timestamp
+        for name, values in self._fields.items():
+            values[index] = getattr(columns, name)
+        self._size += count
+
+
+class KlineBarCache:
+    """按 (品种, 时间周期) 缓存聚合K线，内存有上限，提供命中统计"""
+
+    def __init__(
+            self,
+            max_bytes: int = 64 * 1024 * 1024,
+            default_capacity: int = 5000,
+            max_age_seconds: Optional[float] = settings.KLINE_CACHE_DURATION
+    ):
+        self.max_bytes = max_bytes
+        self.default_capacity = default_capacity
+        # 已收盘K线的最长复用时间，为空时只依赖本进程写入时的清除
+        self.max_age_seconds = max_age_seconds
+        self._buffers: "OrderedDict[Tuple[str, str], BarRingBuffer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup(self, symbol: str, timeframe: str, limit: int) -> Optional[int]:
+        """
+        查找能满足 limit 根K线的缓存，未找到或已过期时计入未命中
+
+        命中在随后的 merge 成功时才计入：两次调用之间缓存可能被淘汰。
+
+        Returns:
+            找到时返回最后一根（未收盘）K线的开盘时间戳，否则返回 None
+        """
+        key = (symbol, timeframe)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None and self._expired(buffer):
+                del self._buffers[key]
+                self.expirations += 1
+                buffer = None
+            if buffer is None or len(buffer) < limit:
+                self.misses += 1
+                return None
+            self._buffers.move_to_end(key)
+            return buffer.last_timestamp()
+
+    def put(self, symbol: str, timeframe: str, columns: KlineColumns) -> None:
+        """用完整的聚合结果重建缓存"""
+        if len(columns) == 0:
+            return
+        capacity = max(self.default_capacity, len(columns))
+        if capacity * BYTES_PER_BAR > self.max_bytes:
+            return
+
+        buffer = BarRingBuffer(capacity, columns.interval_minutes)
+        buffer.merge(columns)
+        key = (symbol, timeframe)
+        with self._lock:
+            self._buffers.pop(key, None)
+            self._buffers[key] = buffer
+            self._evict()
+
+    def merge(self, symbol: str, timeframe: str, columns: KlineColumns, limit: int) -> Optional[KlineColumns]:
+        """
+        将增量K线合并进已有缓存，成功时计入命中，缓存已被淘汰时计入未命中
+
+        Returns:
+            合并后最后 limit 根K线；缓存已被淘汰时返回 None
+        """
+        with self._lock:
+            buffer = self._buffers.get((symbol, timeframe))
+            if buffer is None:
+                self.misses += 1
+                return None
+            buffer.merge(columns)
+            self.hits += 1
+            return buffer.to_columns(limit)
+
+    def invalidate(self, symbol: Optional[str] = None) -> None:
+        """清除指定品种（或全部）的缓存"""
+        with self._lock:
+            for key in [key for key in self._buffers if symbol is None or key[0] == symbol]:
+                del self._buffers[key]
+
+    def invalidate_since(self, symbol: str, timestamp_ms: int) -> None:
+        """
+        清除包含 timestamp_ms 之后已收盘K线的缓存
+
+        最后一根未收盘K线每次命中都会从其开盘时间重新聚合，只有写入时间早于它的数据才会使缓存失效。
+        """
+        with self._lock:
+            for key in [key for key, buffer in self._buffers.items()
+                        if key[0] == symbol and len(buffer) and buffer.last_timestamp() > timestamp_ms]:
+                del self._buffers[key]
+
+    def _expired(self, buffer: BarRingBuffer) -> bool:
+        return self.max_age_seconds is not None and time.monotonic() - buffer.built_at > self.max_age_seconds
+
+    def _evict(self) -> None:
+        """按最近最少使用淘汰，直到总内存不超过上限"""
+        while self._buffers and self.nbytes > self.max_bytes:
+            key, _ = self._buffers.popitem(last=False)
+            self.evictions += 1
+            app_logger.debug(f"K线缓存淘汰: {key}")
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def get_statistics(self) -> Dict:
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "max_age_seconds": self.max_age_seconds,
+                "entries": len(self._buffers),
+                "memory_bytes": self.nbytes,
+                "max_memory_bytes": self.max_bytes,
+                "keys": [f"{symbol}:{timeframe}" for symbol, timeframe in self._buffers]
+            }
+
+
+# 创建全局实例
+kline_bar_cache = KlineBarCache()
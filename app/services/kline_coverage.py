@@ -0,0 +1,133 @@
+"""
+K线覆盖索引
+
+按品种在内存中维护分钟覆盖位图（MinuteBitmap），用于找出数据库中缺失的1分钟K线：
+- 首次访问时按天统计行数（GROUP BY timestamp / 86400000），满 1440 行的天直接标记为整天覆盖，
+  只对不完整的天读取 timestamp 列构建位图
+- 之后每次访问只重新加载最近两天（增量抓取写入的范围）；KlineIngestWriter 写入后直接标记新分钟
+- 回补规划器（KlineBackfill.run(only_missing=True)）只抓取缺失区间，/stats 报告缺口统计
+
+交易所本身停机造成的缺口在数据库中同样表现为缺失，会出现在统计中，回补时请求会返回空页。
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.logger import app_logger
+from app.models.kline import BtcUsdtKline, SYMBOL_TO_MODEL
+from app.utils.kline_columnar import MS_PER_MINUTE
+from app.utils.minute_bitmap import MINUTES_PER_DAY, MS_PER_DAY, MinuteBitmap
+
+
+class KlineCoverageIndex:
+    """各品种的分钟覆盖位图（内存），按需从数据库加载"""
+
+    def __init__(self, reload_days: int = 2):
+        # 每次访问时重新加载的最近天数，覆盖其他进程的增量写入
+        self.reload_days = reload_days
+        self._bitmaps: Dict[str, MinuteBitmap] = {}
+        self._lock = threading.Lock()
+
+    def get_bitmap(self, db: Session, symbol: str = "btc_usd") -> MinuteBitmap:
+        """获取品种的覆盖位图：首次访问时全量加载，之后只刷新最近几天"""
+        model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
+        table_name = model.__tablename__
+        with self._lock:
+            bitmap = self._bitmaps.get(table_name)
+            if bitmap is None:
+                begin = time.perf_counter()
+                bitmap = MinuteBitmap()
+                self._load_days(db, table_name, bitmap)
+                self._bitmaps[table_name] = bitmap
+                app_logger.info(
+                    f"🗺️ {table_name} 覆盖索引加载完成：{len(bitmap)} 天，耗时 {time.perf_counter() - begin:.2f}s"
+                )
+            else:
+                since_day = int(time.time() * 1000) // MS_PER_DAY - self.reload_days + 1
+                bitmap.clear_days(since_day)
+                self._load_days(db, table_name, bitmap, since_day)
+            return bitmap
+
+    def missing_ranges(
+            self,
+            db: Session,
+            symbol: str,
+            start_ms: int,
+            end_ms: int
+    ) -> List[Tuple[int, int]]:
+        """[start_ms, end_ms) 内数据库缺失的已收盘分钟区间（尚未收盘的当前分钟不计入）"""
+        now_ms = int(time.time() * 1000)
+        end_ms = min(end_ms, now_ms - now_ms % MS_PER_MINUTE)
+        if end_ms <= start_ms:
+            return []
+        return self.get_bitmap(db, symbol).missing_ranges(start_ms, end_ms)
+
+    def get_gap_summary(self, db: Session, symbol: str = "btc_usd", top: int = 5) -> Dict:
+        """品种在已有数据范围（最早到最新一根K线）内的缺口统计"""
+        bitmap = self.get_bitmap(db, symbol)
+        bounds = bitmap.bounds()
+        if bounds is None:
+            return {"gap_count": 0, "missing_minutes": 0, "expected_minutes": 0,
+                    "coverage_ratio": None, "largest_gaps": []}
+        return bitmap.summary(*bounds, top=top)
+
+    def mark_present(self, table_name: str, timestamps_ms: np.ndarray) -> None:
+        """写入K线后标记对应分钟（索引尚未加载时忽略，首次访问会从数据库读取）"""
+        with self._lock:
+            bitmap = self._bitmaps.get(table_name)
+            if bitmap is not None:
+                bitmap.add(timestamps_ms)
+
+    def invalidate(self, symbol: Optional[str] = None) -> None:
+        """丢弃覆盖索引，下次访问时全量加载"""
+        with self._lock:
+            if symbol is None:
+                self._bitmaps.clear()
+            else:
+                self._bitmaps.pop(SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline).__tablename__, None)
+
+    def _load_days(self, db: Session, table_name: str, bitmap: MinuteBitmap, since_day: Optional[int] = None) -> None:
+        """从数据库加载 since_day（含）之后各天的覆盖情况"""
+        since_ms = since_day * MS_PER_DAY if since_day is not None else None
+        where = "WHERE timestamp >= :since_ms" if since_ms is not None else ""
+        # 表名来自模型定义，不包含外部输入
+        day_counts = db.execute(text(f"""
+            SELECT timestamp / {MS_PER_DAY} AS day, COUNT(*) AS bars
+            FROM {table_name}
+            {where}
+            GROUP BY 1
+        """), {'since_ms': since_ms}).all()
+
+        partial_days = []
+        for day, bars in day_counts:
+            if bars >= MINUTES_PER_DAY:
+                bitmap.set_full_days([int(day)])
+            else:
+                partial_days.append(int(day))
+
+        # 相邻的不完整天合并为一次范围查询，走 timestamp 索引
+        for first_day, last_day in _contiguous_runs(sorted(partial_days)):
+            timestamps = db.execute(
+                text(f"SELECT timestamp FROM {table_name} WHERE timestamp >= :start_ms AND timestamp < :end_ms"),
+                {'start_ms': first_day * MS_PER_DAY, 'end_ms': (last_day + 1) * MS_PER_DAY}
+            ).scalars().all()
+            bitmap.add(np.fromiter(timestamps, dtype=np.int64, count=len(timestamps)))
+
+
+def _contiguous_runs(days: List[int]) -> List[Tuple[int, int]]:
+    """有序天序号 -> 连续段 [(第一天, 最后一天)]"""
+    runs: List[Tuple[int, int]] = []
+    for day in days:
+        if runs and day == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+# 创建全局实例
+kline_coverage = KlineCoverageIndex()
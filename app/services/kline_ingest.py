@@ -0,0 +1,339 @@
+"""
+K线批量写入
+
+写入流程：向量化校验 -> COPY FROM STDIN 写入临时暂存表 -> 一条 INSERT ... SELECT 合并进K线表。
+- 暂存表价格为 float8，合并时经 text 转为 numeric，保留报价的最短往返表示
+- 合并依赖开盘时间唯一索引（doc/sql/kline_unique_open_time.sql），以 ON CONFLICT (open_time) 幂等写入：
+  默认跳过已存在的开盘时间；update_existing=True 时覆盖已存在且数值有变化的K线（如尚未收盘的最新一根），
+  update_columns 限定覆盖的列：只有 OHLCV 的数据源（ccxt fetch_ohlcv）只覆盖 OHLCV_UPDATE_COLUMNS，
+  不会用估算的成交额、成交笔数、主动买入量改写交易所原始K线写入的真实值
+- 少量K线（增量抓取、实时更新）不经暂存表，直接以多行 INSERT ... VALUES 写入，冲突处理相同
+- 每次写入记录接收/拒绝/新增/覆盖行数和耗时，以 rows/s 报告吞吐
+- 写入后刷新持续聚合视图中被写入范围覆盖的已走完的桶：刷新策略只覆盖最近一段，
+  回补和缺口补齐写入的更早数据要靠这里更新视图
+"""
+import io
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal_column, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.logger import app_logger
+from app.crud.kline_columns_dao import kline_columns_dao
+from app.models.kline import SYMBOL_TO_MODEL
+from app.services.chan_adapter import chan_adapter
+from app.services.kline_bar_cache import kline_bar_cache
+from app.services.kline_coverage import kline_coverage
+from app.services.kline_statistics import kline_statistics
+from app.utils.kline_columnar import MS_PER_MINUTE, ROW_FIELDS, KlineColumns
+from app.utils.kline_copy import (
+    COPY_COLUMNS, copy_column_name, encode_copy_binary, encode_copy_csv, validate_columns
+)
+
+# 暂存表结构：与 COPY 编码的列顺序和类型一致
+_STAGING_COLUMN_TYPES = (
+    'bigint', 'timestamp', 'timestamp',
+    'float8', 'float8', 'float8', 'float8',
+    'float8', 'float8', 'bigint',
+    'float8', 'float8'
+)
+
+# 冲突时覆盖的列：开盘时间（冲突键）和毫秒时间戳由开盘时间决定，不需要更新
+_UPDATE_COLUMNS = tuple(name for name in COPY_COLUMNS if name not in ('timestamp', 'open_time'))
+
+# OHLCV 数据源可以覆盖的列（其余列由 KlineColumns.from_ohlcv 估算，不能覆盖已有的真实值）
+OHLCV_UPDATE_COLUMNS = ('close_time', 'open_price', 'high_price', 'low_price', 'close_price', 'volume')
+
+
+@dataclass
+class IngestResult:
+    """一次（或累计多次）写入的统计"""
+    table_name: str
+    rows_received: int = 0
+    rows_rejected: int = 0
+    # 新插入的行数
+    rows_inserted: int = 0
+    # 开盘时间已存在、数值有变化而被覆盖的行数（仅 update_existing 时）
+    rows_updated: int = 0
+    seconds: float = 0.0
+    rejected_reasons: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def rows_written(self) -> int:
+        """新插入和被覆盖的行数"""
+        return self.rows_inserted + self.rows_updated
+
+    @property
+    def rows_skipped(self) -> int:
+        """通过校验但已存在于K线表中、未被写入的行数"""
+        return self.rows_received - self.rows_rejected - self.rows_written
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_received / self.seconds if self.seconds > 0 else 0.0
+
+    def merge(self, other: "IngestResult") -> None:
+        """累加另一次写入的统计"""
+        self.rows_received += other.rows_received
+        self.rows_rejected += other.rows_rejected
+        self.rows_inserted += other.rows_inserted
+        self.rows_updated += other.rows_updated
+        self.seconds += other.seconds
+        for reason, count in other.rejected_reasons.items():
+            self.rejected_reasons[reason] = self.rejected_reasons.get(reason, 0) + count
+
+    def to_dict(self) -> Dict:
+        return {
+            "table_name": self.table_name,
+            "rows_received": self.rows_received,
+            "rows_rejected": self.rows_rejected,
+            "rows_inserted": self.rows_inserted,
+            "rows_updated": self.rows_updated,
+            "rows_skipped": self.rows_skipped,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "rejected_reasons": self.rejected_reasons
+        }
+
+
+class KlineIngestWriter:
+    """基于 COPY 的K线批量写入器"""
+
+    COPY_FORMATS = ('binary', 'csv')
+
+    def __init__(
+            self,
+            copy_format: str = 'binary',
+            chunk_rows: int = 200_000,
+            values_threshold: int = 5_000,
+            values_batch_rows: int = 1_000
+    ):
+        if copy_format not in self.COPY_FORMATS:
+            raise ValueError(f"不支持的 COPY 格式: {copy_format}")
+        self.copy_format = copy_format
+        # 单次 COPY 的最大行数，限制编码缓冲区的内存占用
+        self.chunk_rows = chunk_rows
+        # 不超过该行数时直接多行 INSERT ... VALUES，省去暂存表的创建和合并
+        self.values_threshold = values_threshold
+        # 每条 INSERT ... VALUES 语句的行数（每行12个绑定参数）
+        self.values_batch_rows = values_batch_rows
+
+    def write(
+            self,
+            db: Session,
+            symbol: str,
+            columns: KlineColumns,
+            update_existing: bool = False,
+            update_columns: Sequence[str] = _UPDATE_COLUMNS
+    ) -> IngestResult:
+        """
+        校验并写入一批1分钟K线（单个事务）
+
+        Args:
+            db: 主库会话
+            symbol: 交易品种（SYMBOL_TO_MODEL 中的键）
+            columns: 待写入的列式K线，timestamp 为开盘时间的毫秒时间戳（UTC）
+            update_existing: 开盘时间已存在时是否以新数据覆盖（用于刷新尚未收盘的K线）
+            update_columns: 覆盖时更新（并比较是否变化）的列，默认除开盘时间和时间戳外的全部列
+        """
+        model = SYMBOL_TO_MODEL.get(symbol)
+        if model is None:
+            raise ValueError(f"不支持的交易品种: {symbol}")
+        table_name = model.__tablename__
+
+        begin = time.perf_counter()
+        result = IngestResult(table_name=table_name, rows_received=len(columns))
+
+        valid, reasons = validate_columns(columns)
+        result.rejected_reasons = reasons
+        result.rows_rejected = int((~valid).sum())
+        if result.rows_rejected:
+            app_logger.warning(f"⚠️ {table_name} 拒绝 {result.rows_rejected} 条无效K线: {reasons}")
+        columns = columns.take(valid)
+
+        if len(columns) > 0:
+            try:
+                if len(columns) <= self.values_threshold:
+                    result.rows_inserted, result.rows_updated = self._upsert_values(
+                        db, model, columns, update_existing, update_columns
+                    )
+                else:
+                    staging = self._create_staging_table(db, table_name)
+                    for start in range(0, len(columns), self.chunk_rows):
+                        self._copy(db, staging, columns.take(slice(start, start + self.chunk_rows)))
+                    result.rows_inserted, result.rows_updated = self._merge(
+                        db, table_name, staging, update_existing, update_columns
+                    )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            # 已存在而被跳过的行同样在库中，一并标记
+            kline_coverage.mark_present(table_name, columns.timestamp)
+
+        result.seconds = time.perf_counter() - begin
+        if result.rows_written:
+            self._after_ingest(db, model, columns, result.rows_inserted)
+        app_logger.info(
+            f"💾 {table_name} 新增 {result.rows_inserted}/{result.rows_received} 条，"
+            f"{f'覆盖 {result.rows_updated} 条，' if update_existing else ''}"
+            f"跳过已存在{'且未变化' if update_existing else ''} {result.rows_skipped} 条，耗时 {result.seconds:.3f}s，"
+            f"{result.rows_per_second:,.0f} rows/s"
+        )
+        return result
+
+    def write_batches(
+            self,
+            db: Session,
+            symbol: str,
+            batches: Iterable[KlineColumns],
+            update_existing: bool = False,
+            update_columns: Sequence[str] = _UPDATE_COLUMNS
+    ) -> IngestResult:
+        """逐批写入（每批一个事务），返回累计统计"""
+        total: Optional[IngestResult] = None
+        for columns in batches:
+            result = self.write(db, symbol, columns, update_existing=update_existing, update_columns=update_columns)
+            if total is None:
+                total = result
+            else:
+                total.merge(result)
+        if total is None:
+            total = IngestResult(table_name=SYMBOL_TO_MODEL[symbol].__tablename__)
+        app_logger.info(
+            f"✅ {total.table_name} 累计新增 {total.rows_inserted} 条，覆盖 {total.rows_updated} 条，"
+            f"平均 {total.rows_per_second:,.0f} rows/s"
+        )
+        return total
+
+    def _create_staging_table(self, db: Session, table_name: str) -> str:
+        """创建事务级临时暂存表（提交时自动删除）"""
+        staging = f"_staging_{table_name}"
+        column_defs = ', '.join(f"{name} {column_type}" for name, column_type in zip(COPY_COLUMNS, _STAGING_COLUMN_TYPES))
+        db.execute(text(f"CREATE TEMP TABLE {staging} ({column_defs}) ON COMMIT DROP"))
+        return staging
+
+    def _copy(self, db: Session, staging: str, columns: KlineColumns) -> None:
+        """通过 COPY FROM STDIN 写入暂存表（兼容 psycopg2 与 psycopg 3）"""
+        if self.copy_format == 'binary':
+            data = encode_copy_binary(columns)
+            options = "FORMAT binary"
+        else:
+            data = encode_copy_csv(columns)
+            options = "FORMAT csv"
+        sql = f"COPY {staging} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH ({options})"
+
+        # 使用会话当前事务所在的底层连接
+        dbapi_connection = db.connection().connection.dbapi_connection
+        with dbapi_connection.cursor() as cursor:
+            if hasattr(cursor, 'copy_expert'):
+                cursor.copy_expert(sql, io.BytesIO(data))
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(data)
+
+    def _merge(
+            self,
+            db: Session,
+            table_name: str,
+            staging: str,
+            update_existing: bool,
+            update_columns: Sequence[str]
+    ) -> Tuple[int, int]:
+        """
+        将暂存表合并进K线表（按开盘时间幂等），返回 (新插入行数, 覆盖行数)
+
+        RETURNING (xmax = 0) 区分两者：新插入的行版本 xmax 为0，ON CONFLICT DO UPDATE 产生的行版本不为0。
+        """
+        numeric_columns = [name for name in COPY_COLUMNS if name.endswith(('_price', 'volume'))]
+        select_list = ', '.join(
+            f"s.{name}::text::numeric" if name in numeric_columns else f"s.{name}"
+            for name in COPY_COLUMNS
+        )
+        if update_existing:
+            # 只有数值确实变化的行才更新，重复写入相同数据不产生死元组
+            on_conflict = f"""
+                DO UPDATE SET {', '.join(f"{name} = EXCLUDED.{name}" for name in update_columns)}, updated_at = now()
+                WHERE ({', '.join(f"t.{name}" for name in update_columns)})
+                    IS DISTINCT FROM ({', '.join(f"EXCLUDED.{name}" for name in update_columns)})"""
+        else:
+            on_conflict = "DO NOTHING"
+        # 表名来自模型定义，不包含外部输入
+        inserted, written = db.execute(text(f"""
+            WITH written AS (
+                INSERT INTO {table_name} AS t ({', '.join(COPY_COLUMNS)})
+                SELECT {select_list}
+                FROM {staging} s
+                ON CONFLICT (open_time) {on_conflict}
+                RETURNING (t.xmax = 0) AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted), count(*) FROM written
+        """)).one()
+        return inserted, written - inserted
+
+    def _upsert_values(
+            self,
+            db: Session,
+            model,
+            columns: KlineColumns,
+            update_existing: bool,
+            update_columns: Sequence[str]
+    ) -> Tuple[int, int]:
+        """以多行 INSERT ... VALUES ... ON CONFLICT (open_time) 写入少量K线，返回 (新插入行数, 覆盖行数)"""
+        table = model.__table__
+        open_time = columns.timestamp.astype('datetime64[ms]').astype('datetime64[us]')
+        close_time = open_time + np.timedelta64(columns.interval_minutes * MS_PER_MINUTE, 'ms')
+        values = {
+            'timestamp': columns.timestamp.tolist(),
+            'open_time': open_time.tolist(),
+            'close_time': close_time.tolist(),
+        }
+        # 浮点数按 repr 传给驱动，与 COPY 路径一样保留最短往返表示
+        values.update({copy_column_name(name): getattr(columns, name).tolist() for name in ROW_FIELDS})
+        rows = [dict(zip(COPY_COLUMNS, row)) for row in zip(*(values[name] for name in COPY_COLUMNS))]
+
+        inserted = written = 0
+        for start in range(0, len(rows), self.values_batch_rows):
+            stmt = pg_insert(table).values(rows[start:start + self.values_batch_rows])
+            if update_existing:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.open_time],
+                    set_={**{name: stmt.excluded[name] for name in update_columns}, 'updated_at': func.now()},
+                    where=tuple_(*(table.c[name] for name in update_columns)).is_distinct_from(
+                        tuple_(*(stmt.excluded[name] for name in update_columns))
+                    )
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.open_time])
+            flags = db.execute(stmt.returning(literal_column('xmax = 0'))).scalars().all()
+            inserted += sum(flags)
+            written += len(flags)
+        return inserted, written - inserted
+
+    def _after_ingest(self, db: Session, model, columns: KlineColumns, rows_inserted: int) -> None:
+        """
+        写入后更新统计快照（数量只累加新插入的行）；
+        刷新持续聚合视图中写入范围内已走完的桶（写入在其他进程中同样生效）；
+        补写或覆盖了已缓存K线范围内的数据时清除对应的聚合缓存和缠论分析缓存
+        """
+        table_name = model.__tablename__
+        last = int(np.argmax(columns.timestamp))
+        earliest = int(columns.timestamp.min())
+        try:
+            kline_columns_dao.refresh_views(db, model, earliest, int(columns.timestamp[last]) + MS_PER_MINUTE)
+        except Exception as e:
+            # 数据已提交，刷新失败时视图路径的旧桶要等刷新策略或下一次覆盖该范围的写入
+            app_logger.error(f"❌ {table_name} 刷新持续聚合视图失败: {str(e)}")
+        latest_open_time = datetime(1970, 1, 1) + timedelta(milliseconds=int(columns.timestamp[last]))
+        kline_statistics.record_ingest(table_name, rows_inserted, latest_open_time, float(columns.close[last]))
+        kline_bar_cache.invalidate_since(table_name, earliest)
+        chan_adapter.invalidate_since(table_name, earliest)
+
+
+# 创建全局实例
+kline_ingest_writer = KlineIngestWriter()
@@ -0,0 +1,215 @@
+"""
+K线数据集统计
+
+按品种在内存中维护数据量、起止时间和最新价格，请求直接读取内存结果：
+- 数据量优先使用 TimescaleDB approximate_row_count（普通 PostgreSQL 使用 pg_class.reltuples），
+  避免每次请求对整张超表执行 COUNT(*)
+- 起止时间和最新价格通过 open_time 索引读取
+- 后台线程按固定间隔刷新；写入新数据后可调用 record_ingest 立即更新
+"""
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.core.logger import app_logger
+from app.crud.kline_columns_dao import kline_columns_dao
+from app.models.kline import BtcUsdtKline, SYMBOL_TO_MODEL
+
+EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass
+class SymbolStatistics:
+    """单个品种的统计快照"""
+    table_name: str
+    total_klines: int
+    earliest_open_time: Optional[datetime]
+    latest_open_time: Optional[datetime]
+    latest_price: Optional[float]
+    approximate: bool
+    updated_at: datetime
+
+    @property
+    def latest_timestamp(self) -> Optional[int]:
+        """最新K线开盘时间的毫秒时间戳"""
+        if self.latest_open_time is None:
+            return None
+        return int((self.latest_open_time - EPOCH).total_seconds() * 1000)
+
+    @property
+    def earliest_timestamp(self) -> Optional[int]:
+        """最早K线开盘时间的毫秒时间戳"""
+        if self.earliest_open_time is None:
+            return None
+        return int((self.earliest_open_time - EPOCH).total_seconds() * 1000)
+
+    def to_dict(self) -> Dict:
+        """与 KlineAggregator.get_data_statistics 原有返回格式保持一致"""
+        if self.total_klines == 0:
+            return {
+                "total_klines": 0,
+                "date_range": None,
+                "latest_price": None
+            }
+        return {
+            "total_klines": self.total_klines,
+            "date_range": {
+                "start": self.earliest_open_time.isoformat() if self.earliest_open_time else None,
+                "end": self.latest_open_time.isoformat() if self.latest_open_time else None
+            },
+            "latest_price": self.latest_price,
+            "data_coverage": f"{self.total_klines // 1440:.1f} 天" if self.total_klines > 1440 else f"{self.total_klines} 条记录",
+            "approximate": self.approximate,
+            "updated_at": self.updated_at.isoformat()
+        }
+
+
+class KlineStatisticsService:
+    """K线统计服务：内存缓存 + 后台刷新"""
+
+    def __init__(self, refresh_interval: float = 60.0, session_factory: Optional[Callable[[], Session]] = None):
+        self.refresh_interval = refresh_interval
+        self._session_factory = session_factory
+        self._snapshots: Dict[str, SymbolStatistics] = {}
+        self._models: Dict[str, type] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get_statistics(self, db: Session, symbol: str = "btc_usd") -> SymbolStatistics:
+        """
+        获取品种统计（优先返回内存中的结果）
+
+        首次访问某个品种时使用当前会话同步计算一次，之后由后台线程定期刷新。
+        """
+        model = SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline)
+        table_name = model.__tablename__
+        with self._lock:
+            snapshot = self._snapshots.get(table_name)
+        if snapshot is None:
+            snapshot = self.refresh(db, model)
+            self.start()
+        return snapshot
+
+    def refresh(self, db: Session, model) -> SymbolStatistics:
+        """从数据库重新计算指定模型的统计信息"""
+        table_name = model.__tablename__
+        total_klines, approximate = self._count_rows(db, table_name)
+
+        earliest, latest = db.query(func.min(model.open_time), func.max(model.open_time)).one()
+        latest_price = None
+        if latest is not None:
+            latest_price = db.query(model.close_price).filter(model.open_time == latest).scalar()
+            if total_klines == 0:
+                # 表刚写入、尚未 ANALYZE 时估算值为0，回退到精确计数
+                total_klines, approximate = self._count_rows_exact(db, table_name), False
+
+        snapshot = SymbolStatistics(
+            table_name=table_name,
+            total_klines=total_klines,
+            earliest_open_time=earliest,
+            latest_open_time=latest,
+            latest_price=float(latest_price) if latest_price is not None else None,
+            approximate=approximate,
+            updated_at=datetime.now()
+        )
+        with self._lock:
+            self._snapshots[table_name] = snapshot
+            self._models[table_name] = model
+        app_logger.debug(f"K线统计已刷新 {table_name}: {total_klines} 条")
+        return snapshot
+
+    def record_ingest(
+            self,
+            table_name: str,
+            rows: int,
+            latest_open_time: Optional[datetime] = None,
+            latest_price: Optional[float] = None
+    ) -> None:
+        """写入新数据后更新内存统计（数量按新增行数累加，下次后台刷新时校正）"""
+        with self._lock:
+            snapshot = self._snapshots.get(table_name)
+            if snapshot is None:
+                return
+            snapshot.total_klines += rows
+            if latest_open_time and (snapshot.latest_open_time is None or latest_open_time >= snapshot.latest_open_time):
+                snapshot.latest_open_time = latest_open_time
+                if latest_price is not None:
+                    snapshot.latest_price = latest_price
+            if snapshot.earliest_open_time is None:
+                snapshot.earliest_open_time = latest_open_time
+            snapshot.updated_at = datetime.now()
+
+    def invalidate(self, symbol: Optional[str] = None) -> None:
+        """丢弃内存中的统计，下次访问时重新计算"""
+        with self._lock:
+            if symbol is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(SYMBOL_TO_MODEL.get(symbol, BtcUsdtKline).__tablename__, None)
+
+    def start(self) -> None:
+        """启动后台刷新线程（重复调用无副作用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="kline-statistics", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台刷新线程"""
+        self._stop_event.set()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop_event.wait(self.refresh_interval):
+            with self._lock:
+                models = list(self._models.values())
+            if not models:
+                continue
+            db = self._new_session()
+            try:
+                for model in models:
+                    self.refresh(db, model)
+            except Exception as e:
+                app_logger.error(f"❌ 后台刷新K线统计失败: {str(e)}")
+                db.rollback()
+            finally:
+                db.close()
+
+    def _new_session(self) -> Session:
+        if self._session_factory is None:
+            from app.db.session import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def _count_rows(self, db: Session, table_name: str) -> Tuple[int, bool]:
+        """估算表行数，返回 (行数, 是否为近似值)"""
+        if kline_columns_dao.get_bucket_backend(db) == 'time_bucket':
+            count = db.execute(
+                text("SELECT approximate_row_count(CAST(:table_name AS regclass))"),
+                {'table_name': table_name}
+            ).scalar()
+            if count is not None and count >= 0:
+                return int(count), True
+
+        count = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table_name"),
+            {'table_name': table_name}
+        ).scalar()
+        if count is not None and count >= 0:
+            return int(count), True
+
+        # 从未 ANALYZE 过的表没有估算值，回退到精确计数
+        return self._count_rows_exact(db, table_name), False
+
+    def _count_rows_exact(self, db: Session, table_name: str) -> int:
+        # 表名来自模型定义，不包含外部输入
+        return int(db.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar())
+
+
+# 创建全局实例
+kline_statistics = KlineStatisticsService()
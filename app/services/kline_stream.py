@@ -0,0 +1,353 @@
+"""
+K线实时写入（币安 WebSocket）
+
+订阅所有 SymbolEnum 品种的 1分钟K线组合流（<symbol>@kline_1m），替代轮询 /fetch-data：
+- 收到已收盘（x=true）的K线后立即在线程池中以 ON CONFLICT (open_time) 幂等写入（单行 INSERT ... VALUES）
+- 未收盘的当前K线只保存在内存中（get_live_bar），供接口返回最新价格
+- 每条推送（含未收盘K线）同时交给缠论增量分析器（chan_incremental），已创建分析器的周期实时更新
+- 没有对应数据表模型（SYMBOL_TO_MODEL）的品种只维护内存中的最新K线，不写入数据库
+- 每次连接（包括断线重连）后，用 REST 接口补齐上次收盘K线到当前分钟之间的缺口；
+  首次启动时以数据库中最新的K线为起点，超过 max_gap_fill_minutes 的缺口只补最近一段，其余交给历史回补
+- 断线按指数退避 + 抖动重连；单条推送解析或处理失败只记录日志，不中断连接
+- 写入失败（如数据库重启）不推进该品种的写入位置：之后第一次写入成功时从失败前的位置补齐缺口
+
+依赖 aiohttp（pip install turtle-front[binance]）。stream_url / rest 客户端可指向本地模拟服务。
+"""
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.data.binance.async_binance_client import AIOHTTP_AVAILABLE, AsyncBinanceClient, json_loads
+from app.db.session import SessionLocal
+from app.models.kline import SYMBOL_TO_MODEL
+from app.services.chan_incremental import chan_incremental
+from app.services.kline_ingest import KlineIngestWriter, kline_ingest_writer
+from app.utils.kline_columnar import MS_PER_MINUTE, KlineColumns
+from common.model import SymbolEnum
+
+if AIOHTTP_AVAILABLE:
+    import aiohttp
+
+
+@dataclass
+class LiveBar:
+    """WebSocket 推送的最新一根K线"""
+    table_name: str
+    timestamp: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    quote_volume: float
+    trades_count: int
+    taker_buy_volume: float
+    taker_buy_quote_volume: float
+    closed: bool
+    event_time: int
+
+    @classmethod
+    def from_stream(cls, table_name: str, data: Dict) -> "LiveBar":
+        """由 kline 事件构建（data 为组合流消息中的 data 字段）"""
+        k = data['k']
+        return cls(
+            table_name=table_name,
+            timestamp=int(k['t']),
+            open=float(k['o']),
+            high=float(k['h']),
+            low=float(k['l']),
+            close=float(k['c']),
+            volume=float(k['v']),
+            quote_volume=float(k['q']),
+            trades_count=int(k['n']),
+            taker_buy_volume=float(k['V']),
+            taker_buy_quote_volume=float(k['Q']),
+            closed=bool(k['x']),
+            event_time=int(data.get('E', 0))
+        )
+
+    def to_columns(self) -> KlineColumns:
+        """转换为单根K线的列式数据"""
+        return KlineColumns(
+            timestamp=np.array([self.timestamp], dtype=np.int64),
+            open=np.array([self.open]),
+            high=np.array([self.high]),
+            low=np.array([self.low]),
+            close=np.array([self.close]),
+            volume=np.array([self.volume]),
+            quote_volume=np.array([self.quote_volume]),
+            trades_count=np.array([self.trades_count], dtype=np.int64),
+            taker_buy_volume=np.array([self.taker_buy_volume]),
+            taker_buy_quote_volume=np.array([self.taker_buy_quote_volume])
+        )
+
+    def to_dict(self) -> Dict:
+        result = self.to_columns().to_dict_list()[0]
+        result.update({"closed": self.closed, "event_time": self.event_time})
+        return result
+
+
+class KlineStreamIngester:
+    """1分钟K线 WebSocket 实时写入器"""
+
+    def __init__(
+            self,
+            stream_url: str = settings.BINANCE_STREAM_URL,
+            symbols: Optional[List[SymbolEnum]] = None,
+            writer: KlineIngestWriter = kline_ingest_writer,
+            session_factory: Callable[[], Session] = SessionLocal,
+            rest_client_factory: Optional[Callable[[], AsyncBinanceClient]] = None,
+            max_gap_fill_minutes: int = settings.KLINE_STREAM_MAX_GAP_FILL_MINUTES,
+            reconnect_delay_cap: float = 60.0
+    ):
+        self.stream_url = stream_url.rstrip('/')
+        self.symbols = symbols or list(SymbolEnum)
+        self.writer = writer
+        self.session_factory = session_factory
+        self.rest_client_factory = rest_client_factory or AsyncBinanceClient
+        self.max_gap_fill_minutes = max_gap_fill_minutes
+        self.reconnect_delay_cap = reconnect_delay_cap
+
+        # 品种名（btcusdt）-> 表名（btc_usdt）
+        self._tables = {symbol.symbolName: symbol.tablePrefix for symbol in self.symbols}
+        self._writable = {table for table in self._tables.values() if table in SYMBOL_TO_MODEL}
+        self._live_bars: Dict[str, LiveBar] = {}
+        # 表名 -> 最后一根已写入的收盘K线开盘时间（毫秒）
+        self._last_closed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._gap_fill_tasks: set = set()
+        # 写入失败、待缺口补齐的表名
+        self._gap_pending: set = set()
+        self.connected = False
+        self.reconnects = 0
+        self.bars_written = 0
+        self.messages_failed = 0
+        self.last_message_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    def get_live_bar(self, table_name: str) -> Optional[LiveBar]:
+        """品种当前（可能未收盘）的最新K线"""
+        with self._lock:
+            return self._live_bars.get(table_name)
+
+    def start(self) -> None:
+        """在后台线程中运行（重复调用无副作用）"""
+        if not AIOHTTP_AVAILABLE:
+            raise RuntimeError("aiohttp 未安装，无法启动K线实时写入")
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="kline-stream", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """通知后台循环退出"""
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def request_gap_fill(self) -> bool:
+        """在运行中的循环上触发一次缺口补齐（不阻塞调用方），未运行时返回 False"""
+        if self._loop is None or not self.connected:
+            return False
+        self._loop.call_soon_threadsafe(self._schedule_gap_fill)
+        return True
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            live = {table: bar.to_dict() for table, bar in self._live_bars.items()}
+            bars_written = self.bars_written
+        return {
+            "running": self._loop is not None,
+            "connected": self.connected,
+            "symbols": list(self._tables.values()),
+            "writable_symbols": sorted(self._writable),
+            "reconnects": self.reconnects,
+            "bars_written": bars_written,
+            "messages_failed": self.messages_failed,
+            "gap_fill_pending": sorted(self._gap_pending.copy()),
+            "last_message_at": self.last_message_at,
+            "last_error": self.last_error,
+            "live_bars": live
+        }
+
+    # ------------------------------------------------------------------
+    # 事件循环
+    # ------------------------------------------------------------------
+
+    async def run(self) -> None:
+        """连接、接收、断线重连，直到 stop()"""
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        streams = '/'.join(f"{name}@kline_1m" for name in self._tables)
+        url = f"{self.stream_url}/stream?streams={streams}"
+        attempt = 0
+        try:
+            async with aiohttp.ClientSession() as session:
+                while not self._stop_event.is_set():
+                    try:
+                        async with session.ws_connect(url, heartbeat=30) as ws:
+                            self.connected = True
+                            attempt = 0
+                            app_logger.info(f"🔌 K线实时流已连接: {', '.join(self._tables.values())}")
+                            self._schedule_gap_fill()
+                            await self._receive(ws)
+                    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                        self.last_error = str(e)
+                        app_logger.warning(f"⚠️ K线实时流连接异常: {str(e)}")
+                    except Exception as e:
+                        # 意外错误同样重连，不让后台线程退出
+                        self.last_error = str(e)
+                        app_logger.error(f"❌ K线实时流异常: {type(e).__name__}: {str(e)}")
+                    finally:
+                        self.connected = False
+                    if self._stop_event.is_set():
+                        break
+                    self.reconnects += 1
+                    delay = random.uniform(0, min(self.reconnect_delay_cap, 2 ** attempt))
+                    attempt += 1
+                    app_logger.info(f"🔁 {delay:.1f}s 后重连K线实时流")
+                    try:
+                        await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                if self._gap_fill_tasks:
+                    await asyncio.gather(*self._gap_fill_tasks, return_exceptions=True)
+        finally:
+            self._loop = None
+            app_logger.info("⏹️ K线实时流已停止")
+
+    async def _receive(self, ws) -> None:
+        stop_wait = asyncio.ensure_future(self._stop_event.wait())
+        try:
+            while True:
+                receive = asyncio.ensure_future(ws.receive())
+                done, _ = await asyncio.wait({receive, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+                if stop_wait in done:
+                    receive.cancel()
+                    await ws.close()
+                    return
+                message = receive.result()
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    try:
+                        await self._handle_message(message.data)
+                    except Exception as e:
+                        self.messages_failed += 1
+                        self.last_error = f"处理推送失败: {str(e)}"
+                        app_logger.warning(f"⚠️ K线推送处理失败，已跳过: {type(e).__name__}: {str(e)}")
+                elif message.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    self.last_error = f"连接关闭: {ws.exception() or message.extra}"
+                    return
+        finally:
+            stop_wait.cancel()
+
+    async def _handle_message(self, raw: str) -> None:
+        self.last_message_at = time.time()
+        payload = json_loads(raw)
+        data = payload.get('data', payload)
+        if data.get('e') != 'kline':
+            return
+        table_name = self._tables.get(data['s'].lower())
+        if table_name is None:
+            return
+
+        bar = LiveBar.from_stream(table_name, data)
+        with self._lock:
+            current = self._live_bars.get(table_name)
+            if current is None or bar.timestamp >= current.timestamp:
+                self._live_bars[table_name] = bar
+        chan_incremental.on_minute_bar(table_name, {
+            'timestamp': bar.timestamp, 'high_price': bar.high, 'low_price': bar.low, 'close_price': bar.close
+        })
+        if bar.closed and table_name in self._writable:
+            try:
+                await asyncio.to_thread(self._write, table_name, bar.to_columns())
+            except Exception as e:
+                # 不推进写入位置，恢复后由缺口补齐从这里重新写入
+                self._gap_pending.add(table_name)
+                self.last_error = f"{table_name} 写入失败: {str(e)}"
+                app_logger.error(f"❌ {table_name} 实时K线写入失败，恢复后补齐: {str(e)}")
+                return
+            if table_name in self._gap_pending:
+                if not self._gap_fill_tasks:
+                    self._schedule_gap_fill()
+            else:
+                self._last_closed[table_name] = max(self._last_closed.get(table_name, 0), bar.timestamp)
+
+    def _write(self, table_name: str, columns: KlineColumns) -> int:
+        """写入已收盘K线（在线程池中执行）"""
+        with self.session_factory() as db:
+            result = self.writer.write(db, table_name, columns, update_existing=True)
+        with self._lock:
+            self.bars_written += result.rows_written
+        return result.rows_written
+
+    # ------------------------------------------------------------------
+    # 缺口补齐
+    # ------------------------------------------------------------------
+
+    def _schedule_gap_fill(self) -> None:
+        task = asyncio.ensure_future(self._fill_gaps())
+        self._gap_fill_tasks.add(task)
+        task.add_done_callback(self._gap_fill_tasks.discard)
+
+    async def _fill_gaps(self) -> None:
+        """补齐每个品种从最后一根已收盘K线到当前分钟之间的数据"""
+        now_ms = int(time.time() * 1000)
+        end_ms = now_ms - now_ms % MS_PER_MINUTE
+        try:
+            async with self.rest_client_factory() as client:
+                for symbol_name, table_name in self._tables.items():
+                    if table_name not in self._writable:
+                        continue
+                    last = self._last_closed.get(table_name)
+                    if last is None:
+                        last = await asyncio.to_thread(self._latest_timestamp, table_name)
+                    if last is None:
+                        app_logger.info(f"ℹ️ {table_name} 暂无数据，跳过缺口补齐（历史数据请使用回补脚本）")
+                        continue
+                    start_ms = max(last + MS_PER_MINUTE, end_ms - self.max_gap_fill_minutes * MS_PER_MINUTE)
+                    if start_ms > last + MS_PER_MINUTE:
+                        app_logger.warning(
+                            f"⚠️ {table_name} 缺口超过 {self.max_gap_fill_minutes} 分钟，只补齐最近一段"
+                        )
+                    if start_ms < end_ms:
+                        columns = await client.get_klines_range(symbol_name, '1m', start_ms, end_ms)
+                        # 只写入已收盘的K线，当前分钟由实时流负责
+                        columns = columns.take(np.flatnonzero(columns.close_timestamp() <= end_ms))
+                        if len(columns):
+                            written = await asyncio.to_thread(self._write, table_name, columns)
+                            self._last_closed[table_name] = max(
+                                self._last_closed.get(table_name, 0), int(columns.timestamp[-1])
+                            )
+                            app_logger.info(f"🩹 {table_name} 补齐 {written}/{len(columns)} 根K线")
+                    self._gap_pending.discard(table_name)
+        except Exception as e:
+            self.last_error = f"缺口补齐失败: {str(e)}"
+            app_logger.error(f"❌ K线缺口补齐失败: {str(e)}")
+
+    def _latest_timestamp(self, table_name: str) -> Optional[int]:
+        """数据库中最新K线的开盘时间（毫秒）"""
+        with self.session_factory() as db:
+            # 表名来自 SymbolEnum，不包含外部输入
+            value = db.execute(text(f"SELECT MAX(timestamp) FROM {table_name}")).scalar()
+        return int(value) if value is not None else None
+
+
+# 创建全局实例
+kline_stream = KlineStreamIngester()
@@ -0,0 +1,115 @@
+"""
+分型（顶/底分型）向量化识别
+
+以最高价/最低价数组为输入，用错位数组比较一次性找出所有分型，不逐根K线循环：
+- 顶分型：中间K线的高点和低点都高于左右两根
+- 底分型：中间K线的高点和低点都低于左右两根
+- 强度：中间K线振幅 / 三根K线平均振幅，限制在 [0.1, 3.0]；平均振幅不大于0时为 1.0
+
+计算顺序与 ChanMultiLevelStrategy 原有的逐根实现一致，结果逐位相同。
+classify_fenxing 是同一规则的单点版本，供逐根K线的增量分析使用。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FENXING_TOP = 1
+FENXING_BOTTOM = -1
+
+_STRENGTH_MIN = 0.1
+_STRENGTH_MAX = 3.0
+
+
+@dataclass
+class FenxingArrays:
+    """分型识别结果（按K线下标升序）"""
+    index: np.ndarray      # 中间K线下标 int64
+    kind: np.ndarray       # FENXING_TOP / FENXING_BOTTOM int8
+    price: np.ndarray      # 顶分型为最高价，底分型为最低价
+    strength: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.index.shape[0])
+
+    def to_dict_list(self, timestamps: Sequence) -> List[Dict]:
+        """
+        转换为原有的分型字典列表
+
+        Args:
+            timestamps: 每根K线的时间戳（原样写入结果，与输入K线一一对应）
+        """
+        types = np.where(self.kind == FENXING_TOP, 'top', 'bottom').tolist()
+        return [
+            {'type': kind, 'timestamp': timestamps[i], 'price': price, 'index': i, 'strength': strength}
+            for kind, i, price, strength in zip(
+                types, self.index.tolist(), self.price.tolist(), self.strength.tolist()
+            )
+        ]
+
+
+def find_fenxings(high: np.ndarray, low: np.ndarray) -> FenxingArrays:
+    """
+    识别顶/底分型
+
+    Args:
+        high: 最高价数组（float64）
+        low: 最低价数组（float64），与 high 等长
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    if high.shape[0] < 3:
+        return FenxingArrays(
+            index=np.empty(0, dtype=np.int64),
+            kind=np.empty(0, dtype=np.int8),
+            price=np.empty(0, dtype=np.float64),
+            strength=np.empty(0, dtype=np.float64)
+        )
+
+    prev_high, curr_high, next_high = high[:-2], high[1:-1], high[2:]
+    prev_low, curr_low, next_low = low[:-2], low[1:-1], low[2:]
+
+    top = (curr_high > prev_high) & (curr_high > next_high) & (curr_low > prev_low) & (curr_low > next_low)
+    bottom = (curr_low < prev_low) & (curr_low < next_low) & (curr_high < prev_high) & (curr_high < next_high)
+
+    # 中间K线下标 = 错位数组下标 + 1
+    middle = np.flatnonzero(top | bottom)
+    is_top = top[middle]
+    index = middle + 1
+
+    ranges = high - low
+    prev_range, curr_range, next_range = ranges[index - 1], ranges[index], ranges[index + 1]
+    avg_range = (prev_range + curr_range + next_range) / 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        strength = np.where(avg_range > 0, curr_range / avg_range, 1.0)
+
+    return FenxingArrays(
+        index=index.astype(np.int64),
+        kind=np.where(is_top, FENXING_TOP, FENXING_BOTTOM).astype(np.int8),
+        price=np.where(is_top, high[index], low[index]),
+        strength=np.minimum(np.maximum(strength, _STRENGTH_MIN), _STRENGTH_MAX)
+    )
+
+
+def classify_fenxing(
+        prev_high: float, prev_low: float,
+        curr_high: float, curr_low: float,
+        next_high: float, next_low: float
+) -> Optional[Tuple[int, float, float]]:
+    """
+    判断相邻三根K线的中间一根是否构成分型（规则和计算顺序同 find_fenxings）
+
+    Returns:
+        (FENXING_TOP / FENXING_BOTTOM, 价格, 强度)，不构成分型时返回 None
+    """
+    if curr_high > prev_high and curr_high > next_high and curr_low > prev_low and curr_low > next_low:
+        kind, price = FENXING_TOP, curr_high
+    elif curr_low < prev_low and curr_low < next_low and curr_high < prev_high and curr_high < next_high:
+        kind, price = FENXING_BOTTOM, curr_low
+    else:
+        return None
+
+    curr_range = curr_high - curr_low
+    avg_range = ((prev_high - prev_low) + curr_range + (next_high - next_low)) / 3
+    strength = curr_range / avg_range if avg_range > 0 else 1.0
+    return kind, price, min(max(strength, _STRENGTH_MIN), _STRENGTH_MAX)
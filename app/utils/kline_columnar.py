@@ -0,0 +1,264 @@
+"""
+K线列式计算工具
+
+以列式（struct-of-arrays）结构保存K线数据，所有聚合均基于NumPy向量运算完成：
+- 按桶边界使用 np.maximum.reduceat / np.minimum.reduceat / np.add.reduceat 计算 OHLCV
+- 开盘价取桶内第一根，收盘价取桶内最后一根
+- 输出字典列表时不经过逐行的Python循环
+"""
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# 毫秒/分钟
+MS_PER_MINUTE = 60_000
+
+# 支持的时间周期（分钟），KlineAggregator.TIMEFRAMES 与各分析服务共用
+TIMEFRAME_MINUTES = {
+    '1m': 1,
+    '5m': 5,
+    '15m': 15,
+    '30m': 30,
+    '1h': 60,
+    '4h': 240,
+    '1d': 1440
+}
+
+# 数据库行的列顺序：开盘时间(秒) + 以下字段
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+SUM_FIELDS = ('volume', 'quote_volume', 'trades_count', 'taker_buy_volume', 'taker_buy_quote_volume')
+ROW_FIELDS = PRICE_FIELDS + SUM_FIELDS
+
+# 输出字典的键（与 KlineAggregator 原有输出保持一致）
+DICT_KEYS = (
+    'timestamp', 'open_time', 'close_time',
+    'open_price', 'high_price', 'low_price', 'close_price',
+    'volume', 'quote_volume', 'trades_count',
+    'taker_buy_volume', 'taker_buy_quote_volume'
+)
+
+
+@dataclass
+class KlineColumns:
+    """列式K线数据，timestamp 为开盘时间的毫秒时间戳，按升序排列"""
+    timestamp: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    quote_volume: np.ndarray
+    trades_count: np.ndarray
+    taker_buy_volume: np.ndarray
+    taker_buy_quote_volume: np.ndarray
+    interval_minutes: int = 1
+
+    def __len__(self) -> int:
+        return int(self.timestamp.shape[0])
+
+    @classmethod
+    def empty(cls, interval_minutes: int = 1) -> "KlineColumns":
+        """创建空的列式数据"""
+        return cls.from_array(np.empty((0, len(ROW_FIELDS) + 1)), interval_minutes)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence, interval_minutes: int = 1) -> "KlineColumns":
+        """
+        从数据库行构建列式数据
+
+        Args:
+            rows: 每行为 (开盘时间epoch秒, open, high, low, close, volume, quote_volume,
+                  trades_count, taker_buy_volume, taker_buy_quote_volume)，均已在SQL中转换为浮点
+            interval_minutes: 每根K线的周期（分钟）
+        """
+        if not rows:
+            return cls.empty(interval_minutes)
+        return cls.from_array(np.array(rows, dtype=np.float64), interval_minutes)
+
+    @classmethod
+    def from_array(cls, data: np.ndarray, interval_minutes: int = 1) -> "KlineColumns":
+        """从二维数组构建列式数据，第0列为开盘时间（epoch秒）"""
+        columns = {name: data[:, i + 1] for i, name in enumerate(ROW_FIELDS)}
+        columns['trades_count'] = columns['trades_count'].astype(np.int64)
+        return cls(
+            timestamp=np.rint(data[:, 0] * 1000).astype(np.int64),
+            interval_minutes=interval_minutes,
+            **columns
+        )
+
+    @classmethod
+    def from_ohlcv(cls, ohlcv: Sequence, interval_minutes: int = 1) -> "KlineColumns":
+        """
+        从交易所 OHLCV 列表构建列式数据
+
+        Args:
+            ohlcv: 每行为 [开盘时间毫秒时间戳, open, high, low, close, volume]（ccxt fetch_ohlcv 格式）
+            interval_minutes: 每根K线的周期（分钟）
+
+        OHLCV 不包含成交额、成交笔数和主动买入量：成交额按 成交量×收盘价 估算，
+        主动买入量按成交量的一半估算，成交笔数为0。
+        """
+        data = np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+        close = data[:, 4]
+        volume = data[:, 5]
+        return cls(
+            timestamp=data[:, 0].astype(np.int64),
+            open=data[:, 1],
+            high=data[:, 2],
+            low=data[:, 3],
+            close=close,
+            volume=volume,
+            quote_volume=volume * close,
+            trades_count=np.zeros(len(data), dtype=np.int64),
+            taker_buy_volume=volume * 0.5,
+            taker_buy_quote_volume=volume * 0.5 * close,
+            interval_minutes=interval_minutes
+        )
+
+    @classmethod
+    def from_binance_klines(cls, klines: Sequence, interval_minutes: int = 1) -> "KlineColumns":
+        """
+        从币安 /api/v3/klines 原始响应构建列式数据（包含真实的成交额、成交笔数和主动买入量）
+
+        Args:
+            klines: 每行为 [开盘时间, open, high, low, close, volume, 收盘时间, 成交额, 成交笔数,
+                    主动买入量, 主动买入成交额, ignore]，数值为字符串
+            interval_minutes: 每根K线的周期（分钟）
+        """
+        if not klines:
+            return cls.empty(interval_minutes)
+        data = np.array([kline[:11] for kline in klines], dtype=object).astype(np.float64)
+        return cls(
+            timestamp=data[:, 0].astype(np.int64),
+            open=data[:, 1],
+            high=data[:, 2],
+            low=data[:, 3],
+            close=data[:, 4],
+            volume=data[:, 5],
+            quote_volume=data[:, 7],
+            trades_count=data[:, 8].astype(np.int64),
+            taker_buy_volume=data[:, 9],
+            taker_buy_quote_volume=data[:, 10],
+            interval_minutes=interval_minutes
+        )
+
+    def take(self, index) -> "KlineColumns":
+        """按下标/切片取子集"""
+        return KlineColumns(
+            timestamp=self.timestamp[index],
+            interval_minutes=self.interval_minutes,
+            **{name: getattr(self, name)[index] for name in ROW_FIELDS}
+        )
+
+    def tail(self, limit: int) -> "KlineColumns":
+        """取最后 limit 根K线"""
+        if limit <= 0:
+            return self.take(slice(0, 0))
+        return self if len(self) <= limit else self.take(slice(-limit, None))
+
+    def close_timestamp(self) -> np.ndarray:
+        """收盘时间的毫秒时间戳"""
+        return self.timestamp + self.interval_minutes * MS_PER_MINUTE
+
+    def to_dict_list(self, as_string: bool = True) -> List[Dict]:
+        """
+        转换为字典列表
+
+        Args:
+            as_string: True 时价格与成交量保留8位小数并以字符串表示；False 时输出浮点数
+        """
+        if len(self) == 0:
+            return []
+
+        columns = [
+            self.timestamp.tolist(),
+            _to_isoformat(self.timestamp),
+            _to_isoformat(self.close_timestamp()),
+        ]
+        for name in ROW_FIELDS:
+            if name == 'trades_count' or not as_string:
+                columns.append(getattr(self, name).tolist())
+            else:
+                columns.append(list(map(str, np.round(getattr(self, name), 8).tolist())))
+
+        # zip(*columns) 按行转置，map(dict, ...) 在C层构建字典
+        return list(map(dict, map(zip, repeat(DICT_KEYS), zip(*columns))))
+
+    def to_columnar_dict(self) -> Dict:
+        """
+        转换为列式字典：每个字段一个数组，所有字段共享同一个时间戳数组
+
+        数值保持浮点/整数类型，直接由NumPy数组转换，不逐行构建对象。
+        """
+        return {
+            'interval_minutes': self.interval_minutes,
+            'timestamp': self.timestamp.tolist(),
+            **{name: getattr(self, name).tolist() for name in ROW_FIELDS}
+        }
+
+
+def _to_isoformat(timestamps_ms: np.ndarray) -> List[str]:
+    """毫秒时间戳数组转ISO格式字符串（与 datetime.isoformat 一致）"""
+    return np.datetime_as_string(timestamps_ms.astype('datetime64[ms]'), unit='s').tolist()
+
+
+def concat_columns(*parts: KlineColumns) -> KlineColumns:
+    """按顺序拼接相同周期的列式数据"""
+    parts = [part for part in parts if len(part) > 0] or list(parts[:1])
+    if len(parts) == 1:
+        return parts[0]
+    return KlineColumns(
+        timestamp=np.concatenate([part.timestamp for part in parts]),
+        interval_minutes=parts[0].interval_minutes,
+        **{name: np.concatenate([getattr(part, name) for part in parts]) for name in ROW_FIELDS}
+    )
+
+
+def bucket_starts(bucket_keys: np.ndarray) -> np.ndarray:
+    """返回每个桶在有序数组中的起始下标"""
+    if bucket_keys.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(np.diff(bucket_keys)) + 1))
+
+
+def aggregate_columns(columns: KlineColumns, interval_minutes: int) -> KlineColumns:
+    """
+    将有序的列式K线聚合为更大的时间周期
+
+    桶按Unix纪元对齐（与 pandas.resample 在周期整除1天时的结果一致），
+    没有数据的桶不会出现在结果中。
+
+    Args:
+        columns: 升序排列的K线列数据（可以是1分钟或任意更小周期的聚合结果）
+        interval_minutes: 目标周期（分钟），必须是源周期的整数倍
+
+    Returns:
+        KlineColumns: 聚合后的列式数据
+    """
+    if interval_minutes == columns.interval_minutes:
+        return columns
+    if interval_minutes % columns.interval_minutes != 0:
+        raise ValueError(f"目标周期 {interval_minutes} 分钟不是源周期 {columns.interval_minutes} 分钟的整数倍")
+    if len(columns) == 0:
+        return KlineColumns.empty(interval_minutes)
+
+    interval_ms = interval_minutes * MS_PER_MINUTE
+    buckets = columns.timestamp // interval_ms * interval_ms
+    starts = bucket_starts(buckets)
+    ends = np.append(starts[1:], len(columns)) - 1
+
+    return KlineColumns(
+        timestamp=buckets[starts],
+        open=columns.open[starts],
+        high=np.maximum.reduceat(columns.high, starts),
+        low=np.minimum.reduceat(columns.low, starts),
+        close=columns.close[ends],
+        volume=np.add.reduceat(columns.volume, starts),
+        quote_volume=np.add.reduceat(columns.quote_volume, starts),
+        trades_count=np.add.reduceat(columns.trades_count, starts),
+        taker_buy_volume=np.add.reduceat(columns.taker_buy_volume, starts),
+        taker_buy_quote_volume=np.add.reduceat(columns.taker_buy_quote_volume, starts),
+        interval_minutes=interval_minutes
+    )
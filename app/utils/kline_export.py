@@ -0,0 +1,125 @@
+"""
+K线批量导出编码
+
+将列式K线批次编码为二进制流，批次直接由NumPy数组构建，不生成逐行的Python字典：
+- Arrow IPC 流（首选）：客户端可用 pyarrow.ipc.open_stream 零拷贝读入 pandas / Polars
+- MessagePack（回退）：每个批次为一个 map，字段值为小端原始字节，客户端可用 numpy.frombuffer 零拷贝还原
+
+pyarrow 与 msgpack 均为可选依赖（pip install turtle-front[export]）。
+"""
+from typing import Dict, Iterable, Iterator, List
+
+from app.utils.kline_columnar import ROW_FIELDS, KlineColumns
+
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    ARROW_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+# 导出格式 -> HTTP Content-Type
+EXPORT_MEDIA_TYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'msgpack': 'application/x-msgpack',
+}
+
+
+def available_export_formats() -> List[str]:
+    """当前环境可用的导出格式（按优先级排列）"""
+    formats = []
+    if ARROW_AVAILABLE:
+        formats.append('arrow')
+    if MSGPACK_AVAILABLE:
+        formats.append('msgpack')
+    return formats
+
+
+def arrow_schema():
+    """Arrow 导出的表结构：开盘时间为毫秒精度时间戳，其余字段与 KlineColumns 一致"""
+    fields = [pa.field('open_time', pa.timestamp('ms'))]
+    fields += [pa.field(name, pa.int64() if name == 'trades_count' else pa.float64()) for name in ROW_FIELDS]
+    return pa.schema(fields)
+
+
+def columns_to_record_batch(columns: KlineColumns, schema=None):
+    """由列式K线构建 Arrow RecordBatch（数值列直接引用NumPy缓冲区）"""
+    schema = schema or arrow_schema()
+    arrays = [pa.array(columns.timestamp.view('datetime64[ms]'), type=pa.timestamp('ms'))]
+    arrays += [pa.array(getattr(columns, name)) for name in ROW_FIELDS]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """收集写入字节的类文件对象，用于把 Arrow IPC 流按批次切分输出"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_arrow_ipc(batches: Iterable[KlineColumns]) -> Iterator[bytes]:
+    """将批次编码为 Arrow IPC 流，每写完一个批次输出一段字节"""
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("pyarrow 未安装，无法导出 Arrow 格式")
+
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for columns in batches:
+            writer.write_batch(columns_to_record_batch(columns, schema))
+            yield sink.drain()
+    # 流结束标记
+    yield sink.drain()
+
+
+def iter_msgpack(batches: Iterable[KlineColumns]) -> Iterator[bytes]:
+    """
+    将批次编码为连续的 MessagePack 对象
+
+    每个对象格式: {"length": n, "dtypes": {字段: dtype}, "columns": {字段: 原始字节}}，
+    timestamp 为开盘时间的毫秒时间戳，可用 msgpack.Unpacker 逐个读取。
+    """
+    if not MSGPACK_AVAILABLE:
+        raise RuntimeError("msgpack 未安装，无法导出 MessagePack 格式")
+
+    for columns in batches:
+        arrays: Dict[str, object] = {'timestamp': columns.timestamp}
+        arrays.update({name: getattr(columns, name) for name in ROW_FIELDS})
+        yield msgpack.packb({
+            'length': len(columns),
+            'dtypes': {name: array.dtype.newbyteorder('<').str for name, array in arrays.items()},
+            'columns': {name: array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes()
+                        for name, array in arrays.items()},
+        })
+
+
+def iter_export(batches: Iterable[KlineColumns], export_format: str) -> Iterator[bytes]:
+    """按指定格式编码批次"""
+    if export_format == 'arrow':
+        return iter_arrow_ipc(batches)
+    if export_format == 'msgpack':
+        return iter_msgpack(batches)
+    raise ValueError(f"不支持的导出格式: {export_format}")
@@ -2,23 +2,50 @@
 K线视图实体类
 用于映射不同时间维度的聚合视图（5m, 15m, 1h等）
 通过动态指定表名来查询不同的视图，查询结果直接映射到实体类对象（类似 MyBatis）
-视图字段：id, bucket, open_time, close_time, open_price, high_price, low_price, close_price, volume
+视图字段：id, bucket, open_time, close_time, open_price, high_price, low_price, close_price, volume,
+         quote_volume, trades_count, taker_buy_volume, taker_buy_quote_volume
 注意：视图没有 created_at 和 updated_at 字段
 """
 
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, BigInteger, Numeric
 
 from common.model.kline_base import KlineBase
 
 
 class KlineView(KlineBase):
 
+    # 没有固定表名，查询时按视图名动态指定，不直接映射
+    __abstract__ = True
+
     bucket = Column(
         DateTime,
         nullable=False,
         comment="时间桶"
     )
 
+    quote_volume = Column(
+        Numeric(30, 8),
+        nullable=False,
+        comment="成交额(USDT)"
+    )
+
+    trades_count = Column(
+        BigInteger,
+        nullable=False,
+        comment="成交笔数"
+    )
+
+    taker_buy_volume = Column(
+        Numeric(30, 8),
+        nullable=False,
+        comment="主动买入成交量(Taker)"
+    )
+
+    taker_buy_quote_volume = Column(
+        Numeric(30, 8),
+        nullable=False,
+        comment="主动买入成交额(Taker)"
+    )
     
     def __repr__(self):
         return f"<KlineView(id={self.id}, bucket={self.bucket}, open_time={self.open_time})>"
@@ -1,7 +1,7 @@
 """
 SOL/USDT K线数据实体类
 """
-from sqlalchemy import Column, BigInteger, Integer, Numeric
+from sqlalchemy import Column, BigInteger, DateTime, Integer, Numeric, func
 from common.model.kline_base import KlineBase
 
 
@@ -41,3 +41,16 @@ class SolUsdtKline(KlineBase):
         comment="主动买入成交额(Taker)"
     )
 
+    created_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+        comment="数据入库时间"
+    )
+
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.now(),
+        comment="数据更新时间"
+    )
@@ -3,6 +3,19 @@
 用于和表名拼接成完整的视图名字，如 btc_usdt_5m, eth_usdt_1h 等
 """
 from enum import Enum
+from typing import Optional
+
+# 固定长度时间维度的分钟数
+_TIMEFRAME_MINUTES = {
+    "1m": 1,
+    "5m": 5,
+    "15m": 15,
+    "30m": 30,
+    "1h": 60,
+    "4h": 240,
+    "1d": 1440,
+    "1w": 10080,
+}
 
 
 class TimeframeEnum(Enum):
@@ -30,6 +43,16 @@ class TimeframeEnum(Enum):
         obj.suffix = suffix
         return obj
     
+    @property
+    def minutes(self) -> Optional[int]:
+        """
+        时间维度对应的分钟数
+
+        Returns:
+            固定长度周期的分钟数；1个月长度不固定，返回 None
+        """
+        return _TIMEFRAME_MINUTES.get(self.suffix)
+
     def build_view_name(self, table_prefix: str) -> str:
         """
         构建完整的视图名称
@@ -29,6 +29,14 @@ create index idx_btc_usdt_timestamp
 create index idx_btc_usdt_open_time
     on btc_usdt (open_time desc);
 
+-- 键集分页索引 (open_time, id)
+create index idx_btc_usdt_open_time_id
+    on btc_usdt (open_time desc, id desc);
+
+-- 开盘时间唯一索引：ON CONFLICT (open_time) 幂等写入
+create unique index uq_btc_usdt_open_time
+    on btc_usdt (open_time);
+
 -- 表注释
 COMMENT ON TABLE btc_usdt IS 'BTC/USDT 交易对 K线/行情数据表';
 
@@ -52,6 +60,9 @@ COMMENT ON COLUMN btc_usdt.updated_at IS '数据更新时间';
 -- 创建超表语句
 SELECT create_hypertable('btc_usdt', 'open_time', chunk_time_interval => INTERVAL '7 days');
 
+-- 持续聚合视图的刷新策略只覆盖最近一段（start_offset）；
+-- 回补、缺口补齐写入更早的数据后，由 KlineIngestWriter 按写入范围调用 refresh_continuous_aggregate 刷新已走完的桶
+
 -- 创建5分钟持续聚合视图
 CREATE MATERIALIZED VIEW btc_usdt_5m
 WITH (timescaledb.continuous) AS
@@ -63,7 +74,11 @@ SELECT time_bucket('5 minutes', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('5 minutes', open_time);
 --为5分钟聚合视图添加刷新策略
@@ -84,7 +99,11 @@ SELECT time_bucket('15 minutes', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('15 minutes', open_time);
 -- 为15分钟聚合视图添加刷新策略
@@ -105,7 +124,11 @@ SELECT time_bucket('30 minutes', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('30 minutes', open_time);
 -- 为30分钟聚合视图添加刷新策略
@@ -126,7 +149,11 @@ SELECT time_bucket('1 hour', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('1 hour', open_time);
 -- 为1小时聚合视图添加刷新策略
@@ -147,7 +174,11 @@ SELECT time_bucket('4 hour', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('4 hour', open_time);
 -- 为4小时聚合视图添加刷新策略
@@ -168,7 +199,11 @@ SELECT time_bucket('1 day', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('1 day', open_time);
 
@@ -190,7 +225,11 @@ SELECT time_bucket('1 week', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('1 week', open_time);
 
@@ -211,7 +250,11 @@ SELECT time_bucket('1 month', open_time) AS bucket,
        LAST(close_price, close_time) AS close_price,
        MAX(high_price) AS high_price,
        MIN(low_price) AS low_price,
-       SUM(volume) AS volume
+       SUM(volume) AS volume,
+       SUM(quote_volume) AS quote_volume,
+       SUM(trades_count) AS trades_count,
+       SUM(taker_buy_volume) AS taker_buy_volume,
+       SUM(taker_buy_quote_volume) AS taker_buy_quote_volume
 FROM btc_usdt
 GROUP BY time_bucket('1 month', open_time);
 
@@ -0,0 +1,17 @@
+-- 已有K线表增加开盘时间唯一索引（幂等写入 ON CONFLICT (open_time) 依赖此索引）
+-- 先删除重复的开盘时间（保留 id 最小的一条），再建唯一索引；超表上的唯一索引必须包含分区列 open_time
+
+DELETE FROM btc_usdt a USING btc_usdt b
+WHERE a.open_time = b.open_time AND a.id > b.id;
+create unique index if not exists uq_btc_usdt_open_time
+    on btc_usdt (open_time);
+
+DELETE FROM eth_usdt a USING eth_usdt b
+WHERE a.open_time = b.open_time AND a.id > b.id;
+create unique index if not exists uq_eth_usdt_open_time
+    on eth_usdt (open_time);
+
+DELETE FROM sol_usdt a USING sol_usdt b
+WHERE a.open_time = b.open_time AND a.id > b.id;
+create unique index if not exists uq_sol_usdt_open_time
+    on sol_usdt (open_time);
@@ -0,0 +1,61 @@
+"""
+测试共用的假写入器和假会话（回补、实时流等写入路径的测试不访问数据库）
+"""
+import pytest
+
+from app.services.kline_ingest import IngestResult
+
+
+class RecordingWriter:
+    """代替 KlineIngestWriter：记录每次写入的K线，fail_on 中的开盘时间第一次写入时失败"""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        # (symbol, 开盘时间列表, update_existing)
+        self.writes = []
+
+    def write(self, db, symbol, columns, update_existing=False, **kwargs):
+        failed = self.fail_on & set(columns.timestamp.tolist())
+        if failed:
+            self.fail_on -= failed
+            raise RuntimeError("数据库不可用")
+        self.writes.append((symbol, columns.timestamp.tolist(), update_existing))
+        return IngestResult(table_name=symbol, rows_received=len(columns), rows_inserted=len(columns))
+
+    def timestamps(self):
+        """按写入顺序展开的全部开盘时间"""
+        return [timestamp for _, timestamps, _ in self.writes for timestamp in timestamps]
+
+
+class FakeSession:
+    """代替数据库会话：可作为上下文管理器或手动 close，MAX(timestamp) 之类的标量查询返回 latest"""
+
+    def __init__(self, latest=None):
+        self.latest = latest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def close(self):
+        pass
+
+    def execute(self, statement, params=None):
+        return self
+
+    def scalar(self):
+        return self.latest
+
+
+@pytest.fixture
+def make_writer():
+    """RecordingWriter 工厂：make_writer(fail_on=[开盘时间, ...])"""
+    return RecordingWriter
+
+
+@pytest.fixture
+def make_session():
+    """FakeSession 工厂：make_session(latest=最新K线的开盘时间)"""
+    return FakeSession
@@ -0,0 +1,153 @@
+"""
+AnalysisResultCache：单飞（成功与失败）、同一数据流的旧结果淘汰、写入后的清除和过期
+"""
+import threading
+import time
+
+import pytest
+
+from app.services import analysis_cache as analysis_cache_module
+from app.services.analysis_cache import AnalysisKey, AnalysisResultCache
+from app.utils.kline_columnar import MS_PER_MINUTE
+
+# 2024-01-01T00:00:00Z
+START_MS = 1_704_067_200_000
+
+
+def make_key(last_closed, symbol='btc_usdt', timeframe='5m', window_size=100, live_bar=None):
+    return AnalysisKey(
+        namespace='chan', symbol=symbol, timeframe=timeframe,
+        window_start=START_MS, window_size=window_size, last_closed=last_closed,
+        config_hash='cfg', live_bar=live_bar
+    )
+
+
+class BlockingCompute:
+    """在 release() 之前阻塞的计算函数，记录被调用的次数"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self._release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self._release.set()
+
+
+def run_concurrently(cache, key, compute, waiters=4):
+    """一个线程先开始计算，其余线程在计算进行中请求同一个键，返回每个线程的结果或异常"""
+    outcomes = [None] * (waiters + 1)
+
+    def call(index):
+        try:
+            outcomes[index] = cache.get_or_compute(key, compute)
+        except Exception as e:
+            outcomes[index] = e
+
+    owner = threading.Thread(target=call, args=(0,))
+    owner.start()
+    assert compute.started.wait(5)
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(1, waiters + 1)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.get_statistics()['shared_inflight'] < waiters:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    compute.release()
+    for thread in [owner, *threads]:
+        thread.join(5)
+    return outcomes
+
+
+def test_single_flight_shares_one_computation():
+    cache = AnalysisResultCache(max_age_seconds=None)
+    compute = BlockingCompute(result={'fenxings': [1, 2, 3]})
+    outcomes = run_concurrently(cache, make_key(START_MS), compute)
+
+    assert compute.calls == 1
+    assert all(outcome == {'fenxings': [1, 2, 3]} for outcome in outcomes)
+    # 每个调用方拿到独立的副本
+    outcomes[0]['fenxings'].append(4)
+    assert outcomes[1]['fenxings'] == [1, 2, 3]
+
+    stats = cache.get_statistics()
+    assert (stats['misses'], stats['shared_inflight'], stats['inflight']) == (1, 4, 0)
+    assert cache.get_or_compute(make_key(START_MS), lambda: pytest.fail("不应重新计算")) == {'fenxings': [1, 2, 3]}
+    assert cache.get_statistics()['hits'] == 1
+
+
+def test_single_flight_failure_reaches_waiters_and_is_not_cached():
+    cache = AnalysisResultCache(max_age_seconds=None)
+    compute = BlockingCompute(error=ValueError("分析失败"))
+    outcomes = run_concurrently(cache, make_key(START_MS), compute)
+
+    assert compute.calls == 1
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    stats = cache.get_statistics()
+    assert stats['entries'] == 0 and stats['inflight'] == 0
+
+    # 失败不缓存，下一次请求重新计算
+    assert cache.get_or_compute(make_key(START_MS), lambda: 'ok') == 'ok'
+
+
+def test_new_closed_bar_supersedes_older_result_of_the_same_stream():
+    cache = AnalysisResultCache(max_age_seconds=None)
+    cache.get_or_compute(make_key(START_MS), lambda: 'old')
+    cache.get_or_compute(make_key(START_MS, window_size=50), lambda: 'other window')
+    cache.get_or_compute(make_key(START_MS + 5 * MS_PER_MINUTE), lambda: 'new')
+
+    stats = cache.get_statistics()
+    assert stats['superseded'] == 1 and stats['entries'] == 2
+    assert cache.get_or_compute(make_key(START_MS), lambda: 'recomputed') == 'recomputed'
+
+
+def test_live_bar_change_supersedes_previous_live_result():
+    cache = AnalysisResultCache(max_age_seconds=None)
+    cache.get_or_compute(make_key(START_MS, live_bar=(START_MS + 1, 2.0, 1.0, 1.5)), lambda: 'first')
+    cache.get_or_compute(make_key(START_MS, live_bar=(START_MS + 1, 2.5, 1.0, 2.4)), lambda: 'second')
+    assert cache.get_statistics()['entries'] == 1
+
+
+def test_invalidate_since_drops_results_that_depend_on_later_bars():
+    cache = AnalysisResultCache(max_age_seconds=None)
+    cache.get_or_compute(make_key(START_MS + 60 * MS_PER_MINUTE, timeframe='1h'), lambda: '1h')
+    cache.get_or_compute(make_key(START_MS + 10 * MS_PER_MINUTE), lambda: '5m')
+    cache.get_or_compute(make_key(START_MS + 10 * MS_PER_MINUTE, symbol='eth_usdt'), lambda: 'eth')
+
+    # 写入 01:30：落在最新已收盘1小时K线（01:00-02:00）内，5m 结果只依赖 00:15 之前的K线
+    assert cache.invalidate_since('BTC/USDT', START_MS + 90 * MS_PER_MINUTE) == 1
+    assert cache.get_statistics()['entries'] == 2
+    assert cache.invalidate_since('btc_usdt', START_MS + 14 * MS_PER_MINUTE) == 1
+    assert cache.get_statistics()['entries'] == 1
+
+
+def test_lru_eviction_by_entry_count():
+    cache = AnalysisResultCache(max_entries=2, max_age_seconds=None)
+    for symbol in ('btc_usdt', 'eth_usdt', 'sol_usdt'):
+        cache.get_or_compute(make_key(START_MS, symbol=symbol), lambda: symbol)
+    stats = cache.get_statistics()
+    assert stats['entries'] == 2 and stats['evictions'] == 1
+
+
+def test_results_expire_after_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(analysis_cache_module.time, 'monotonic', lambda: now[0])
+    cache = AnalysisResultCache(max_age_seconds=300)
+    cache.get_or_compute(make_key(START_MS), lambda: 'first')
+
+    now[0] += 299
+    assert cache.get_or_compute(make_key(START_MS), lambda: 'second') == 'first'
+    now[0] += 2
+    assert cache.get_or_compute(make_key(START_MS), lambda: 'second') == 'second'
+    assert cache.get_statistics()['expirations'] == 1
@@ -0,0 +1,133 @@
+"""
+AsyncBinanceClient：对本地 aiohttp 模拟服务并发分页、重试和限流
+
+不访问外网。
+"""
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+
+from app.data.binance.async_binance_client import AsyncBinanceClient, BinanceHTTPError, _page_windows  # noqa: E402
+from app.utils.kline_columnar import MS_PER_MINUTE  # noqa: E402
+
+# 2024-01-01T00:00:00Z
+START_MS = 1_704_067_200_000
+
+
+class FakeBinance:
+    """模拟 /api/v3/klines：按请求范围生成1分钟K线，可按请求序号返回指定的错误状态"""
+
+    def __init__(self, statuses=None, used_weight="10"):
+        # 请求序号（从1开始） -> (状态码, 响应头)
+        self.statuses = statuses or {}
+        self.used_weight = used_weight
+        self.requests = []
+
+    async def klines(self, request: web.Request) -> web.Response:
+        self.requests.append(dict(request.query))
+        status, headers = self.statuses.get(len(self.requests), (200, {}))
+        if status != 200:
+            return web.Response(status=status, headers=headers, text="error")
+
+        start, end, limit = (int(request.query[name]) for name in ("startTime", "endTime", "limit"))
+        open_time = start + (-start) % MS_PER_MINUTE
+        rows = []
+        while open_time <= end and len(rows) < limit:
+            rows.append([
+                open_time, "100.0", "101.0", "99.0", "100.5", "2.0",
+                open_time + MS_PER_MINUTE - 1, "201.0", 10, "1.0", "100.5", "0"
+            ])
+            open_time += MS_PER_MINUTE
+        return web.json_response(rows, headers={"X-MBX-USED-WEIGHT-1M": self.used_weight})
+
+
+def run_with_server(fake: FakeBinance, scenario, **client_options):
+    """启动模拟服务，以指向它的客户端执行 scenario(client)"""
+    async def main():
+        app = web.Application()
+        app.router.add_get("/api/v3/klines", fake.klines)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with AsyncBinanceClient(base_url=f"http://127.0.0.1:{port}", **client_options) as client:
+                return await scenario(client), client
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_page_windows_cover_range_without_overlap():
+    windows = _page_windows(0, 2500, 1000)
+    assert windows == [(0, 1000), (1000, 2000), (2000, 2500)]
+
+
+def test_get_klines_range_pages_concurrently():
+    fake = FakeBinance()
+    end_ms = START_MS + 2500 * MS_PER_MINUTE
+    columns, client = run_with_server(
+        fake, lambda client: client.get_klines_range("BTC/USDT", "1m", START_MS, end_ms), max_connections=3
+    )
+
+    assert len(columns) == 2500
+    assert columns.timestamp[0] == START_MS
+    assert (columns.timestamp[1:] - columns.timestamp[:-1] == MS_PER_MINUTE).all()
+    assert client.requests == len(fake.requests) == 3
+    assert {request["symbol"] for request in fake.requests} == {"BTCUSDT"}
+    # 每个窗口的 endTime 不含下一窗口的起点
+    assert sorted(int(request["endTime"]) for request in fake.requests)[0] == START_MS + 1000 * MS_PER_MINUTE - 1
+
+
+def test_retries_server_errors_with_backoff():
+    fake = FakeBinance(statuses={1: (503, {}), 2: (502, {})})
+    klines, client = run_with_server(
+        fake, lambda client: client.get_klines_page("BTCUSDT", "1m", START_MS, START_MS + 9 * MS_PER_MINUTE),
+        backoff_base=0.01
+    )
+    assert len(klines) == 10
+    assert client.requests == 3 and client.retries == 2
+
+
+def test_rate_limit_waits_for_retry_after():
+    fake = FakeBinance(statuses={1: (429, {"Retry-After": "0.1"})})
+
+    async def scenario(client):
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        klines = await client.get_klines_page("BTCUSDT", "1m", START_MS, START_MS)
+        return klines, loop.time() - begin
+
+    (klines, elapsed), client = run_with_server(fake, scenario)
+    assert len(klines) == 1
+    assert elapsed >= 0.09
+    assert client.retries == 1
+
+
+def test_client_error_is_not_retried():
+    fake = FakeBinance(statuses={1: (400, {})})
+
+    async def scenario(client):
+        with pytest.raises(BinanceHTTPError) as excinfo:
+            await client.get_klines_page("BTCUSDT", "1m", START_MS, START_MS)
+        return excinfo.value.status
+
+    status, client = run_with_server(fake, scenario)
+    assert status == 400
+    assert client.requests == 1
+
+
+def test_gives_up_after_max_retries():
+    fake = FakeBinance(statuses={attempt: (500, {}) for attempt in range(1, 10)})
+
+    async def scenario(client):
+        with pytest.raises(BinanceHTTPError):
+            await client.get_klines_page("BTCUSDT", "1m", START_MS, START_MS)
+
+    _, client = run_with_server(fake, scenario, max_retries=2, backoff_base=0.01)
+    assert client.requests == 3
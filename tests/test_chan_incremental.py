@@ -0,0 +1,140 @@
+"""
+IncrementalChanAnalyzer：逐根K线（含同一时间戳的更新）增量分析的结果与
+ChanMultiLevelStrategy 对同一窗口整体重新识别的结果一致
+"""
+import random
+
+import pytest
+
+from app.services.chan_incremental import IncrementalChanAnalyzer
+from app.services.chan_strategy import chan_strategy
+from app.utils.kline_columnar import MS_PER_MINUTE
+
+# 2024-01-01T00:00:00Z
+START_MS = 1_704_067_200_000
+
+
+def random_bar(rng, timestamp, price):
+    high = round(price + rng.random() * 20, 2)
+    low = round(price - rng.random() * 20, 2)
+    return {'timestamp': timestamp, 'high_price': high, 'low_price': low, 'close_price': round(rng.uniform(low, high), 2)}
+
+
+def batch_analysis(bars):
+    """对完整窗口重新识别：分型、笔、趋势、市场阶段"""
+    fenxings = chan_strategy._identify_fenxings(bars)
+    bis = chan_strategy._identify_bis(fenxings, bars)
+    return {
+        'fenxings': fenxings,
+        'bis': bis,
+        'trend_analysis': chan_strategy._analyze_trend(bars, bis),
+        'current_phase': chan_strategy._determine_market_phase(bis)
+    }
+
+
+def assert_matches_batch(analyzer, bars):
+    expected = batch_analysis(bars)
+    result = analyzer.get_analysis(include_signals=False)
+    analysis = result['analysis']
+    assert analysis['fenxings'] == expected['fenxings']
+    assert analysis['bis'] == expected['bis']
+    assert analysis['trend_analysis'] == expected['trend_analysis']
+    assert analysis['market_structure']['current_phase'] == expected['current_phase']
+    assert result['state']['fenxing_count'] == len(expected['fenxings'])
+    assert result['state']['bi_count'] == len(expected['bis'])
+
+
+def new_analyzer(timeframe):
+    return IncrementalChanAnalyzer('btc_usdt', timeframe, max_fenxings=10_000, max_bis=10_000)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_bar_by_bar_with_updates_matches_batch(seed):
+    rng = random.Random(seed)
+    analyzer = new_analyzer('5m')
+    interval_ms = 5 * MS_PER_MINUTE
+    bars, price = [], 40000.0
+
+    for n in range(300):
+        price += rng.gauss(0, 15)
+        timestamp = START_MS + n * interval_ms
+        bars.append(random_bar(rng, timestamp, price))
+        analyzer.on_bar(bars[-1])
+        assert_matches_batch(analyzer, bars)
+
+        # 未收盘K线的多次推送：同一时间戳，高低点任意变化（可能产生或撤销待定分型）
+        for _ in range(rng.randrange(3)):
+            bars[-1] = random_bar(rng, timestamp, price + rng.gauss(0, 15))
+            analyzer.on_bar_update(bars[-1])
+            assert_matches_batch(analyzer, bars)
+
+    assert len(analyzer) == 300
+
+
+def test_update_retracts_and_restores_provisional_fenxing():
+    analyzer = new_analyzer('5m')
+    interval_ms = 5 * MS_PER_MINUTE
+    bars = [
+        {'timestamp': START_MS, 'high_price': 10.0, 'low_price': 8.0, 'close_price': 9.0},
+        {'timestamp': START_MS + interval_ms, 'high_price': 12.0, 'low_price': 10.0, 'close_price': 11.0},
+        {'timestamp': START_MS + 2 * interval_ms, 'high_price': 11.0, 'low_price': 9.0, 'close_price': 10.0},
+    ]
+    for bar in bars:
+        state = analyzer.on_bar(bar)
+    assert state['last_fenxing']['type'] == 'top' and not state['last_fenxing_confirmed']
+
+    # 最后一根涨破中间K线高点，顶分型撤销
+    bars[-1] = dict(bars[-1], high_price=13.0, low_price=11.0)
+    state = analyzer.on_bar_update(bars[-1])
+    assert state['last_fenxing'] is None
+    assert_matches_batch(analyzer, bars)
+
+    # 回落后重新构成顶分型；下一根K线到来后确认
+    bars[-1] = dict(bars[-1], high_price=11.5, low_price=9.5)
+    analyzer.on_bar_update(bars[-1])
+    bars.append({'timestamp': START_MS + 3 * interval_ms, 'high_price': 11.0, 'low_price': 9.0, 'close_price': 10.0})
+    state = analyzer.on_bar(bars[-1])
+    assert state['last_fenxing']['index'] == 1 and state['last_fenxing_confirmed']
+    assert_matches_batch(analyzer, bars)
+
+    # 更早的K线被忽略
+    analyzer.on_bar(dict(bars[0], high_price=100.0))
+    assert_matches_batch(analyzer, bars)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_minute_bars_merge_into_timeframe_buckets(seed):
+    rng = random.Random(seed)
+    analyzer = new_analyzer('5m')
+    buckets, price = [], 40000.0
+
+    for minute in range(600):
+        timestamp = START_MS + minute * MS_PER_MINUTE
+        bucket = timestamp - timestamp % (5 * MS_PER_MINUTE)
+        price += rng.gauss(0, 5)
+        high, low = price, price
+        # 同一分钟推送多次：最高价只增、最低价只减
+        for _ in range(1 + rng.randrange(3)):
+            high = round(high + rng.random() * 5, 2)
+            low = round(low - rng.random() * 5, 2)
+            close = round(rng.uniform(low, high), 2)
+            analyzer.on_minute_bar(
+                {'timestamp': timestamp, 'high_price': str(high), 'low_price': str(low), 'close_price': str(close)}
+            )
+
+        if buckets and buckets[-1]['timestamp'] == bucket:
+            current = buckets[-1]
+            current['high_price'] = max(current['high_price'], high)
+            current['low_price'] = min(current['low_price'], low)
+            current['close_price'] = close
+        else:
+            buckets.append({'timestamp': bucket, 'high_price': high, 'low_price': low, 'close_price': close})
+        assert_matches_batch(analyzer, buckets)
+
+    assert len(analyzer) == 120
+    assert analyzer.last_timestamp == START_MS + 119 * 5 * MS_PER_MINUTE
+
+
+def test_unsupported_timeframe():
+    with pytest.raises(ValueError):
+        IncrementalChanAnalyzer('btc_usdt', '7m')
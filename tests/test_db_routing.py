@@ -0,0 +1,133 @@
+"""
+DatabaseRouter：按水位线选择副本或回退主库，以及 parse_end_time 的UTC处理
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.db import routing
+from app.db.routing import DatabaseRouter, ReplicaNode, parse_end_time
+from app.models.kline import SYMBOL_TO_MODEL
+
+BTC_TABLE = SYMBOL_TO_MODEL['btc_usdt'].__tablename__
+PRIMARY_WM = datetime(2024, 1, 1, 12, 0)
+
+
+class NamedSession:
+    """带名称的会话，_read_watermarks 按名称返回预设的水位线"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+@pytest.fixture
+def make_router(monkeypatch):
+    """主库水位线为 PRIMARY_WM，副本水位线由参数指定（None 表示探测失败）"""
+
+    def factory(*replica_watermarks, max_lag_seconds=90):
+        watermarks = {'primary': PRIMARY_WM}
+        router = DatabaseRouter(max_lag_seconds=max_lag_seconds)
+        for index, watermark in enumerate(replica_watermarks):
+            name = f'replica-{index}'
+            watermarks[name] = watermark
+            router.replicas.append(ReplicaNode(name=name, session_factory=lambda name=name: NamedSession(name)))
+
+        def read_watermarks(db):
+            if watermarks[db.name] is None:
+                raise ConnectionError(f'{db.name} 不可达')
+            return {BTC_TABLE: watermarks[db.name]}
+
+        monkeypatch.setattr(routing, 'SessionLocal', lambda: NamedSession('primary'))
+        monkeypatch.setattr(router, '_read_watermarks', read_watermarks)
+        # 不启动后台探测线程，由测试显式调用 check_replicas
+        monkeypatch.setattr(router, 'start', lambda: None)
+        router.check_replicas()
+        return router
+
+    return factory
+
+
+def selected(router, end_time=None):
+    replica = router.select_replica('btc_usdt', end_time)
+    return replica.name if replica else routing.PRIMARY
+
+
+def test_current_replica_serves_latest_data(make_router):
+    router = make_router(PRIMARY_WM - timedelta(seconds=60))
+    assert selected(router) == 'replica-0'
+    assert router.read_session('btc_usdt').name == 'replica-0'
+
+
+def test_lagging_replica_falls_back_to_primary_for_latest_data(make_router):
+    router = make_router(PRIMARY_WM - timedelta(minutes=5))
+    assert selected(router) == routing.PRIMARY
+    assert router.read_session('btc_usdt').name == 'primary'
+
+
+def test_replica_behind_requested_end_falls_back_to_primary(make_router):
+    router = make_router(datetime(2024, 1, 1, 11, 0))
+    # 查询需要 open_time < end_time 的全部K线：副本最后一根必须不早于 end_time 前一分钟
+    assert selected(router, datetime(2024, 1, 1, 11, 1)) == 'replica-0'
+    assert selected(router, datetime(2024, 1, 1, 11, 2)) == routing.PRIMARY
+
+
+def test_end_beyond_primary_only_requires_primary_watermark(make_router):
+    router = make_router(PRIMARY_WM)
+    assert selected(router, PRIMARY_WM + timedelta(days=1)) == 'replica-0'
+
+
+def test_aware_end_time_is_compared_as_utc(make_router):
+    router = make_router(datetime(2024, 1, 1, 11, 0))
+    beijing = timezone(timedelta(hours=8))
+    assert selected(router, datetime(2024, 1, 1, 19, 1, tzinfo=beijing)) == 'replica-0'
+    assert selected(router, datetime(2024, 1, 1, 19, 2, tzinfo=beijing)) == routing.PRIMARY
+
+
+def test_unreachable_replica_is_skipped(make_router):
+    router = make_router(None, PRIMARY_WM)
+    assert not router.replicas[0].healthy and router.replicas[0].error
+    assert {selected(router) for _ in range(4)} == {'replica-1'}
+
+
+def test_round_robin_between_current_replicas(make_router):
+    router = make_router(PRIMARY_WM, PRIMARY_WM)
+    assert {selected(router) for _ in range(4)} == {'replica-0', 'replica-1'}
+
+
+def test_no_replicas_uses_primary():
+    router = DatabaseRouter()
+    assert router.select_replica('btc_usdt') is None
+
+
+def test_primary_watermark_unknown_uses_primary(make_router):
+    router = make_router(PRIMARY_WM)
+    router._primary_watermarks = {}
+    assert selected(router) == routing.PRIMARY
+
+
+# ----------------------------------------------------------------------
+# parse_end_time
+# ----------------------------------------------------------------------
+
+@pytest.mark.parametrize('value, expected', [
+    # 毫秒时间戳按UTC解释，与服务器时区无关
+    ('1704067200000', datetime(2024, 1, 1, 0, 0)),
+    ('2024-01-01T08:00:00+08:00', datetime(2024, 1, 1, 0, 0)),
+    ('2024-01-01T00:00:00Z', datetime(2024, 1, 1, 0, 0)),
+    # 不带时区的ISO时间视为UTC
+    ('2024-01-01T00:00:00', datetime(2024, 1, 1, 0, 0)),
+])
+def test_parse_end_time_returns_naive_utc(value, expected):
+    result = parse_end_time(value)
+    assert result == expected and result.tzinfo is None
+
+
+@pytest.mark.parametrize('value', [None, '', 'not-a-time', '9' * 30])
+def test_parse_end_time_unparseable_means_latest(value):
+    assert parse_end_time(value) is None
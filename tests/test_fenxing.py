@@ -0,0 +1,96 @@
+"""
+find_fenxings：向量化分型识别与逐根K线参考实现逐位一致
+"""
+import numpy as np
+import pytest
+
+from app.utils.fenxing import FENXING_BOTTOM, FENXING_TOP, classify_fenxing, find_fenxings
+
+
+def reference_fenxings(highs, lows, timestamps):
+    """逐根比较相邻三根K线的参考实现（向量化之前 ChanMultiLevelStrategy 的规则）"""
+    highs = [float(h) for h in highs]
+    lows = [float(l) for l in lows]
+    fenxings = []
+
+    def strength(i):
+        prev_range = highs[i-1] - lows[i-1]
+        curr_range = highs[i] - lows[i]
+        next_range = highs[i+1] - lows[i+1]
+        avg_range = (prev_range + curr_range + next_range) / 3
+        value = curr_range / avg_range if avg_range > 0 else 1.0
+        return min(max(value, 0.1), 3.0)
+
+    for i in range(1, len(highs) - 1):
+        prev_high, curr_high, next_high = highs[i-1], highs[i], highs[i+1]
+        prev_low, curr_low, next_low = lows[i-1], lows[i], lows[i+1]
+        if curr_high > prev_high and curr_high > next_high and curr_low > prev_low and curr_low > next_low:
+            fenxings.append({'type': 'top', 'timestamp': timestamps[i], 'price': curr_high,
+                             'index': i, 'strength': strength(i)})
+        elif curr_low < prev_low and curr_low < next_low and curr_high < prev_high and curr_high < next_high:
+            fenxings.append({'type': 'bottom', 'timestamp': timestamps[i], 'price': curr_low,
+                             'index': i, 'strength': strength(i)})
+    return fenxings
+
+
+def assert_matches_reference(high, low):
+    timestamps = list(range(1_704_067_200_000, 1_704_067_200_000 + len(high) * 60_000, 60_000))
+    expected = reference_fenxings(high, low, timestamps)
+    assert find_fenxings(np.asarray(high), np.asarray(low)).to_dict_list(timestamps) == expected
+
+    # 单点版本对每个中间K线给出同样的结论
+    single = []
+    for i in range(1, len(high) - 1):
+        result = classify_fenxing(high[i-1], low[i-1], high[i], low[i], high[i+1], low[i+1])
+        if result is not None:
+            kind, price, strength = result
+            single.append({'type': 'top' if kind == FENXING_TOP else 'bottom', 'timestamp': timestamps[i],
+                           'price': price, 'index': i, 'strength': strength})
+    assert single == expected
+    return expected
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_walk_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    close = 40000 + np.cumsum(rng.normal(0, 15, 2000))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.round(np.maximum(open_, close) + rng.random(2000) * 10, 2)
+    low = np.round(np.minimum(open_, close) - rng.random(2000) * 10, 2)
+    assert assert_matches_reference(high.tolist(), low.tolist())
+
+
+def test_ties_match_reference():
+    # 价格只取少数几个整数，相邻K线的高低点大量相等
+    rng = np.random.default_rng(7)
+    low = rng.integers(0, 4, 3000).astype(float)
+    high = low + rng.integers(0, 3, 3000)
+    assert assert_matches_reference(high.tolist(), low.tolist())
+
+
+def test_equal_neighbours_are_not_fenxings():
+    # 中间K线高点与右侧相等不构成顶分型，低点与左侧相等不构成底分型
+    assert assert_matches_reference([1.0, 3.0, 3.0, 1.0], [0.0, 2.0, 1.0, 0.0]) == []
+    assert assert_matches_reference([5.0, 4.0, 5.0], [2.0, 2.0, 3.0]) == []
+
+
+def test_zero_range_bars_match_reference():
+    # 三根K线振幅都为 0 时强度取 1.0；只有中间一根振幅为 0 时强度取下限
+    result = assert_matches_reference([1.0, 2.0, 1.0, 3.0, 5.0, 4.0], [1.0, 2.0, 1.0, 2.0, 5.0, 3.0])
+    assert [(f['type'], f['index'], f['strength']) for f in result] == [
+        ('top', 1, 1.0), ('bottom', 2, 0.1), ('top', 4, 0.1)
+    ]
+
+
+@pytest.mark.parametrize('bars', [0, 1, 2])
+def test_fewer_than_three_bars(bars):
+    fenxings = find_fenxings(np.ones(bars), np.zeros(bars))
+    assert len(fenxings) == 0
+    assert fenxings.to_dict_list([]) == []
+
+
+def test_top_and_bottom_fields():
+    fenxings = find_fenxings(np.array([1.0, 3.0, 2.0, 0.5, 2.0]), np.array([0.0, 1.0, 0.8, 0.2, 1.0]))
+    assert fenxings.index.tolist() == [1, 3]
+    assert fenxings.kind.tolist() == [FENXING_TOP, FENXING_BOTTOM]
+    assert fenxings.price.tolist() == [3.0, 0.2]
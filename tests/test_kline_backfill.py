@@ -0,0 +1,270 @@
+"""
+KlineBackfill 分片回补：令牌桶、检查点、分片规划，以及用假抓取器/写入器跑通的完整回补流程
+
+不访问网络和数据库。
+"""
+import json
+import threading
+import time
+from urllib.error import HTTPError
+
+import pytest
+
+from app.services import kline_backfill
+from app.services.kline_backfill import (
+    PAGE_LIMIT, BackfillCheckpoint, BackfillShard, KlineBackfill, TokenBucket
+)
+from app.utils.kline_columnar import MS_PER_MINUTE
+
+# 2024-01-01T00:00:00Z
+START_MS = 1_704_067_200_000
+DAY_MS = 1440 * MS_PER_MINUTE
+
+
+class FakeFetcher:
+    """按请求的时间范围生成连续的1分钟K线，可指定前几次请求返回的错误"""
+
+    def __init__(self, errors=(), missing=()):
+        self.errors = list(errors)
+        # 交易所没有数据的分钟（开盘时间毫秒）
+        self.missing = set(missing)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_klines_page(self, symbol, interval, start_ms, end_ms, limit=PAGE_LIMIT):
+        with self._lock:
+            self.calls.append((symbol, start_ms, end_ms))
+            if self.errors:
+                raise self.errors.pop(0)
+        klines = []
+        open_time = start_ms - start_ms % MS_PER_MINUTE
+        while open_time <= end_ms and len(klines) < limit:
+            if open_time not in self.missing:
+                klines.append([
+                    open_time, "100.0", "101.0", "99.0", "100.5", "2.0",
+                    open_time + MS_PER_MINUTE - 1, "201.0", 10, "1.0", "100.5", "0"
+                ])
+            open_time += MS_PER_MINUTE
+        return klines, 10
+
+
+@pytest.fixture
+def make_backfill(make_writer, make_session):
+    """KlineBackfill 工厂：默认使用新的 RecordingWriter"""
+
+    def factory(fetcher, writer=None, shard_minutes=1440):
+        return KlineBackfill(
+            fetcher=fetcher,
+            writer=writer if writer is not None else make_writer(),
+            session_factory=make_session,
+            concurrency=3,
+            weight_per_minute=60_000,
+            shard_minutes=shard_minutes,
+            max_retries=2
+        )
+
+    return factory
+
+
+# ----------------------------------------------------------------------
+# TokenBucket
+# ----------------------------------------------------------------------
+
+def test_token_bucket_grants_capacity_without_waiting():
+    bucket = TokenBucket(capacity=5, refill_per_second=1)
+    assert sum(bucket.acquire(1) for _ in range(5)) == 0
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(capacity=2, refill_per_second=100)
+    bucket.acquire(2)
+    begin = time.monotonic()
+    waited = bucket.acquire(1)
+    assert waited > 0
+    assert time.monotonic() - begin >= 0.009
+
+
+def test_token_bucket_sync_used_lowers_tokens():
+    bucket = TokenBucket(capacity=100, refill_per_second=100)
+    # 服务端报告本分钟已用 99，本地只剩 1 个令牌
+    bucket.sync_used(99)
+    assert bucket.acquire(1) == 0
+    assert bucket.acquire(1) > 0
+
+
+def test_token_bucket_pause_blocks_all_acquires():
+    bucket = TokenBucket(capacity=10, refill_per_second=1000)
+    bucket.pause(0.05)
+    begin = time.monotonic()
+    bucket.acquire(1)
+    assert time.monotonic() - begin >= 0.045
+
+
+# ----------------------------------------------------------------------
+# BackfillCheckpoint
+# ----------------------------------------------------------------------
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "progress" / "checkpoint.json")
+    params = {'symbol': 'btc_usdt', 'start_ms': 0, 'end_ms': 10}
+    checkpoint = BackfillCheckpoint(path, params)
+    shard = BackfillShard(0, 5 * MS_PER_MINUTE)
+    assert not checkpoint.is_done(shard)
+
+    checkpoint.mark_done(shard)
+    reloaded = BackfillCheckpoint(path, params)
+    assert reloaded.is_done(shard)
+    assert not reloaded.is_done(BackfillShard(5 * MS_PER_MINUTE, 10 * MS_PER_MINUTE))
+    assert not (tmp_path / "progress" / "checkpoint.json.tmp").exists()
+
+
+def test_checkpoint_ignores_other_params(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    BackfillCheckpoint(path, {'symbol': 'btc_usdt'}).mark_done(BackfillShard(0, MS_PER_MINUTE))
+    assert not BackfillCheckpoint(path, {'symbol': 'eth_usdt'}).is_done(BackfillShard(0, MS_PER_MINUTE))
+
+
+def test_checkpoint_ignores_corrupt_file(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text("{not json")
+    assert BackfillCheckpoint(str(path), {}).completed == set()
+
+
+def test_checkpoint_without_path_keeps_progress_in_memory():
+    checkpoint = BackfillCheckpoint(None, {})
+    checkpoint.mark_done(BackfillShard(0, MS_PER_MINUTE))
+    assert checkpoint.is_done(BackfillShard(0, MS_PER_MINUTE))
+
+
+# ----------------------------------------------------------------------
+# 分片规划
+# ----------------------------------------------------------------------
+
+def test_plan_shards_aligns_start_and_truncates_last_shard(make_backfill):
+    backfill = make_backfill(FakeFetcher(), shard_minutes=60)
+    shards = backfill.plan_shards(START_MS + 30_000, START_MS + 150 * MS_PER_MINUTE)
+    assert shards == [
+        BackfillShard(START_MS, START_MS + 60 * MS_PER_MINUTE),
+        BackfillShard(START_MS + 60 * MS_PER_MINUTE, START_MS + 120 * MS_PER_MINUTE),
+        BackfillShard(START_MS + 120 * MS_PER_MINUTE, START_MS + 150 * MS_PER_MINUTE),
+    ]
+    assert shards[-1].expected_bars == 30
+
+
+def test_plan_shards_empty_range(make_backfill):
+    assert make_backfill(FakeFetcher()).plan_shards(START_MS, START_MS) == []
+
+
+# ----------------------------------------------------------------------
+# 完整回补流程
+# ----------------------------------------------------------------------
+
+def test_run_writes_every_minute_once(make_backfill, make_writer):
+    fetcher, writer = FakeFetcher(), make_writer()
+    result = make_backfill(fetcher, writer).run('btc_usdt', START_MS, START_MS + 3 * DAY_MS)
+
+    assert result.success
+    assert result.shards_total == result.shards_completed == 3
+    assert sorted(writer.timestamps()) == list(range(START_MS, START_MS + 3 * DAY_MS, MS_PER_MINUTE))
+    # 每个分片 1440 分钟，每页 1000 根，需要 2 页
+    assert result.requests == len(fetcher.calls) == 6
+    assert all(symbol == 'BTCUSDT' for symbol, _, _ in fetcher.calls)
+    assert result.ingest.rows_inserted == 3 * 1440
+
+
+def test_run_resumes_from_checkpoint(tmp_path, make_backfill, make_writer):
+    path = str(tmp_path / "checkpoint.json")
+    end_ms = START_MS + 3 * DAY_MS
+    # 第二个分片写入失败，其余分片记入检查点
+    first = make_backfill(FakeFetcher(), make_writer(fail_on=[START_MS + DAY_MS])).run(
+        'btc_usdt', START_MS, end_ms, checkpoint_path=path
+    )
+    assert first.failed_shards == [BackfillShard(START_MS + DAY_MS, START_MS + 2 * DAY_MS)]
+    assert len(json.load(open(path))['completed']) == 2
+
+    writer = make_writer()
+    second = make_backfill(FakeFetcher(), writer).run('btc_usdt', START_MS, end_ms, checkpoint_path=path)
+    assert second.success
+    assert second.shards_skipped == 2 and second.shards_completed == 1
+    assert min(writer.timestamps()) == START_MS + DAY_MS
+    assert max(writer.timestamps()) == START_MS + 2 * DAY_MS - MS_PER_MINUTE
+
+
+def test_run_pauses_on_rate_limit_and_retries_errors(monkeypatch, make_backfill, make_writer):
+    sleeps = []
+
+    def short_sleep(seconds):
+        sleeps.append(seconds)
+        real_sleep(min(seconds, 0.01))
+
+    real_sleep = time.sleep
+    monkeypatch.setattr(kline_backfill.time, 'sleep', short_sleep)
+    rate_limited = HTTPError('http://fake', 429, 'Too Many Requests', {'Retry-After': '0.05'}, None)
+    fetcher = FakeFetcher(errors=[rate_limited, OSError("connection reset")])
+    writer = make_writer()
+    backfill = make_backfill(fetcher, writer, shard_minutes=500)
+    backfill.max_retries = 3
+
+    result = backfill.run('btc_usdt', START_MS, START_MS + 500 * MS_PER_MINUTE)
+    assert result.success
+    assert len(writer.timestamps()) == 500
+    assert result.requests == 3
+    # 429 暂停整个令牌桶，等待计入限流等待时间；第二次请求（attempt=1）的连接错误退避 2 秒
+    assert result.rate_limit_wait_seconds >= 0.04
+    assert 2 in sleeps
+
+
+def test_run_skips_minutes_missing_on_exchange(make_backfill, make_writer):
+    missing = {START_MS + 10 * MS_PER_MINUTE, START_MS + 11 * MS_PER_MINUTE}
+    writer = make_writer()
+    result = make_backfill(FakeFetcher(missing=missing), writer, shard_minutes=60).run(
+        'btc_usdt', START_MS, START_MS + 60 * MS_PER_MINUTE
+    )
+    assert result.success
+    assert len(writer.timestamps()) == 58
+    assert not missing & set(writer.timestamps())
+
+
+def test_run_rejects_unknown_symbol(make_backfill):
+    with pytest.raises(ValueError):
+        make_backfill(FakeFetcher()).run('doge_usdt', START_MS, START_MS + DAY_MS)
+
+
+# ----------------------------------------------------------------------
+# 按缺口规划分片
+# ----------------------------------------------------------------------
+
+def test_plan_gap_shards_merges_gaps_within_one_page(make_backfill):
+    backfill = make_backfill(FakeFetcher())
+    gaps = [
+        (START_MS, START_MS + 10 * MS_PER_MINUTE),
+        (START_MS + 500 * MS_PER_MINUTE, START_MS + 510 * MS_PER_MINUTE),
+    ]
+    # 两个缺口合并后仍只需一页，作为一个分片抓取
+    assert backfill.plan_gap_shards(gaps) == [BackfillShard(START_MS, START_MS + 510 * MS_PER_MINUTE)]
+
+
+def test_plan_gap_shards_keeps_distant_gaps_apart(make_backfill):
+    backfill = make_backfill(FakeFetcher())
+    gaps = [
+        (START_MS, START_MS + 10 * MS_PER_MINUTE),
+        (START_MS + 5000 * MS_PER_MINUTE, START_MS + 5010 * MS_PER_MINUTE),
+    ]
+    assert backfill.plan_gap_shards(gaps) == [BackfillShard(*gap) for gap in gaps]
+
+
+def test_plan_gap_shards_splits_long_gaps_by_shard_minutes(make_backfill):
+    backfill = make_backfill(FakeFetcher(), shard_minutes=1000)
+    shards = backfill.plan_gap_shards([(START_MS, START_MS + 2500 * MS_PER_MINUTE)])
+    assert [shard.expected_bars for shard in shards] == [1000, 1000, 500]
+
+
+def test_run_only_missing_fetches_gaps(monkeypatch, make_backfill, make_writer):
+    gaps = [(START_MS + 100 * MS_PER_MINUTE, START_MS + 103 * MS_PER_MINUTE)]
+    monkeypatch.setattr(kline_backfill.kline_coverage, 'missing_ranges', lambda db, symbol, start, end: gaps)
+    fetcher, writer = FakeFetcher(), make_writer()
+
+    result = make_backfill(fetcher, writer).run('btc_usdt', START_MS, START_MS + DAY_MS, only_missing=True)
+    assert result.success and result.shards_total == 1
+    assert fetcher.calls == [('BTCUSDT', gaps[0][0], gaps[0][1] - 1)]
+    assert writer.timestamps() == list(range(gaps[0][0], gaps[0][1], MS_PER_MINUTE))
@@ -0,0 +1,147 @@
+"""
+KlineBarCache：环形缓冲区合并、按字节数的 LRU 淘汰、写入后的清除和过期
+"""
+import numpy as np
+
+from app.services import kline_bar_cache as bar_cache_module
+from app.services.kline_bar_cache import BYTES_PER_BAR, BarRingBuffer, KlineBarCache
+from app.utils.kline_columnar import MS_PER_MINUTE, KlineColumns
+
+# 2024-01-01T00:00:00Z
+START_MS = 1_704_067_200_000
+INTERVAL_MS = 5 * MS_PER_MINUTE
+
+
+def make_bars(first, count, close=1.0):
+    """从第 first 根起连续 count 根5分钟K线，收盘价均为 close"""
+    timestamps = START_MS + (first + np.arange(count)) * INTERVAL_MS
+    return KlineColumns(
+        timestamp=timestamps.astype(np.int64),
+        open=np.full(count, 100.0),
+        high=np.full(count, 101.0),
+        low=np.full(count, 99.0),
+        close=np.full(count, close),
+        volume=np.full(count, 2.0),
+        quote_volume=np.full(count, 200.0),
+        trades_count=np.full(count, 10, dtype=np.int64),
+        taker_buy_volume=np.full(count, 1.0),
+        taker_buy_quote_volume=np.full(count, 100.0),
+        interval_minutes=5
+    )
+
+
+def bar_numbers(columns):
+    return ((columns.timestamp - START_MS) // INTERVAL_MS).tolist()
+
+
+# ----------------------------------------------------------------------
+# BarRingBuffer
+# ----------------------------------------------------------------------
+
+def test_merge_replaces_live_bar_and_appends():
+    buffer = BarRingBuffer(capacity=10, interval_minutes=5)
+    buffer.merge(make_bars(0, 3, close=1.0))
+    # 第 2 根（未收盘）被新聚合的结果覆盖，第 3、4 根追加
+    buffer.merge(make_bars(2, 3, close=2.0))
+
+    columns = buffer.to_columns()
+    assert bar_numbers(columns) == [0, 1, 2, 3, 4]
+    assert columns.close.tolist() == [1.0, 1.0, 2.0, 2.0, 2.0]
+    assert buffer.last_timestamp() == START_MS + 4 * INTERVAL_MS
+
+
+def test_merge_wraps_around_and_drops_oldest():
+    buffer = BarRingBuffer(capacity=4, interval_minutes=5)
+    buffer.merge(make_bars(0, 3))
+    buffer.merge(make_bars(2, 4))
+    assert len(buffer) == 4
+    assert bar_numbers(buffer.to_columns()) == [2, 3, 4, 5]
+    assert bar_numbers(buffer.to_columns(limit=2)) == [4, 5]
+
+    # 一次合并超过容量时只保留最新的 capacity 根
+    buffer.merge(make_bars(5, 10))
+    assert bar_numbers(buffer.to_columns()) == [11, 12, 13, 14]
+
+
+def test_merge_empty_and_to_columns_limit():
+    buffer = BarRingBuffer(capacity=4, interval_minutes=5)
+    buffer.merge(make_bars(0, 0))
+    assert len(buffer) == 0 and buffer.last_timestamp() is None
+    buffer.merge(make_bars(0, 2))
+    assert bar_numbers(buffer.to_columns(limit=10)) == [0, 1]
+
+
+# ----------------------------------------------------------------------
+# KlineBarCache
+# ----------------------------------------------------------------------
+
+def test_lookup_and_merge_count_hits_and_misses():
+    cache = KlineBarCache(default_capacity=10, max_age_seconds=None)
+    assert cache.lookup('btc_usdt', '5m', 3) is None
+
+    cache.put('btc_usdt', '5m', make_bars(0, 5))
+    assert cache.lookup('btc_usdt', '5m', 10) is None  # 不足 limit 根
+    assert cache.lookup('btc_usdt', '5m', 3) == START_MS + 4 * INTERVAL_MS
+    merged = cache.merge('btc_usdt', '5m', make_bars(4, 2, close=3.0), limit=3)
+    assert bar_numbers(merged) == [3, 4, 5]
+
+    stats = cache.get_statistics()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+def test_merge_after_eviction_is_a_miss():
+    cache = KlineBarCache(default_capacity=10, max_age_seconds=None)
+    assert cache.merge('btc_usdt', '5m', make_bars(0, 1), limit=1) is None
+    assert cache.get_statistics()['misses'] == 1
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = KlineBarCache(max_bytes=2 * 10 * BYTES_PER_BAR, default_capacity=10, max_age_seconds=None)
+    cache.put('btc_usdt', '5m', make_bars(0, 5))
+    cache.put('btc_usdt', '15m', make_bars(0, 5))
+    # 访问 5m 后它成为最近使用，再放入第三个键时淘汰 15m
+    cache.lookup('btc_usdt', '5m', 1)
+    cache.put('eth_usdt', '5m', make_bars(0, 5))
+
+    stats = cache.get_statistics()
+    assert stats['keys'] == ['btc_usdt:5m', 'eth_usdt:5m']
+    assert stats['evictions'] == 1
+    assert stats['memory_bytes'] <= cache.max_bytes
+
+
+def test_put_skips_results_larger_than_the_budget():
+    cache = KlineBarCache(max_bytes=5 * BYTES_PER_BAR, default_capacity=1, max_age_seconds=None)
+    cache.put('btc_usdt', '5m', make_bars(0, 6))
+    assert cache.get_statistics()['entries'] == 0
+
+
+def test_invalidate_since_drops_buffers_with_later_closed_bars():
+    cache = KlineBarCache(default_capacity=10, max_age_seconds=None)
+    cache.put('btc_usdt', '5m', make_bars(0, 5))
+    cache.put('btc_usdt', '1h', make_bars(0, 2))
+    cache.put('eth_usdt', '5m', make_bars(0, 5))
+
+    # 写入第 3 根K线开盘时间之后的数据：btc 5m 的第 4 根晚于它，缓存失效；
+    # btc 1h 的最后一根开盘时间不晚于写入时间，只是未收盘K线，下次命中时会重新聚合
+    cache.invalidate_since('btc_usdt', START_MS + 3 * INTERVAL_MS)
+    assert cache.get_statistics()['keys'] == ['btc_usdt:1h', 'eth_usdt:5m']
+
+    cache.invalidate('btc_usdt')
+    assert cache.get_statistics()['keys'] == ['eth_usdt:5m']
+
+
+def test_closed_bars_expire_after_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bar_cache_module.time, 'monotonic', lambda: now[0])
+    cache = KlineBarCache(default_capacity=10, max_age_seconds=60)
+    cache.put('btc_usdt', '5m', make_bars(0, 5))
+
+    now[0] += 30
+    assert cache.lookup('btc_usdt', '5m', 3) is not None
+    # 增量合并不延长寿命：其他进程可能改写了已收盘的K线
+    cache.merge('btc_usdt', '5m', make_bars(4, 1), limit=3)
+    now[0] += 31
+    assert cache.lookup('btc_usdt', '5m', 3) is None
+
+    stats = cache.get_statistics()
+    assert stats['expirations'] == 1 and stats['entries'] == 0
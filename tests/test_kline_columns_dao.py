@@ -0,0 +1,169 @@
+"""
+KlineColumnsDao：持续聚合视图路径的时间范围（时区、结束时间所在的不完整桶）
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.crud.kline_columns_dao import KlineColumnsDao
+from app.models.kline import BtcUsdtKline
+from app.utils.kline_columnar import KlineColumns
+
+# 2024-01-01T00:00:00Z（epoch秒）
+START = 1_704_067_200
+START_TIME = datetime(2024, 1, 1)
+
+
+def make_columns(first_second, count, interval_minutes=1):
+    """从 first_second 起连续 count 根K线，收盘价依次为 1, 2, 3, ..."""
+    step = interval_minutes * 60
+    return KlineColumns.from_rows(
+        [
+            (first_second + i * step, 100.0, 101.0, 99.0, float(i + 1), 1.0, 100.0, 10, 0.5, 50.0)
+            for i in range(count)
+        ],
+        interval_minutes=interval_minutes
+    )
+
+
+class RecordingSession:
+    """记录执行的语句和参数，返回空结果"""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, statement, params=None):
+        self.executed.append((str(statement), params))
+        return self
+
+    def all(self):
+        return []
+
+
+@pytest.fixture
+def dao():
+    dao = KlineColumnsDao()
+    dao._view_status['btc_usdt_15m'] = True
+    return dao
+
+
+def test_view_columns_only_read_buckets_complete_before_end_time(dao):
+    db = RecordingSession()
+    symbol, timeframe = dao.resolve_view(BtcUsdtKline, 15)
+    dao.get_view_columns(db, symbol=symbol, timeframe=timeframe, end_time=START_TIME + timedelta(minutes=40))
+    sql, params = db.executed[0]
+    assert "bucket <= :last_bucket" in sql
+    # 00:15 的桶在 00:30 走完，00:30 的桶到 00:40 还没有走完
+    assert params['last_bucket'] == START_TIME + timedelta(minutes=25)
+
+
+def test_view_backed_columns_build_partial_last_bar_from_raw_tail(dao, monkeypatch):
+    raw_calls = []
+    monkeypatch.setattr(dao, 'get_view_columns', lambda db, **kwargs: make_columns(START, 2, 15))
+
+    def get_raw_columns(db, model, start_time, end_time, limit=None):
+        raw_calls.append((start_time, end_time))
+        return make_columns(START + 30 * 60, 10)
+
+    monkeypatch.setattr(dao, 'get_raw_columns', get_raw_columns)
+    columns, view_rows, raw_rows = dao.get_view_backed_columns(
+        RecordingSession(), model=BtcUsdtKline, interval_minutes=15,
+        end_time=START_TIME + timedelta(minutes=40), limit=10
+    )
+    # 尾部从视图最后一个桶的结束时间读到结束时间，聚合为不完整的最后一根
+    assert raw_calls == [(START_TIME + timedelta(minutes=30), START_TIME + timedelta(minutes=40))]
+    assert (view_rows, raw_rows) == (2, 10)
+    assert columns.timestamp.tolist() == [(START + offset * 60) * 1000 for offset in (0, 15, 30)]
+    assert columns.close[-1] == 10.0
+
+
+def test_view_backed_columns_accept_aware_times(dao, monkeypatch):
+    view_calls, raw_calls = [], []
+
+    def get_view_columns(db, **kwargs):
+        view_calls.append(kwargs)
+        return make_columns(START, 2, 15)
+
+    def get_raw_columns(db, model, start_time, end_time, limit=None):
+        raw_calls.append((start_time, end_time))
+        return KlineColumns.empty()
+
+    monkeypatch.setattr(dao, 'get_view_columns', get_view_columns)
+    monkeypatch.setattr(dao, 'get_raw_columns', get_raw_columns)
+    dao.get_view_backed_columns(
+        RecordingSession(), model=BtcUsdtKline, interval_minutes=15,
+        start_time=datetime(2024, 1, 1, 8, 10, tzinfo=timezone(timedelta(hours=8))),
+        end_time=datetime(2024, 1, 1, 0, 40, tzinfo=timezone.utc), limit=10
+    )
+    assert view_calls[0]['start_time'] == START_TIME + timedelta(minutes=10)
+    assert view_calls[0]['end_time'] == START_TIME + timedelta(minutes=40)
+    assert raw_calls == [(START_TIME + timedelta(minutes=30), START_TIME + timedelta(minutes=40))]
+
+
+# ----------------------------------------------------------------------
+# 写入后刷新持续聚合视图
+# ----------------------------------------------------------------------
+
+class RefreshSession:
+    """记录自动提交连接上执行的 refresh_continuous_aggregate"""
+
+    def __init__(self):
+        self.calls = []
+        self.isolation_levels = []
+
+    def get_bind(self):
+        return self
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execution_options(self, isolation_level=None):
+        self.isolation_levels.append(isolation_level)
+        return self
+
+    def execute(self, statement, params):
+        view_name = str(statement).split("'")[1]
+        self.calls.append((view_name, params['window_start'], params['window_end']))
+
+
+@pytest.fixture
+def timescale_dao():
+    dao = KlineColumnsDao()
+    for timeframe in dao.VIEW_TIMEFRAMES:
+        dao._view_status[timeframe.build_view_name('btc_usdt')] = True
+    return dao
+
+
+def test_refresh_views_widens_backfill_range_to_whole_buckets(timescale_dao):
+    db = RefreshSession()
+    start_ms = (START + 7 * 60) * 1000
+    refreshed = timescale_dao.refresh_views(db, BtcUsdtKline, start_ms, start_ms + 20 * 60_000)
+
+    assert refreshed == 6
+    assert db.isolation_levels == ["AUTOCOMMIT"]
+    windows = {view_name: (window_start, window_end) for view_name, window_start, window_end in db.calls}
+    assert windows['btc_usdt_5m'] == (START_TIME + timedelta(minutes=5), START_TIME + timedelta(minutes=30))
+    assert windows['btc_usdt_1h'] == (START_TIME, START_TIME + timedelta(hours=1))
+    assert windows['btc_usdt_1d'] == (START_TIME, START_TIME + timedelta(days=1))
+
+
+def test_refresh_views_skips_buckets_still_in_progress(timescale_dao):
+    db = RefreshSession()
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    current_minute = now_ms - now_ms % 60_000
+    # 实时流写入当前分钟：每个视图中它所在的桶都还没有走完
+    assert timescale_dao.refresh_views(db, BtcUsdtKline, current_minute, current_minute + 60_000) == 0
+    assert db.calls == []
+
+
+def test_refresh_views_without_views(dao):
+    db = RefreshSession()
+    dao._view_status.update({timeframe.build_view_name('btc_usdt'): False for timeframe in dao.VIEW_TIMEFRAMES})
+    assert dao.refresh_views(db, BtcUsdtKline, START * 1000, (START + 3600) * 1000) == 0
+    assert db.isolation_levels == []
@@ -0,0 +1,138 @@
+"""
+kline_copy：COPY BINARY / CSV 编码与向量化校验
+"""
+import struct
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils.kline_copy import (
+    COPY_COLUMNS, PG_EPOCH_MS, copy_column_name, encode_copy_binary, encode_copy_csv, validate_columns
+)
+from app.utils.kline_columnar import ROW_FIELDS, KlineColumns
+
+# 2024-01-01T00:00:00Z（epoch秒）
+START = 1_704_067_200
+NOW_MS = (START + 3600) * 1000
+
+INTEGER_COLUMNS = ('timestamp', 'open_time', 'close_time', 'trades_count')
+
+
+def make_columns(*rows, interval_minutes=1):
+    """rows 为 (开盘时间相对 START 的分钟数, open, high, low, close)，其余字段取固定值"""
+    return KlineColumns.from_rows(
+        [(START + minute * 60, o, h, l, c, 1.5, 150.25, 7, 0.75, 75.125) for minute, o, h, l, c in rows],
+        interval_minutes=interval_minutes
+    )
+
+
+def decode_copy_binary(data):
+    """按 PostgreSQL COPY BINARY 格式逐字段解析（参考实现，与 NumPy 编码无关）"""
+    assert data[:11] == b'PGCOPY\n\xff\r\n\x00'
+    flags, extension_length = struct.unpack_from('>ii', data, 11)
+    assert (flags, extension_length) == (0, 0)
+    offset, tuples = 19, []
+    while True:
+        (field_count,) = struct.unpack_from('>h', data, offset)
+        offset += 2
+        if field_count == -1:
+            break
+        assert field_count == len(COPY_COLUMNS)
+        row = {}
+        for name in COPY_COLUMNS:
+            (length,) = struct.unpack_from('>i', data, offset)
+            assert length == 8
+            (row[name],) = struct.unpack_from('>q' if name in INTEGER_COLUMNS else '>d', data, offset + 4)
+            offset += 4 + length
+        tuples.append(row)
+    assert offset == len(data)
+    return tuples
+
+
+def pg_timestamp(microseconds):
+    return datetime(2000, 1, 1) + timedelta(microseconds=microseconds)
+
+
+def test_copy_binary_layout():
+    columns = make_columns((0, 100.5, 101.25, 99.75, 100.0), (5, 0.1, 0.3, 0.1, 0.2), interval_minutes=5)
+    tuples = decode_copy_binary(encode_copy_binary(columns))
+
+    assert len(tuples) == 2
+    first = tuples[0]
+    assert first['timestamp'] == START * 1000
+    # 时间戳以 2000-01-01 为纪元的微秒数，收盘时间为下一根的开盘时间
+    assert pg_timestamp(first['open_time']) == datetime(2024, 1, 1, 0, 0)
+    assert pg_timestamp(first['close_time']) == datetime(2024, 1, 1, 0, 5)
+    assert pg_timestamp(tuples[1]['open_time']) == datetime(2024, 1, 1, 0, 5)
+    assert first['open_time'] == (START * 1000 - PG_EPOCH_MS) * 1000
+    for name in ROW_FIELDS:
+        assert [row[copy_column_name(name)] for row in tuples] == getattr(columns, name).tolist()
+    assert tuples[1]['trades_count'] == 7
+
+
+def test_copy_binary_empty():
+    assert decode_copy_binary(encode_copy_binary(KlineColumns.empty())) == []
+
+
+def test_copy_csv():
+    columns = make_columns((0, 100.5, 101.25, 99.75, 0.1 + 0.2))
+    lines = encode_copy_csv(columns).decode().splitlines()
+
+    assert lines == [
+        '1704067200000,2024-01-01T00:00:00.000,2024-01-01T00:01:00.000,'
+        '100.5,101.25,99.75,0.30000000000000004,1.5,150.25,7,0.75,75.125'
+    ]
+    assert len(lines[0].split(',')) == len(COPY_COLUMNS)
+    assert encode_copy_csv(KlineColumns.empty()) == b''
+
+
+# ----------------------------------------------------------------------
+# validate_columns
+# ----------------------------------------------------------------------
+
+def test_valid_rows_pass():
+    valid, problems = validate_columns(make_columns((0, 10, 11, 9, 10), (1, 10, 10, 10, 10)), now_ms=NOW_MS)
+    assert valid.tolist() == [True, True] and problems == {}
+
+
+@pytest.mark.parametrize('row, reason', [
+    ((0, 10, float('nan'), 9, 10), 'non_finite'),
+    ((0, 10, float('inf'), 9, 10), 'non_finite'),
+    ((0, 10, 11, 0, 10), 'non_positive_price'),
+    ((0, 10, 9, 11, 10), 'high_below_low'),
+    ((0, 12, 11, 9, 10), 'open_close_out_of_range'),
+    ((0, 10, 11, 9, 8), 'open_close_out_of_range'),
+    ((0.5, 10, 11, 9, 10), 'misaligned_timestamp'),
+    ((61, 10, 11, 9, 10), 'future_timestamp'),
+])
+def test_each_rejection_reason(row, reason):
+    columns = make_columns((30, 10, 11, 9, 10), row)
+    valid, problems = validate_columns(columns, now_ms=NOW_MS)
+    assert valid.tolist() == [True, False]
+    assert reason in problems and problems[reason] == 1
+
+
+def test_negative_volume():
+    columns = make_columns((0, 10, 11, 9, 10), (1, 10, 11, 9, 10))
+    columns.taker_buy_volume[1] = -1.0
+    valid, problems = validate_columns(columns, now_ms=NOW_MS)
+    assert valid.tolist() == [True, False] and problems == {'negative_volume': 1}
+
+
+def test_duplicates_keep_first_row():
+    columns = make_columns((2, 10, 11, 9, 10), (1, 10, 11, 9, 10), (2, 20, 21, 19, 20), (2, 30, 31, 29, 30))
+    valid, problems = validate_columns(columns, now_ms=NOW_MS)
+    assert valid.tolist() == [True, True, False, False]
+    assert problems == {'duplicate': 2}
+
+
+def test_row_counted_under_every_reason_it_fails():
+    valid, problems = validate_columns(make_columns((0, 10, 9, 11, -1)), now_ms=NOW_MS)
+    assert valid.tolist() == [False]
+    assert problems == {'non_positive_price': 1, 'high_below_low': 1, 'open_close_out_of_range': 1}
+
+
+def test_misaligned_for_the_interval():
+    columns = make_columns((0, 10, 11, 9, 10), (3, 10, 11, 9, 10), interval_minutes=5)
+    valid, problems = validate_columns(columns, now_ms=NOW_MS)
+    assert valid.tolist() == [True, False] and problems == {'misaligned_timestamp': 1}
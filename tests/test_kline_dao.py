@@ -0,0 +1,183 @@
+"""
+KlineDao：查询计划的时间范围、键集分页
+"""
+import asyncio
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints import kline as kline_endpoints
+from app.core.exceptions import AppException
+from app.crud.kline_dao import KlineDao, decode_cursor, encode_cursor
+from app.models.kline import BtcUsdtKline
+
+dao = KlineDao()
+
+
+class LatestOpenTimeSession:
+    """plan_kline_query 在未指定结束时间时查询 MAX(open_time)"""
+
+    def __init__(self, latest):
+        self.latest = latest
+
+    def query(self, *entities):
+        return self
+
+    def scalar(self):
+        return self.latest
+
+
+def plan(interval_minutes, limit, start_time=None, end_time=None, db=None):
+    return dao.plan_kline_query(
+        db, model=BtcUsdtKline, interval_minutes=interval_minutes,
+        start_time=start_time, end_time=end_time, limit=limit
+    )
+
+
+def test_plan_accepts_aware_end_time_as_utc():
+    aware = plan(15, 10, end_time=datetime(2024, 1, 1, 8, 0, tzinfo=timezone(timedelta(hours=8))))
+    naive = plan(15, 10, end_time=datetime(2024, 1, 1, 0, 0))
+    assert aware.start_time == naive.start_time == datetime(2023, 12, 31, 21, 30)
+    assert aware.end_time == naive.end_time == datetime(2024, 1, 1, 0, 0)
+    assert aware.end_time.tzinfo is None
+
+
+def test_plan_accepts_aware_start_time():
+    result = plan(
+        60, 100,
+        start_time=datetime(2024, 1, 1, 20, 0, tzinfo=timezone.utc),
+        end_time=datetime(2024, 1, 2, 0, 0, tzinfo=timezone.utc)
+    )
+    # 开始时间晚于 limit 推出的起点时以开始时间为准
+    assert result.start_time == datetime(2024, 1, 1, 20, 0)
+    assert result.end_time == datetime(2024, 1, 2, 0, 0)
+
+
+def test_plan_daily_limit_1000_covers_every_bucket():
+    result = plan(1440, 1000, end_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    assert result.end_time - result.start_time == timedelta(days=1000)
+    assert result.start_time == datetime(2024, 1, 1) - timedelta(days=1000)
+
+
+def test_plan_partial_last_bucket():
+    result = plan(1440, 1000, end_time=datetime(2024, 1, 1, 12, 0))
+    # 结束时间所在的未走完的一天作为最后一根，向前共 1000 个整天桶
+    assert result.start_time == datetime(2024, 1, 1) - timedelta(days=999)
+    assert result.end_time == datetime(2024, 1, 1, 12, 0)
+
+
+def test_plan_without_end_time_uses_latest_open_time():
+    result = plan(5, 3, db=LatestOpenTimeSession(datetime(2024, 1, 1, 0, 7)))
+    assert result.end_time == datetime(2024, 1, 1, 0, 8)
+    assert result.start_time == datetime(2023, 12, 31, 23, 55)
+
+
+def test_plan_empty_table():
+    assert plan(5, 3, db=LatestOpenTimeSession(None)).empty
+
+
+def test_plan_1m_keeps_range_and_normalizes_time_zone():
+    result = plan(1, 10, end_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    assert result.start_time is None
+    assert result.end_time == datetime(2024, 1, 1)
+
+
+# ----------------------------------------------------------------------
+# 键集分页
+# ----------------------------------------------------------------------
+
+START = datetime(2024, 1, 1)
+
+
+class SyncBackedAsyncSession:
+    """以同步 Session 执行 run_sync 的异步会话（端点经 get_page_async 调用 _query_page）"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.session, *args, **kwargs)
+
+
+@pytest.fixture
+def kline_session():
+    """SQLite 内存库中的 btc_usdt 表，写入 5 根K线；其中两根开盘时间相同，以 id 区分先后"""
+    engine = create_engine('sqlite://')
+    BtcUsdtKline.__table__.create(engine)
+    open_times = [START + timedelta(minutes=m) for m in (0, 1, 2, 2, 3)]
+    with Session(engine) as session:
+        for kline_id, open_time in enumerate(open_times, start=1):
+            session.add(BtcUsdtKline(
+                id=kline_id, timestamp=int(open_time.replace(tzinfo=timezone.utc).timestamp() * 1000),
+                open_time=open_time, close_time=open_time + timedelta(seconds=59),
+                open_price=1, high_price=1, low_price=1, close_price=1, volume=1,
+                quote_volume=1, trades_count=1, taker_buy_volume=1, taker_buy_quote_volume=1
+            ))
+        session.commit()
+        yield session
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(datetime(2024, 1, 1, 0, 3), 42)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (datetime(2024, 1, 1, 0, 3), 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    '!!!',
+    encode_cursor(datetime(2024, 1, 1), 1)[:-3],
+    base64.urlsafe_b64encode(b'{"t":"2024-01-01T00:00:00"}').decode(),
+    base64.urlsafe_b64encode(b'{"t":"yesterday","id":1}').decode(),
+    base64.urlsafe_b64encode(b'[1, 2]').decode(),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_walk_every_row_once(kline_session):
+    seen, cursor = [], None
+    while True:
+        page, cursor = dao._query_page(kline_session, symbol='btc_usdt', limit=2, cursor=cursor)
+        seen.extend(kline.id for kline in page)
+        if cursor is None:
+            break
+    # (open_time, id) 倒序：开盘时间相同的两根按 id 倒序，跨页时不重复也不遗漏
+    assert seen == [5, 4, 3, 2, 1]
+
+
+def test_next_cursor_only_when_more_rows_exist(kline_session):
+    # 恰好取完（limit == 剩余行数）时多取的一条不存在，不返回下一页令牌
+    page, cursor = dao._query_page(kline_session, symbol='btc_usdt', limit=5)
+    assert len(page) == 5 and cursor is None
+
+    page, cursor = dao._query_page(kline_session, symbol='btc_usdt', limit=4)
+    assert [kline.id for kline in page] == [5, 4, 3, 2]
+    assert decode_cursor(cursor) == (START + timedelta(minutes=1), 2)
+
+    page, cursor = dao._query_page(kline_session, symbol='btc_usdt', limit=4, cursor=cursor)
+    assert [kline.id for kline in page] == [1] and cursor is None
+
+
+def test_malformed_cursor_is_a_400(kline_session):
+    db = SyncBackedAsyncSession(kline_session)
+    with pytest.raises(AppException) as exc_info:
+        asyncio.run(kline_endpoints.read_kline(db=db, symbol='btc_usdt', skip=0, limit=2, cursor='!!!'))
+    assert exc_info.value.status_code == 400
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(kline_endpoints.get_btc_usdt_klines(Response(), db=db, skip=0, limit=2, cursor='!!!'))
+    assert exc_info.value.status_code == 400
+
+
+def test_endpoint_returns_next_cursor_header(kline_session):
+    response = Response()
+    klines = asyncio.run(kline_endpoints.get_btc_usdt_klines(
+        response, db=SyncBackedAsyncSession(kline_session), skip=0, limit=3, cursor=None
+    ))
+    assert [kline['id'] for kline in klines] == [5, 4, 3]
+    assert decode_cursor(response.headers[kline_endpoints.NEXT_CURSOR_HEADER]) == (START + timedelta(minutes=2), 3)
@@ -0,0 +1,114 @@
+"""
+KlineIngestWriter：合并和多行 VALUES 写入生成的 ON CONFLICT 语句（编译为 PostgreSQL 方言，不连接数据库）
+"""
+import re
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models.kline import BtcUsdtKline
+from app.services.kline_ingest import _UPDATE_COLUMNS, OHLCV_UPDATE_COLUMNS, KlineIngestWriter
+from app.utils.kline_columnar import KlineColumns
+
+# 2024-01-01T00:00:00Z（epoch秒）
+START = 1_704_067_200
+
+# OHLCV 数据源估算出的列，不能出现在它的 SET 和比较列表中
+ESTIMATED_COLUMNS = ('quote_volume', 'trades_count', 'taker_buy_volume', 'taker_buy_quote_volume')
+
+
+class CompilingSession:
+    """把执行的语句编译为 PostgreSQL SQL 记录下来，返回空结果"""
+
+    def __init__(self):
+        self.sql = []
+
+    def execute(self, statement, params=None):
+        compiled = statement.compile(dialect=postgresql.dialect())
+        self.sql.append(' '.join(str(compiled).split()))
+        return self
+
+    def one(self):
+        return 0, 0
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return []
+
+
+def make_columns(count=3):
+    return KlineColumns.from_rows(
+        [(START + i * 60, 10.0, 11.0, 9.0, 10.5, 1.0, 10.0, 3, 0.5, 5.0) for i in range(count)]
+    )
+
+
+def merge_sql(update_existing, update_columns):
+    db = CompilingSession()
+    KlineIngestWriter()._merge(db, 'btc_usdt', '_staging_btc_usdt', update_existing, update_columns)
+    return db.sql[0]
+
+
+def upsert_values_sql(update_existing, update_columns):
+    db = CompilingSession()
+    KlineIngestWriter()._upsert_values(db, BtcUsdtKline, make_columns(), update_existing, update_columns)
+    return db.sql[0]
+
+
+def split_update(sql):
+    """拆出 DO UPDATE SET 的列、WHERE 两侧的行构造器"""
+    match = re.search(
+        r'ON CONFLICT \(open_time\) DO UPDATE SET (.*) WHERE \((.*)\) IS DISTINCT FROM \((.*)\) RETURNING', sql
+    )
+    assert match, sql
+    assignments, left, right = match.groups()
+    return [item.strip() for item in assignments.split(',')], left.split(', '), right.split(', ')
+
+
+def expected_assignments(update_columns):
+    return [f'{name} = EXCLUDED.{name}' for name in update_columns] + ['updated_at = now()']
+
+
+@pytest.mark.parametrize('update_columns', [_UPDATE_COLUMNS, OHLCV_UPDATE_COLUMNS])
+def test_merge_updates_only_changed_rows(update_columns):
+    sql = merge_sql(True, update_columns)
+    assignments, left, right = split_update(sql)
+
+    assert assignments == expected_assignments(update_columns)
+    assert left == [f't.{name}' for name in update_columns]
+    assert right == [f'EXCLUDED.{name}' for name in update_columns]
+    assert 'RETURNING (t.xmax = 0) AS inserted' in sql
+    assert 'count(*) FILTER (WHERE inserted), count(*) FROM written' in sql
+
+
+@pytest.mark.parametrize('update_columns', [_UPDATE_COLUMNS, OHLCV_UPDATE_COLUMNS])
+def test_upsert_values_updates_only_changed_rows(update_columns):
+    sql = upsert_values_sql(True, update_columns)
+    assignments, left, right = split_update(sql)
+
+    # SET 按表的列顺序输出
+    assert sorted(item.replace('excluded.', 'EXCLUDED.') for item in assignments) == sorted(
+        expected_assignments(update_columns)
+    )
+    assert left == [f'btc_usdt.{name}' for name in update_columns]
+    assert right == [f'excluded.{name}' for name in update_columns]
+    assert sql.endswith('RETURNING xmax = 0')
+
+
+def test_ohlcv_update_leaves_estimated_columns_alone():
+    for sql in (merge_sql(True, OHLCV_UPDATE_COLUMNS), upsert_values_sql(True, OHLCV_UPDATE_COLUMNS)):
+        conflict_clause = sql[sql.index('ON CONFLICT'):sql.index('RETURNING')]
+        for name in ESTIMATED_COLUMNS:
+            assert name not in conflict_clause
+
+
+def test_default_update_columns_cover_every_value_column():
+    assert set(_UPDATE_COLUMNS) == {
+        'close_time', 'open_price', 'high_price', 'low_price', 'close_price', *ESTIMATED_COLUMNS, 'volume'
+    }
+
+
+def test_without_update_existing_conflicts_are_skipped():
+    assert 'ON CONFLICT (open_time) DO NOTHING RETURNING (t.xmax = 0)' in merge_sql(False, _UPDATE_COLUMNS)
+    assert 'ON CONFLICT (open_time) DO NOTHING RETURNING xmax = 0' in upsert_values_sql(False, _UPDATE_COLUMNS)
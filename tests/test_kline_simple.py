@@ -0,0 +1,27 @@
+"""
+/api/v1/simple/stats：缺口统计不在事件循环线程上执行
+"""
+import asyncio
+import threading
+
+from app.api.v1.endpoints import kline_simple
+
+
+def test_stats_computes_gap_summary_off_the_event_loop(monkeypatch, make_session):
+    threads = {}
+
+    async def get_data_statistics_async(db, symbol):
+        threads['loop'] = threading.current_thread()
+        return {'total_klines': 0}
+
+    def get_gap_summary(db, symbol):
+        threads['gaps'] = threading.current_thread()
+        return {'gap_count': 0}
+
+    monkeypatch.setattr(kline_simple.kline_aggregator, 'get_data_statistics_async', get_data_statistics_async)
+    monkeypatch.setattr(kline_simple.kline_coverage, 'get_gap_summary', get_gap_summary)
+    monkeypatch.setattr(kline_simple.db_router, 'read_session', lambda symbol: make_session())
+
+    response = asyncio.run(kline_simple.get_data_statistics(symbol='btc_usdt', db=None))
+    assert response.status_code == 200
+    assert threads['gaps'] is not threads['loop']
@@ -0,0 +1,202 @@
+"""
+KlineStreamIngester：断线重连、推送容错、写入失败后的缺口补齐
+
+WebSocket 使用本地 aiohttp 模拟服务，REST 补齐使用假客户端，不访问外网和数据库。
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+
+from app.services.kline_stream import KlineStreamIngester  # noqa: E402
+from app.utils.kline_columnar import MS_PER_MINUTE, KlineColumns  # noqa: E402
+from common.model import SymbolEnum  # noqa: E402
+
+
+def current_minute() -> int:
+    now_ms = int(time.time() * 1000)
+    return now_ms - now_ms % MS_PER_MINUTE
+
+
+def kline_message(open_time, closed, close="100.5", symbol="btcusdt"):
+    """组合流中的一条 kline 推送"""
+    return json.dumps({
+        "stream": f"{symbol}@kline_1m",
+        "data": {
+            "e": "kline", "E": open_time, "s": symbol.upper(),
+            "k": {
+                "t": open_time, "T": open_time + MS_PER_MINUTE - 1, "s": symbol.upper(), "i": "1m",
+                "o": "100.0", "c": close, "h": "101.0", "l": "99.0", "v": "2.0", "n": 10, "x": closed,
+                "q": "201.0", "V": "1.0", "Q": "100.5"
+            }
+        }
+    })
+
+
+def make_columns(timestamps) -> KlineColumns:
+    count = len(timestamps)
+    return KlineColumns(
+        timestamp=np.array(timestamps, dtype=np.int64),
+        open=np.full(count, 100.0),
+        high=np.full(count, 101.0),
+        low=np.full(count, 99.0),
+        close=np.full(count, 100.5),
+        volume=np.full(count, 2.0),
+        quote_volume=np.full(count, 201.0),
+        trades_count=np.full(count, 10, dtype=np.int64),
+        taker_buy_volume=np.full(count, 1.0),
+        taker_buy_quote_volume=np.full(count, 100.5)
+    )
+
+
+class FakeRestClient:
+    """缺口补齐用的 REST 客户端：按请求范围返回连续的1分钟K线"""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def get_klines_range(self, symbol, interval, start_ms, end_ms):
+        self.calls.append((symbol, start_ms, end_ms))
+        return make_columns(range(start_ms, end_ms, MS_PER_MINUTE))
+
+
+@pytest.fixture
+def make_ingester(make_session):
+    """KlineStreamIngester 工厂：数据库中最新一根K线为 latest，REST 补齐请求记入 rest_calls"""
+
+    def factory(writer, latest=None, rest_calls=None, **options):
+        rest_calls = [] if rest_calls is None else rest_calls
+        return KlineStreamIngester(
+            symbols=[SymbolEnum.BTC_USDT],
+            writer=writer,
+            session_factory=lambda: make_session(latest),
+            rest_client_factory=lambda: FakeRestClient(rest_calls),
+            **options
+        )
+
+    return factory
+
+
+async def wait_until(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+# ----------------------------------------------------------------------
+# 连接与重连（本地 WebSocket 服务）
+# ----------------------------------------------------------------------
+
+def test_reconnects_after_server_close_and_skips_bad_messages(make_ingester, make_writer):
+    open_time = current_minute() - MS_PER_MINUTE
+    connections = []
+
+    async def stream(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connections.append(dict(request.query))
+        if len(connections) == 1:
+            # 第一次连接：两条无法处理的推送、一根未收盘K线，随后服务端断开
+            await ws.send_str("not json")
+            await ws.send_str('{"data": {"e": "kline", "s": "BTCUSDT"}}')
+            await ws.send_str(kline_message(open_time, closed=False, close="100.1"))
+            await ws.close()
+            return ws
+        await ws.send_str(kline_message(open_time, closed=True, close="100.2"))
+        await ws.send_str(kline_message(open_time, closed=True, symbol="dogeusdt"))
+        async for _ in ws:
+            pass
+        return ws
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/stream", stream)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        writer = make_writer()
+        ingester = make_ingester(writer, stream_url=f"http://127.0.0.1:{port}", reconnect_delay_cap=0.05)
+        task = asyncio.create_task(ingester.run())
+        try:
+            await wait_until(lambda: writer.writes)
+            status = ingester.get_status()
+        finally:
+            ingester.stop()
+            await asyncio.wait_for(task, timeout=5)
+            await runner.cleanup()
+        return ingester, writer, status
+
+    ingester, writer, status = asyncio.run(main())
+    assert len(connections) == 2
+    assert connections[0]["streams"] == "btcusdt@kline_1m"
+    assert status["connected"] and status["reconnects"] == 1
+    # 解析失败的推送只计数，不中断连接；未订阅的品种被忽略
+    assert status["messages_failed"] == 2
+    assert writer.writes == [("btc_usdt", [open_time], True)]
+    assert status["bars_written"] == 1
+    assert float(status["live_bars"]["btc_usdt"]["close_price"]) == 100.2
+    assert status["live_bars"]["btc_usdt"]["closed"] is True
+    assert not ingester.get_status()["running"]
+
+
+# ----------------------------------------------------------------------
+# 缺口补齐（直接驱动消息处理）
+# ----------------------------------------------------------------------
+
+def test_failed_write_is_filled_after_next_successful_write(make_ingester, make_writer):
+    end_ms = current_minute()
+    failed_at = end_ms - 2 * MS_PER_MINUTE
+    writer = make_writer(fail_on=[failed_at])
+    rest_calls = []
+    # 数据库中最新一根是失败K线的前一分钟
+    ingester = make_ingester(writer, latest=failed_at - MS_PER_MINUTE, rest_calls=rest_calls)
+
+    async def main():
+        await ingester._handle_message(kline_message(failed_at, closed=True))
+        assert ingester.get_status()["gap_fill_pending"] == ["btc_usdt"]
+        # 写入恢复后触发补齐，从失败前的位置重新写入
+        await ingester._handle_message(kline_message(failed_at + MS_PER_MINUTE, closed=True))
+        await asyncio.gather(*ingester._gap_fill_tasks)
+
+    asyncio.run(main())
+    assert rest_calls and rest_calls[0][:2] == ("btcusdt", failed_at)
+    assert failed_at in writer.timestamps()
+    assert ingester.get_status()["gap_fill_pending"] == []
+    assert ingester._last_closed["btc_usdt"] >= failed_at + MS_PER_MINUTE
+
+
+def test_gap_fill_only_covers_recent_minutes(make_ingester, make_writer):
+    writer = make_writer()
+    rest_calls = []
+    ingester = make_ingester(
+        writer, latest=current_minute() - 1000 * MS_PER_MINUTE, rest_calls=rest_calls, max_gap_fill_minutes=10
+    )
+
+    asyncio.run(ingester._fill_gaps())
+    (symbol, start_ms, end_ms), = rest_calls
+    assert end_ms - start_ms == 10 * MS_PER_MINUTE
+    assert writer.timestamps() == list(range(start_ms, end_ms, MS_PER_MINUTE))
+    assert ingester._last_closed["btc_usdt"] == end_ms - MS_PER_MINUTE
+
+
+def test_gap_fill_skips_empty_table(make_ingester, make_writer):
+    writer = make_writer()
+    rest_calls = []
+    ingester = make_ingester(writer, latest=None, rest_calls=rest_calls)
+
+    asyncio.run(ingester._fill_gaps())
+    assert rest_calls == [] and writer.writes == []
@@ -0,0 +1,90 @@
+"""
+MinuteBitmap 分钟覆盖位图：缺失区间、统计和边界
+"""
+import numpy as np
+
+from app.utils.kline_columnar import MS_PER_MINUTE
+from app.utils.minute_bitmap import MINUTES_PER_DAY, MS_PER_DAY, MinuteBitmap
+
+# 2024-01-01T00:00:00Z
+DAY_START = 1_704_067_200_000
+
+
+def minutes(*offsets):
+    return np.array([DAY_START + offset * MS_PER_MINUTE for offset in offsets], dtype=np.int64)
+
+
+def test_missing_ranges_merges_consecutive_minutes():
+    bitmap = MinuteBitmap()
+    bitmap.add(minutes(*range(0, 10), *range(13, 20)))
+    assert bitmap.missing_ranges(DAY_START, DAY_START + 20 * MS_PER_MINUTE) == [
+        (DAY_START + 10 * MS_PER_MINUTE, DAY_START + 13 * MS_PER_MINUTE)
+    ]
+
+
+def test_missing_ranges_at_both_ends_and_unaligned_start():
+    bitmap = MinuteBitmap()
+    bitmap.add(minutes(2, 3))
+    assert bitmap.missing_ranges(DAY_START + 30_000, DAY_START + 6 * MS_PER_MINUTE) == [
+        (DAY_START, DAY_START + 2 * MS_PER_MINUTE),
+        (DAY_START + 4 * MS_PER_MINUTE, DAY_START + 6 * MS_PER_MINUTE),
+    ]
+
+
+def test_missing_ranges_across_days():
+    bitmap = MinuteBitmap()
+    bitmap.add(minutes(*range(0, MINUTES_PER_DAY - 1)))
+    bitmap.add(minutes(*range(MINUTES_PER_DAY + 1, 2 * MINUTES_PER_DAY)))
+    assert len(bitmap) == 2
+    # 第一天最后一分钟和第二天第一分钟缺失，合并为一个跨天的区间
+    assert bitmap.missing_ranges(DAY_START, DAY_START + 2 * MS_PER_DAY) == [
+        (DAY_START + (MINUTES_PER_DAY - 1) * MS_PER_MINUTE, DAY_START + (MINUTES_PER_DAY + 1) * MS_PER_MINUTE)
+    ]
+
+
+def test_add_is_cumulative_and_order_independent():
+    bitmap = MinuteBitmap()
+    bitmap.add(minutes(5, 1, 3))
+    bitmap.add(minutes(2, 4))
+    assert bitmap.mask(DAY_START, DAY_START + 6 * MS_PER_MINUTE).tolist() == [False, True, True, True, True, True]
+
+
+def test_full_days_and_clear_days():
+    bitmap = MinuteBitmap()
+    first_day = DAY_START // MS_PER_DAY
+    bitmap.set_full_days([first_day, first_day + 1])
+    assert bitmap.missing_ranges(DAY_START, DAY_START + 2 * MS_PER_DAY) == []
+
+    bitmap.clear_days(first_day + 1)
+    assert bitmap.missing_ranges(DAY_START, DAY_START + 2 * MS_PER_DAY) == [
+        (DAY_START + MS_PER_DAY, DAY_START + 2 * MS_PER_DAY)
+    ]
+    # 整天常量被替换而不是修改，重新添加不影响其他天
+    bitmap.add(minutes(MINUTES_PER_DAY))
+    assert bitmap.mask(DAY_START, DAY_START + MS_PER_DAY).all()
+
+
+def test_bounds():
+    bitmap = MinuteBitmap()
+    assert bitmap.bounds() is None
+    bitmap.add(minutes(7, MINUTES_PER_DAY + 3))
+    assert bitmap.bounds() == (DAY_START + 7 * MS_PER_MINUTE, DAY_START + (MINUTES_PER_DAY + 4) * MS_PER_MINUTE)
+
+
+def test_summary_reports_largest_gaps_first():
+    bitmap = MinuteBitmap()
+    bitmap.add(minutes(0, 2, 3, 9))
+    summary = bitmap.summary(DAY_START, DAY_START + 10 * MS_PER_MINUTE, top=1)
+    assert summary["gap_count"] == 2
+    assert summary["missing_minutes"] == 6
+    assert summary["expected_minutes"] == 10
+    assert summary["coverage_ratio"] == 0.4
+    assert summary["largest_gaps"] == [
+        {"start": "2024-01-01T00:04:00", "end": "2024-01-01T00:09:00", "minutes": 5}
+    ]
+
+
+def test_empty_range():
+    bitmap = MinuteBitmap()
+    assert bitmap.missing_ranges(DAY_START, DAY_START) == []
+    assert bitmap.summary(DAY_START, DAY_START)["coverage_ratio"] is None